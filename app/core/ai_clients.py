@@ -0,0 +1,151 @@
+"""
+AI Clients - Long-Lived Pooled Provider Clients
+Brilliox Pro CRM v7.0
+"""
+import threading
+from typing import Optional, Dict, Any, Callable
+
+import httpx
+
+from app.core.config import settings
+
+
+def _http_client() -> httpx.AsyncClient:
+    """اتصالات HTTP مشتركة لمزود واحد: تبقى حية بين الطلبات مع مهلات محددة"""
+    return httpx.AsyncClient(
+        limits=httpx.Limits(
+            max_connections=settings.AI_POOL_SIZE,
+            max_keepalive_connections=settings.AI_POOL_SIZE,
+            keepalive_expiry=settings.AI_KEEPALIVE
+        ),
+        timeout=httpx.Timeout(settings.AI_TIMEOUT, connect=settings.AI_CONNECT_TIMEOUT)
+    )
+
+
+def _openai_client():
+    from openai import AsyncOpenAI
+    return AsyncOpenAI(
+        api_key=settings.OPENAI_API_KEY,
+        base_url=settings.OPENAI_BASE_URL,
+        max_retries=settings.AI_MAX_RETRIES,
+        http_client=_http_client()
+    )
+
+
+def _groq_client():
+    from groq import AsyncGroq
+    return AsyncGroq(
+        api_key=settings.GROQ_API_KEY,
+        max_retries=settings.AI_MAX_RETRIES,
+        http_client=_http_client()
+    )
+
+
+def _anthropic_client():
+    from anthropic import AsyncAnthropic
+    return AsyncAnthropic(
+        api_key=settings.ANTHROPIC_API_KEY,
+        max_retries=settings.AI_MAX_RETRIES,
+        http_client=_http_client()
+    )
+
+
+def _gemini_client():
+    # genai يحتفظ بعميل واحد على مستوى الوحدة؛ التهيئة مرة واحدة تكفي
+    import google.generativeai as genai
+    genai.configure(api_key=settings.GOOGLE_API_KEY)
+    return genai
+
+
+# المزود -> دالة إنشاء العميل
+_FACTORIES: Dict[str, Callable[[], Any]] = {
+    "openai": _openai_client,
+    "groq": _groq_client,
+    "anthropic": _anthropic_client,
+    "gemini": _gemini_client,
+}
+
+# المزود -> اسم إعداد مفتاح API
+_API_KEYS: Dict[str, str] = {
+    "openai": "OPENAI_API_KEY",
+    "groq": "GROQ_API_KEY",
+    "anthropic": "ANTHROPIC_API_KEY",
+    "gemini": "GOOGLE_API_KEY",
+}
+
+
+class AIClients:
+    """
+    عملاء مزودي الذكاء الاصطناعي غير المتزامنين
+
+    كل عميل يُنشأ عند أول استخدام ويُعاد استخدامه لكل الطلبات، فلا تُعاد
+    مصافحة TLS ولا يُفتح مجمع اتصالات جديد مع كل رسالة. الاستدعاءات لا
+    تحجز حلقة الأحداث، فتتزامن محادثات كثيرة في نفس العامل. تُغلق عند
+    إيقاف التطبيق بـ aclose.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._clients: Dict[str, Any] = {}
+        self._models: Dict[tuple, Any] = {}
+
+    def get(self, provider: str) -> Optional[Any]:
+        """عميل المزود (None إن لم يُضبط مفتاحه أو تعذر إنشاؤه)"""
+        client = self._clients.get(provider)
+        if client is not None:
+            return client
+        if not getattr(settings, _API_KEYS[provider]):
+            return None
+        with self._lock:
+            client = self._clients.get(provider)
+            if client is None:
+                try:
+                    client = self._clients[provider] = _FACTORIES[provider]()
+                except Exception as e:
+                    print(f"Error creating {provider} client: {e}")
+                    return None
+            return client
+
+    def gemini_model(self, system_prompt: str) -> Optional[Any]:
+        """نموذج Gemini لكل تعليمات نظام (يُنشأ مرة واحدة)"""
+        key = (settings.GOOGLE_MODEL, system_prompt)
+        model = self._models.get(key)
+        if model is None:
+            genai = self.get("gemini")
+            if genai is None:
+                return None
+            if len(self._models) >= 32:
+                # تعليمات نظام مخصصة كثيرة: البدء من جديد بدلاً من النمو بلا حد
+                self._models.clear()
+            model = self._models[key] = genai.GenerativeModel(
+                model_name=settings.GOOGLE_MODEL,
+                system_instruction=system_prompt
+            )
+        return model
+
+    async def aclose(self):
+        """إغلاق اتصالات جميع المزودين"""
+        with self._lock:
+            clients = self._clients
+            self._clients = {}
+            self._models = {}
+        for provider, client in clients.items():
+            close = getattr(client, "close", None)
+            if close is None:
+                continue
+            try:
+                await close()
+            except Exception as e:
+                print(f"Error closing {provider} client: {e}")
+
+    def stats(self) -> Dict[str, Any]:
+        return {"clients": sorted(self._clients), "models": len(self._models)}
+
+
+# عملاء المزودين المشتركون
+ai_clients = AIClients()
+
+
+async def close_ai_clients():
+    """إغلاق عملاء المزودين عند إيقاف التطبيق"""
+    await ai_clients.aclose()
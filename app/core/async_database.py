@@ -0,0 +1,441 @@
+"""
+Async Database Operations - Non-blocking Data Access
+Brilliox Pro CRM v7.0
+"""
+import asyncio
+from datetime import datetime
+from typing import Optional, Dict, Any, List
+
+import httpx
+
+from app.core.config import settings
+from app.core import database
+from app.core.cache import entity_cache
+from app.core.unit_of_work import UnitOfWork, UnitOfWorkError, current_unit
+from app.core.database import (
+    DatabaseOperations, select_columns, cursor_filter, project, fold_lead_stats, supabase_breaker
+)
+
+try:
+    import h2  # noqa: F401
+    _HTTP2_AVAILABLE = True
+except ImportError:
+    _HTTP2_AVAILABLE = False
+
+
+class AsyncSupabaseClient:
+    """
+    عميل PostgREST غير متزامن لـ Supabase
+
+    يستخدم اتصالاً واحداً مشتركاً (HTTP/2 عند توفر h2) مع إبقاء الاتصالات
+    حية بين الطلبات بدلاً من فتح اتصال جديد لكل استعلام.
+    """
+
+    def __init__(self, url: str, key: str):
+        self._client = httpx.AsyncClient(
+            base_url=f"{url.rstrip('/')}/rest/v1",
+            headers={
+                "apikey": key,
+                "Authorization": f"Bearer {key}",
+                "Content-Type": "application/json",
+            },
+            http2=_HTTP2_AVAILABLE,
+            limits=httpx.Limits(
+                max_connections=settings.SUPABASE_POOL_SIZE,
+                max_keepalive_connections=settings.SUPABASE_POOL_SIZE,
+                keepalive_expiry=settings.SUPABASE_KEEPALIVE
+            ),
+            timeout=httpx.Timeout(settings.SUPABASE_TIMEOUT)
+        )
+
+    @staticmethod
+    def _condition(value: Any) -> str:
+        """شرط PostgREST لقيمة واحدة (None يطابق NULL لا النص "None")"""
+        if value is None:
+            return "is.null"
+        if isinstance(value, bool):
+            return f"eq.{str(value).lower()}"
+        return f"eq.{value}"
+
+    @staticmethod
+    def _filters(filters: Optional[Dict[str, Any]]) -> Dict[str, str]:
+        """تحويل شروط المساواة إلى صيغة PostgREST"""
+        return {field: AsyncSupabaseClient._condition(value) for field, value in (filters or {}).items()}
+
+    async def _request(self, method: str, path: str, **kwargs) -> Any:
+        """تنفيذ طلب مع تسجيل نتيجته في قاطع الدائرة"""
+        with supabase_breaker:
+            response = await self._client.request(method, path, **kwargs)
+            response.raise_for_status()
+            return response.json()
+
+    async def select(self, table: str, filters: Optional[Dict[str, Any]] = None,
+                     columns: str = "*", or_filter: Optional[str] = None,
+                     order: Optional[str] = None, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        """استعلام صفوف"""
+        params = {"select": columns, **self._filters(filters)}
+        if or_filter:
+            params["or"] = f"({or_filter})"
+        if order:
+            params["order"] = order
+        if limit:
+            params["limit"] = str(limit)
+        return await self._request("GET", f"/{table}", params=params)
+
+    async def insert(self, table: str, rows: Any) -> List[Dict[str, Any]]:
+        """إدراج صف أو عدة صفوف"""
+        return await self._request(
+            "POST", f"/{table}", json=rows, headers={"Prefer": "return=representation"}
+        )
+
+    async def update(self, table: str, values: Dict[str, Any],
+                     filters: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """تحديث صفوف"""
+        return await self._request(
+            "PATCH", f"/{table}", json=values, params=self._filters(filters),
+            headers={"Prefer": "return=representation"}
+        )
+
+    async def delete(self, table: str, filters: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """حذف صفوف"""
+        return await self._request(
+            "DELETE", f"/{table}", params=self._filters(filters),
+            headers={"Prefer": "return=representation"}
+        )
+
+    async def rpc(self, function: str, params: Dict[str, Any]) -> Any:
+        """استدعاء دالة قاعدة بيانات"""
+        return await self._request("POST", f"/rpc/{function}", json=params)
+
+    async def aclose(self):
+        """إغلاق الاتصالات"""
+        await self._client.aclose()
+
+
+# عميل Supabase غير المتزامن
+_async_client: Optional[AsyncSupabaseClient] = None
+
+
+def get_async_supabase_client() -> Optional[AsyncSupabaseClient]:
+    """الحصول على عميل Supabase غير المتزامن"""
+    global _async_client
+    if settings.STORAGE_BACKEND == "postgres":
+        return None
+    if _async_client is None:
+        if settings.SUPABASE_FAKE:
+            from app.core.fake_supabase import FakeAsyncSupabaseClient, get_fake_backend
+            _async_client = FakeAsyncSupabaseClient(get_fake_backend())
+        elif settings.SUPABASE_URL and settings.SUPABASE_KEY:
+            try:
+                _async_client = AsyncSupabaseClient(settings.SUPABASE_URL, settings.SUPABASE_KEY)
+            except Exception as e:
+                print(f"Error creating async Supabase client: {e}")
+    # الدائرة مفتوحة: لا طلبات حتى انتهاء مهلة الاسترداد
+    if _async_client is None or not supabase_breaker.allow():
+        return None
+    return _async_client
+
+
+async def close_async_db():
+    """إغلاق عميل Supabase غير المتزامن عند إيقاف التطبيق"""
+    global _async_client
+    if _async_client is not None:
+        await _async_client.aclose()
+        _async_client = None
+
+
+async def _local(method: str, *args, **kwargs):
+    """تنفيذ عملية على التخزين المحلي خارج حلقة الأحداث"""
+    return await asyncio.to_thread(getattr(database.local_storage, method), *args, **kwargs)
+
+
+class AsyncDatabaseOperations:
+    """عمليات قاعدة البيانات الموحدة (غير متزامنة)"""
+
+    @staticmethod
+    async def get_user(username: str) -> Optional[Dict[str, Any]]:
+        """الحصول على المستخدم (عبر سياق الطلب ثم الذاكرة المؤقتة)"""
+        return await AsyncDatabaseOperations._load(
+            ('user', username), lambda: AsyncDatabaseOperations._fetch_user(username)
+        )
+
+    @staticmethod
+    async def get_user_for_update(username: str) -> Optional[Dict[str, Any]]:
+        """قراءة المستخدم من قاعدة البيانات مباشرة قبل تعديل الرصيد (مثل النسخة المتزامنة)"""
+        key = ('user', username)
+        version = entity_cache.version()
+        user = await AsyncDatabaseOperations._fetch_user(username)
+        entity_cache.set(key, user, version=version)
+        unit = current_unit()
+        return unit.refresh(key, user) if unit else user
+
+    @staticmethod
+    async def _load(key: tuple, loader) -> Any:
+        """قراءة كيان مرة واحدة لكل طلب (identity map) وعبر الذاكرة المؤقتة"""
+        def read():
+            return entity_cache.read_through_async(key, loader)
+
+        unit = current_unit()
+        return await (unit.load_async(key, read) if unit else read())
+
+    @staticmethod
+    async def _fetch_user(username: str) -> Optional[Dict[str, Any]]:
+        """قراءة المستخدم من قاعدة البيانات"""
+        client = get_async_supabase_client()
+        if client:
+            try:
+                rows = await client.select('users', {'username': username})
+                return rows[0] if rows else None
+            except Exception as e:
+                print(f"Error getting user: {e}")
+
+        return await _local('get', 'users', username)
+
+    @staticmethod
+    async def create_user(username: str, data: Dict[str, Any]) -> Dict[str, Any]:
+        """إنشاء مستخدم جديد"""
+        user_data = DatabaseOperations._build_user(username, data)
+
+        client = get_async_supabase_client()
+        if client:
+            try:
+                rows = await client.insert('users', user_data)
+                DatabaseOperations._user_created(username, rows[0])
+                return rows[0]
+            except Exception as e:
+                print(f"Error creating user: {e}")
+
+        await _local('insert', 'users', username, user_data)
+        DatabaseOperations._user_created(username, user_data)
+        return user_data
+
+    @staticmethod
+    async def update_user(username: str, data: Dict[str, Any]) -> bool:
+        """تحديث المستخدم (يُؤجل إلى نهاية الطلب إن كان محمّلاً في سياقه)"""
+        unit = current_unit()
+        if unit:
+            if unit.defer(('user', username), data):
+                return True
+            data = unit.write_through(('user', username), data)
+
+        updated = None
+        client = get_async_supabase_client()
+        if client:
+            try:
+                updated = bool(await client.update('users', data, {'username': username}))
+            except Exception as e:
+                print(f"Error updating user: {e}")
+
+        if updated is None:
+            updated = await _local('update', 'users', username, data)
+        if unit and not updated:
+            unit.forget(('user', username))
+        DatabaseOperations._user_written(username, data, updated)
+        return updated
+
+    @staticmethod
+    async def add_lead(user_id: str, lead_data: Dict[str, Any]) -> str:
+        """إضافة عميل محتمل"""
+        lead_id = DatabaseOperations._prepare_lead(user_id, lead_data)
+        added_id = None
+
+        client = get_async_supabase_client()
+        if client:
+            try:
+                rows = await client.insert('leads', lead_data)
+                added_id = rows[0].get('id', lead_id)
+            except Exception as e:
+                print(f"Error adding lead: {e}")
+
+        if added_id is None:
+            await _local('insert', 'leads', lead_id, lead_data)
+            added_id = lead_id
+        entity_cache.invalidate(('leads', user_id))
+        return added_id
+
+    @staticmethod
+    async def add_leads_bulk(user_id: str, leads: List[Dict[str, Any]],
+                             chunk_size: int = settings.BULK_INSERT_CHUNK_SIZE) -> List[str]:
+        """إضافة مجموعة عملاء دفعة واحدة"""
+        now = datetime.now().isoformat()
+        for lead_data in leads:
+            DatabaseOperations._prepare_lead(user_id, lead_data, now)
+
+        lead_ids = []
+        remaining = leads
+
+        client = get_async_supabase_client()
+        if client:
+            try:
+                while remaining:
+                    chunk = remaining[:chunk_size]
+                    rows = await client.insert('leads', chunk)
+                    lead_ids.extend(row.get('id') for row in rows)
+                    remaining = remaining[chunk_size:]
+            except Exception as e:
+                print(f"Error adding leads in bulk: {e}")
+
+        if remaining:
+            lead_ids.extend(await _local(
+                'insert_many', 'leads', {lead['id']: lead for lead in remaining}
+            ))
+        entity_cache.invalidate(('leads', user_id))
+        return lead_ids
+
+    @staticmethod
+    async def get_leads(user_id: str, status: Optional[str] = None, source: Optional[str] = None,
+                        after: Optional[tuple] = None, limit: Optional[int] = None,
+                        fields: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+        """الحصول على عملاء المستخدم (نفس خيارات DatabaseOperations.get_leads)"""
+        return await entity_cache.read_through_async(
+            DatabaseOperations._leads_cache_key(user_id, status, source, after, limit, fields),
+            lambda: AsyncDatabaseOperations._fetch_leads(user_id, status, source, after, limit, fields),
+            DatabaseOperations._leads_tags(user_id)
+        )
+
+    @staticmethod
+    async def _fetch_leads(user_id: str, status: Optional[str], source: Optional[str],
+                           after: Optional[tuple], limit: Optional[int],
+                           fields: Optional[List[str]]) -> List[Dict[str, Any]]:
+        """قراءة عملاء المستخدم من قاعدة البيانات"""
+        filters = DatabaseOperations._lead_filters(user_id, status, source)
+        paginate = after is not None or limit is not None
+
+        client = get_async_supabase_client()
+        if client:
+            try:
+                return await client.select(
+                    'leads', filters,
+                    columns=select_columns(fields),
+                    or_filter=cursor_filter(after) if after else None,
+                    order='created_at.asc,id.asc' if paginate else None,
+                    limit=limit
+                )
+            except Exception as e:
+                print(f"Error getting leads: {e}")
+
+        if paginate:
+            rows = await _local('query_page', 'leads', filters, after=after, limit=limit)
+        else:
+            rows = await _local('query', 'leads', **filters)
+        return project(rows, fields)
+
+    @staticmethod
+    async def get_lead_stats(user_id: Optional[str] = None) -> Dict[str, Any]:
+        """إحصائيات العملاء محسوبة داخل قاعدة البيانات"""
+        client = get_async_supabase_client()
+        if client:
+            try:
+                return fold_lead_stats(await client.rpc('lead_stats', {'p_user_id': user_id}))
+            except Exception as e:
+                print(f"Error getting lead stats: {e}")
+
+            # المحاولة الثانية فقط إن لم تُفتح الدائرة بالأولى
+            if supabase_breaker.allow():
+                try:
+                    filters = {'user_id': user_id} if user_id else None
+                    rows = await client.select('leads', filters, columns='status,source,score')
+                    return fold_lead_stats([dict(row, count=1, score_sum=row.get('score')) for row in rows])
+                except Exception as e:
+                    print(f"Error getting lead stats: {e}")
+
+        filters = {'user_id': user_id} if user_id else None
+        return fold_lead_stats(
+            await _local('group_count', 'leads', ('status', 'source'), filters, sum_field='score')
+        )
+
+    @staticmethod
+    async def get_all_leads() -> List[Dict[str, Any]]:
+        """الحصول على جميع العملاء"""
+        client = get_async_supabase_client()
+        if client:
+            try:
+                return await client.select('leads')
+            except Exception as e:
+                print(f"Error getting all leads: {e}")
+
+        return await _local('get_all', 'leads')
+
+    @staticmethod
+    async def get_lead_by_id(lead_id: str) -> Optional[Dict[str, Any]]:
+        """الحصول على عميل بالمعرف (عبر سياق الطلب ثم الذاكرة المؤقتة)"""
+        return await AsyncDatabaseOperations._load(
+            ('lead', lead_id), lambda: AsyncDatabaseOperations._fetch_lead(lead_id)
+        )
+
+    @staticmethod
+    async def _fetch_lead(lead_id: str) -> Optional[Dict[str, Any]]:
+        """قراءة عميل من قاعدة البيانات"""
+        client = get_async_supabase_client()
+        if client:
+            try:
+                rows = await client.select('leads', {'id': lead_id})
+                return rows[0] if rows else None
+            except Exception as e:
+                print(f"Error getting lead: {e}")
+
+        return await _local('get', 'leads', lead_id)
+
+    @staticmethod
+    async def update_lead(lead_id: str, updates: Dict[str, Any]) -> bool:
+        """تحديث بيانات عميل (يُؤجل إلى نهاية الطلب إن كان محمّلاً في سياقه)"""
+        unit = current_unit()
+        if unit:
+            if unit.defer(('lead', lead_id), updates):
+                return True
+            updates = unit.write_through(('lead', lead_id), updates)
+
+        updated = None
+        client = get_async_supabase_client()
+        if client:
+            try:
+                updated = bool(await client.update('leads', updates, {'id': lead_id}))
+            except Exception as e:
+                print(f"Error updating lead: {e}")
+
+        if updated is None:
+            updated = await _local('update', 'leads', lead_id, updates)
+        if unit and not updated:
+            unit.forget(('lead', lead_id))
+        DatabaseOperations._lead_written(lead_id, updates if updated else None)
+        return updated
+
+    @staticmethod
+    async def delete_lead(lead_id: str) -> bool:
+        """حذف عميل"""
+        unit = current_unit()
+        if unit:
+            unit.discard(('lead', lead_id))
+
+        deleted = None
+        client = get_async_supabase_client()
+        if client:
+            try:
+                deleted = bool(await client.delete('leads', {'id': lead_id}))
+            except Exception as e:
+                print(f"Error deleting lead: {e}")
+
+        if deleted is None:
+            deleted = await _local('delete', 'leads', lead_id)
+        DatabaseOperations._lead_written(lead_id)
+        return deleted
+
+    @staticmethod
+    async def flush_unit(unit: UnitOfWork):
+        """
+        كتابة التحديثات المؤجلة في سياق الطلب (تحديث واحد لكل كيان)
+
+        Raises:
+            UnitOfWorkError: إن لم يُكتب أي من التحديثات
+        """
+        failed = []
+        for (kind, key), changes in unit.take_pending().items():
+            update = AsyncDatabaseOperations.update_user if kind == 'user' else AsyncDatabaseOperations.update_lead
+            try:
+                if not await update(key, changes):
+                    failed.append(f"{kind}:{key}")
+            except Exception as e:
+                print(f"Error flushing {kind} {key}: {e}")
+                failed.append(f"{kind}:{key}")
+        if failed:
+            raise UnitOfWorkError(f"Deferred writes failed: {', '.join(failed)}")
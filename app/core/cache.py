@@ -0,0 +1,173 @@
+"""
+Entity Cache - Read-Through LRU Cache for Users and Leads
+Brilliox Pro CRM v7.0
+"""
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional, Dict, Any, Hashable, Iterable
+
+from app.core.config import settings
+
+
+# قيمة تدل على عدم وجود العنصر في الذاكرة المؤقتة (None قيمة صالحة للتخزين)
+MISSING = object()
+
+
+def _copy(value: Any) -> Any:
+    """نسخة سطحية حتى لا يعدّل المستدعي العنصر المخزن"""
+    if isinstance(value, dict):
+        return dict(value)
+    if isinstance(value, list):
+        return [dict(item) if isinstance(item, dict) else item for item in value]
+    return value
+
+
+class EntityCache:
+    """
+    ذاكرة مؤقتة LRU محدودة الحجم مع مدة صلاحية لكل عنصر
+
+    كل عنصر يمكن ربطه بوسوم (tags) لإخلاء مجموعة عناصر دفعة واحدة، مثل
+    جميع قوائم عملاء مستخدم معين عند إضافة عميل له.
+    """
+
+    def __init__(self, max_size: int = settings.ENTITY_CACHE_SIZE,
+                 ttl: float = settings.ENTITY_CACHE_TTL):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._items: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._tags: Dict[Hashable, set] = {}
+        # يزداد مع كل كتابة، لرفض تخزين قراءة بدأت قبل كتابة متزامنة
+        self._version = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @property
+    def enabled(self) -> bool:
+        """التخزين معطل عند ضبط الحجم أو المدة على صفر"""
+        return self.max_size > 0 and self.ttl > 0
+
+    def version(self) -> int:
+        """رقم الإصدار الحالي (يُمرر إلى set بعد القراءة من قاعدة البيانات)"""
+        return self._version
+
+    def get(self, key: Hashable) -> Any:
+        """الحصول على عنصر أو MISSING"""
+        with self._lock:
+            entry = self._items.get(key)
+            if entry is None or entry[1] < time.monotonic():
+                if entry is not None:
+                    self._remove(key)
+                self.misses += 1
+                return MISSING
+            self._items.move_to_end(key)
+            self.hits += 1
+            return _copy(entry[0])
+
+    def peek(self, key: Hashable) -> Any:
+        """قراءة عنصر دون تغيير العدادات أو ترتيب LRU"""
+        with self._lock:
+            entry = self._items.get(key)
+            return _copy(entry[0]) if entry is not None else MISSING
+
+    def set(self, key: Hashable, value: Any, tags: Iterable[Hashable] = (),
+            version: Optional[int] = None):
+        """
+        تخزين عنصر
+
+        Args:
+            key: المفتاح
+            value: القيمة
+            tags: وسوم لإخلاء العنصر مع مجموعته
+            version: إصدار الذاكرة قبل القراءة - يُتجاهل التخزين إن حدثت كتابة بعده
+        """
+        if not self.enabled:
+            return
+        with self._lock:
+            if version is not None and version != self._version:
+                return
+            if key in self._items:
+                self._remove(key)
+            self._items[key] = (_copy(value), time.monotonic() + self.ttl, tuple(tags))
+            for tag in tags:
+                self._tags.setdefault(tag, set()).add(key)
+
+            while len(self._items) > self.max_size:
+                oldest = next(iter(self._items))
+                self._remove(oldest)
+                self.evictions += 1
+
+    def read_through(self, key: Hashable, loader, tags: Iterable[Hashable] = ()) -> Any:
+        """قراءة من الذاكرة المؤقتة أو تحميل العنصر وتخزينه"""
+        value = self.get(key)
+        if value is MISSING:
+            version = self.version()
+            value = loader()
+            self.set(key, value, tags, version)
+        return value
+
+    async def read_through_async(self, key: Hashable, loader, tags: Iterable[Hashable] = ()) -> Any:
+        """نفس read_through مع دالة تحميل غير متزامنة"""
+        value = self.get(key)
+        if value is MISSING:
+            version = self.version()
+            value = await loader()
+            self.set(key, value, tags, version)
+        return value
+
+    def merge(self, key: Hashable, data: Dict[str, Any]):
+        """دمج تحديث جزئي في عنصر مخزن (إن وجد)"""
+        with self._lock:
+            self._version += 1
+            entry = self._items.get(key)
+            if entry is not None and isinstance(entry[0], dict):
+                self._items[key] = ({**entry[0], **data}, entry[1], entry[2])
+
+    def evict(self, key: Hashable):
+        """إخلاء عنصر"""
+        with self._lock:
+            self._version += 1
+            if key in self._items:
+                self._remove(key)
+
+    def invalidate(self, tag: Hashable):
+        """إخلاء جميع العناصر المرتبطة بوسم"""
+        with self._lock:
+            self._version += 1
+            for key in list(self._tags.get(tag, ())):
+                self._remove(key)
+
+    def clear(self):
+        """إفراغ الذاكرة المؤقتة"""
+        with self._lock:
+            self._version += 1
+            self._items.clear()
+            self._tags.clear()
+
+    def _remove(self, key: Hashable):
+        """حذف عنصر ووسومه (يُستدعى تحت القفل)"""
+        _, _, tags = self._items.pop(key)
+        for tag in tags:
+            keys = self._tags.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._tags[tag]
+
+    def stats(self) -> Dict[str, Any]:
+        """إحصائيات الذاكرة المؤقتة"""
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._items),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": round(self.hits / lookups * 100, 2) if lookups else 0.0
+        }
+
+
+# الذاكرة المؤقتة للمستخدمين والعملاء
+entity_cache = EntityCache()
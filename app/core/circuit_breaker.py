@@ -0,0 +1,108 @@
+"""
+Circuit Breaker - Fast Failure for Remote Services
+Brilliox Pro CRM v7.0
+"""
+import threading
+import time
+from typing import Optional, Dict, Any, Callable
+
+
+class CircuitBreaker:
+    """
+    قاطع دائرة لخدمة خارجية
+
+    الحالات:
+        closed: الطلبات تمر، والأخطاء المتتالية تُعد
+        open: بعد failure_threshold خطأ متتالٍ تُرفض الطلبات فوراً
+        half_open: بعد recovery_timeout يُسمح بطلب تجريبي واحد؛
+                   نجاحه يغلق الدائرة وفشله يعيد فتحها
+
+    الاستخدام:
+        if breaker.allow():
+            with breaker:
+                call_remote()
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, name: str, failure_threshold: int = 5, recovery_timeout: float = 30.0,
+                 is_failure: Optional[Callable[[BaseException], bool]] = None):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        # الأخطاء التي تدل على تعطل الخدمة (وليس خطأ في الطلب نفسه)
+        self.is_failure = is_failure or (lambda exc: True)
+
+        self._lock = threading.Lock()
+        self._state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probe_started: Optional[float] = None
+        self.total_failures = 0
+        self.rejected = 0
+
+    @property
+    def state(self) -> str:
+        """الحالة الحالية (مع الانتقال إلى half_open عند انتهاء المهلة)"""
+        with self._lock:
+            if self._state == self.OPEN and time.monotonic() - self._opened_at >= self.recovery_timeout:
+                self._state = self.HALF_OPEN
+                self._probe_started = None
+            return self._state
+
+    def allow(self) -> bool:
+        """هل يُسمح بطلب الآن؟ (في half_open يُسمح بطلب تجريبي واحد)"""
+        state = self.state
+        with self._lock:
+            if state == self.CLOSED:
+                return True
+            now = time.monotonic()
+            if state == self.HALF_OPEN:
+                # طلب تجريبي واحد؛ يُستبدل إن لم يُسجل نتيجته خلال المهلة
+                if self._probe_started is None or now - self._probe_started >= self.recovery_timeout:
+                    self._probe_started = now
+                    return True
+            self.rejected += 1
+            return False
+
+    def record_success(self):
+        """تسجيل طلب ناجح"""
+        with self._lock:
+            self._state = self.CLOSED
+            self._failures = 0
+            self._probe_started = None
+
+    def record_failure(self):
+        """تسجيل طلب فاشل"""
+        with self._lock:
+            self._failures += 1
+            self.total_failures += 1
+            if self._state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+                self._state = self.OPEN
+                self._opened_at = time.monotonic()
+                self._probe_started = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc is None:
+            self.record_success()
+        elif self.is_failure(exc):
+            self.record_failure()
+        else:
+            # الخدمة ردّت بخطأ في الطلب: الاتصال سليم
+            self.record_success()
+        return False
+
+    def stats(self) -> Dict[str, Any]:
+        """حالة القاطع"""
+        return {
+            "name": self.name,
+            "state": self.state,
+            "consecutive_failures": self._failures,
+            "total_failures": self.total_failures,
+            "rejected": self.rejected
+        }
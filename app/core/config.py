@@ -34,10 +34,34 @@ class Settings:
     DATABASE_URL: Optional[str] = os.getenv("DATABASE_URL")
     DB_TYPE: str = "postgres" if os.getenv("DATABASE_URL") else "local"
 
+    # Storage Backend Configuration: json | sqlite | postgres (postgres connects directly via DATABASE_URL)
+    STORAGE_BACKEND: str = os.getenv("STORAGE_BACKEND", "json").lower()
+    LOCAL_STORAGE_COMPACT_EVERY: int = int(os.getenv("LOCAL_STORAGE_COMPACT_EVERY", "1000"))
+    LOCAL_STORAGE_FLUSH_MS: int = int(os.getenv("LOCAL_STORAGE_FLUSH_MS", "50"))
+    LOCAL_STORAGE_BATCH_SIZE: int = int(os.getenv("LOCAL_STORAGE_BATCH_SIZE", "256"))
+    SQLITE_PATH: str = os.getenv("SQLITE_PATH", "data/brilliox.db")
+    POSTGRES_POOL_MIN: int = int(os.getenv("POSTGRES_POOL_MIN", "1"))
+    POSTGRES_POOL_MAX: int = int(os.getenv("POSTGRES_POOL_MAX", "10"))
+    POSTGRES_CONNECT_TIMEOUT: int = int(os.getenv("POSTGRES_CONNECT_TIMEOUT", "5"))
+    BULK_INSERT_CHUNK_SIZE: int = int(os.getenv("BULK_INSERT_CHUNK_SIZE", "500"))
+    LEADS_PAGE_SIZE: int = int(os.getenv("LEADS_PAGE_SIZE", "100"))
+    LEADS_MAX_PAGE_SIZE: int = int(os.getenv("LEADS_MAX_PAGE_SIZE", "1000"))
+
     # Supabase Configuration
     SUPABASE_URL: Optional[str] = os.getenv("SUPABASE_URL")
     SUPABASE_KEY: Optional[str] = os.getenv("SUPABASE_KEY")
     SUPABASE_SERVICE_KEY: Optional[str] = os.getenv("SUPABASE_SERVICE_KEY")
+    SUPABASE_POOL_SIZE: int = int(os.getenv("SUPABASE_POOL_SIZE", "20"))
+    SUPABASE_KEEPALIVE: float = float(os.getenv("SUPABASE_KEEPALIVE", "30"))
+    SUPABASE_TIMEOUT: float = float(os.getenv("SUPABASE_TIMEOUT", "10"))
+    SUPABASE_BREAKER_THRESHOLD: int = int(os.getenv("SUPABASE_BREAKER_THRESHOLD", "5"))
+    SUPABASE_BREAKER_RESET: float = float(os.getenv("SUPABASE_BREAKER_RESET", "30"))
+    # In-process PostgREST stand-in for offline benchmarks (app/core/fake_supabase.py)
+    SUPABASE_FAKE: bool = os.getenv("SUPABASE_FAKE", "false").lower() == "true"
+    SUPABASE_FAKE_LATENCY_MS: float = float(os.getenv("SUPABASE_FAKE_LATENCY_MS", "0"))
+    SUPABASE_FAKE_JITTER_MS: float = float(os.getenv("SUPABASE_FAKE_JITTER_MS", "0"))
+    SUPABASE_FAKE_ERROR_RATE: float = float(os.getenv("SUPABASE_FAKE_ERROR_RATE", "0"))
+    SUPABASE_FAKE_SEED: Optional[int] = int(os.environ["SUPABASE_FAKE_SEED"]) if os.getenv("SUPABASE_FAKE_SEED") else None
 
     # AI APIs Configuration
     OPENAI_API_KEY: Optional[str] = os.getenv("OPENAI_API_KEY")
@@ -53,6 +77,22 @@ class Settings:
     GROQ_API_KEY: Optional[str] = os.getenv("GROQ_API_KEY")
     GROQ_MODEL: str = os.getenv("GROQ_MODEL", "llama-3.3-70b-versatile")
 
+    # Provider clients are created once and reused (app/core/ai_clients.py)
+    AI_POOL_SIZE: int = int(os.getenv("AI_POOL_SIZE", "20"))
+    AI_KEEPALIVE: float = float(os.getenv("AI_KEEPALIVE", "60"))
+    AI_TIMEOUT: float = float(os.getenv("AI_TIMEOUT", "30"))
+    AI_CONNECT_TIMEOUT: float = float(os.getenv("AI_CONNECT_TIMEOUT", "5"))
+    AI_MAX_RETRIES: int = int(os.getenv("AI_MAX_RETRIES", "1"))
+    # Hedged fallback: start the next provider once the current one exceeds its p95
+    AI_HEDGING: bool = os.getenv("AI_HEDGING", "false").lower() == "true"
+    AI_HEDGE_DELAY: float = float(os.getenv("AI_HEDGE_DELAY", "3"))
+    AI_HEDGE_MIN_SAMPLES: int = int(os.getenv("AI_HEDGE_MIN_SAMPLES", "20"))
+    AI_LATENCY_WINDOW: int = int(os.getenv("AI_LATENCY_WINDOW", "200"))
+    AI_DEADLINE: float = float(os.getenv("AI_DEADLINE", "60"))
+    # Similar earlier Q&A of the same user added to the chat message. Opt-in: >0 stores
+    # chat prompts and answers in the pattern store (0 = disabled, nothing is stored)
+    AI_PATTERN_CONTEXT: int = int(os.getenv("AI_PATTERN_CONTEXT", "0"))
+
     # Search APIs
     SERPER_API_KEY: Optional[str] = None
     SERPER_KEYS: List[str] = field(default_factory=list)
@@ -91,8 +131,30 @@ class Settings:
 
     # Cache Configuration
     CACHE_TTL: int = int(os.getenv("CACHE_TTL", "3600"))
+    ENTITY_CACHE_SIZE: int = int(os.getenv("ENTITY_CACHE_SIZE", "10000"))
+    ENTITY_CACHE_TTL: float = float(os.getenv("ENTITY_CACHE_TTL", "30"))
     REDIS_URL: Optional[str] = os.getenv("REDIS_URL")
 
+    # Event System Configuration
+    SYSTEM_DATA_FLUSH_SECONDS: float = float(os.getenv("SYSTEM_DATA_FLUSH_SECONDS", "2"))
+    EVENT_DISPATCH_MODE: str = os.getenv("EVENT_DISPATCH_MODE", "async")  # async, sync
+    EVENT_QUEUE_SIZE: int = int(os.getenv("EVENT_QUEUE_SIZE", "10000"))
+    EVENT_WORKERS: int = int(os.getenv("EVENT_WORKERS", "4"))
+    EVENT_QUEUE_POLICY: str = os.getenv("EVENT_QUEUE_POLICY", "drop_oldest")  # block, drop_oldest, reject
+    EVENT_LISTENER_TIMEOUT: float = float(os.getenv("EVENT_LISTENER_TIMEOUT", "5"))
+    EVENT_BLOCK_TIMEOUT: float = float(os.getenv("EVENT_BLOCK_TIMEOUT", "1"))
+    EVENT_HISTORY_SIZE: int = int(os.getenv("EVENT_HISTORY_SIZE", "1000"))
+    EVENT_LOG_DIR: str = os.getenv("EVENT_LOG_DIR", "data/events")
+    EVENT_LOG_SEGMENT_BYTES: int = int(os.getenv("EVENT_LOG_SEGMENT_BYTES", str(8 * 1024 * 1024)))
+    EVENT_LOG_SEGMENT_SECONDS: float = float(os.getenv("EVENT_LOG_SEGMENT_SECONDS", "3600"))
+    EVENT_LOG_INDEX_EVERY: int = int(os.getenv("EVENT_LOG_INDEX_EVERY", "64"))
+    EVENT_LOG_RETENTION_DAYS: float = float(os.getenv("EVENT_LOG_RETENTION_DAYS", "30"))
+    EVENT_TRANSPORT: str = os.getenv("EVENT_TRANSPORT", "none")  # none, memory, redis
+    EVENT_CHANNEL: str = os.getenv("EVENT_CHANNEL", "brilliox:events")
+    EVENT_TRANSPORT_QUEUE: int = int(os.getenv("EVENT_TRANSPORT_QUEUE", "10000"))
+    EVENT_DEDUP_SIZE: int = int(os.getenv("EVENT_DEDUP_SIZE", "10000"))
+    PATTERN_STORE_SIZE: int = int(os.getenv("PATTERN_STORE_SIZE", "500"))
+
     # Language Configuration
     DEFAULT_LANGUAGE: str = "ar"
     SUPPORTED_LANGUAGES: List[str] = field(default_factory=lambda: ["ar", "en"])
@@ -3,14 +3,27 @@ Database Configuration and Connection Management
 Brilliox Pro CRM v7.0
 """
 import os
-from typing import Optional, Dict, Any, List
+import re
+import atexit
+import bisect
+import threading
+from concurrent.futures import Future
+from typing import Optional, Dict, Any, List, Callable
 from contextlib import contextmanager
 from datetime import datetime
 import json
 
 from app.core.config import settings
+from app.core.cache import entity_cache
+from app.core.unit_of_work import UnitOfWork, UnitOfWorkError, current_unit
+from app.core.circuit_breaker import CircuitBreaker
 from supabase import create_client, Client
 
+try:
+    import fcntl
+except ImportError:  # بدون أقفال ملفات (ويندوز): عملية واحدة تستخدم التخزين
+    fcntl = None
+
 
 # نوع قاعدة البيانات
 DB_TYPE = "postgres" if settings.DATABASE_URL else "local"
@@ -19,11 +32,40 @@ DB_TYPE = "postgres" if settings.DATABASE_URL else "local"
 _supabase_client: Optional[Client] = None
 
 
-def get_supabase_client() -> Optional[Client]:
-    """الحصول على عميل Supabase"""
+def _is_outage(exc: BaseException) -> bool:
+    """هل يدل الخطأ على تعطل Supabase؟ (أخطاء الاتصال والمهلة و 5xx فقط)"""
+    import httpx
+    from postgrest.exceptions import APIError
+
+    if isinstance(exc, httpx.HTTPStatusError):
+        return exc.response.status_code >= 500
+    if isinstance(exc, APIError):
+        # رموز HTTP من ثلاثة أرقام؛ رموز PostgreSQL (مثل 23505) أخطاء في الطلب
+        code = str(exc.code or '')
+        return len(code) == 3 and code.isdigit() and int(code) >= 500
+    return isinstance(exc, (httpx.TransportError, OSError, TimeoutError))
+
+
+# قاطع الدائرة لطلبات Supabase: عند التعطل يُستخدم التخزين المحلي فوراً دون انتظار المهلة
+supabase_breaker = CircuitBreaker(
+    "supabase",
+    failure_threshold=settings.SUPABASE_BREAKER_THRESHOLD,
+    recovery_timeout=settings.SUPABASE_BREAKER_RESET,
+    is_failure=_is_outage
+)
+
+
+def _connect_supabase() -> Optional[Client]:
+    """عميل Supabase المشترك (يُنشأ عند أول استخدام) دون المرور بقاطع الدائرة"""
     global _supabase_client
+    # الاتصال المباشر بـ PostgreSQL لا يمر عبر REST
+    if settings.STORAGE_BACKEND == "postgres":
+        return None
     if _supabase_client is None:
-        if settings.SUPABASE_URL and settings.SUPABASE_KEY:
+        if settings.SUPABASE_FAKE:
+            from app.core.fake_supabase import FakeSupabaseClient, get_fake_backend
+            _supabase_client = FakeSupabaseClient(get_fake_backend())
+        elif settings.SUPABASE_URL and settings.SUPABASE_KEY:
             try:
                 _supabase_client = create_client(
                     settings.SUPABASE_URL,
@@ -34,21 +76,38 @@ def get_supabase_client() -> Optional[Client]:
     return _supabase_client
 
 
+def get_supabase_client() -> Optional[Client]:
+    """
+    الحصول على عميل Supabase لتنفيذ استعلام
+
+    يستهلك الطلب التجريبي في حالة half_open، لذا يُستدعى فقط قبل استعلام
+    يُنفذ داخل `with supabase_breaker:` ليُسجل نجاحه أو فشله.
+    """
+    client = _connect_supabase()
+    # الدائرة مفتوحة: لا طلبات حتى انتهاء مهلة الاسترداد
+    if client is None or not supabase_breaker.allow():
+        return None
+    return client
+
+
 def init_db():
     """تهيئة قاعدة البيانات"""
     print(f"Initializing database... Type: {DB_TYPE}")
 
-    if settings.DATABASE_URL:
-        client = get_supabase_client()
+    if settings.STORAGE_BACKEND == "postgres":
+        local_storage.bootstrap()
+        print("PostgreSQL connection pool established")
+    elif settings.DATABASE_URL:
+        client = _connect_supabase()
         if client:
             print("Supabase connection established")
     else:
-        print("Using local storage (no database configured)")
+        print(f"Using local storage (no database configured) - backend: {settings.STORAGE_BACKEND}")
 
 
 def get_db():
-    """الحصول على اتصال قاعدة البيانات"""
-    client = get_supabase_client()
+    """الحصول على اتصال قاعدة البيانات (لا يمر بقاطع الدائرة)"""
+    client = _connect_supabase()
     if client:
         return client
     return None
@@ -57,98 +116,685 @@ def get_db():
 @contextmanager
 def get_db_context():
     """حصول على قاعدة البيانات كسياق"""
-    client = get_supabase_client()
+    client = _connect_supabase()
     yield client
 
 
 class LocalStorage:
-    """تخزين محلي للمشاريع الصغيرة"""
+    """
+    تخزين محلي للمشاريع الصغيرة
+
+    يعتمد على لقطة (snapshot) بصيغة JSON وسجل إضافات (append-only log):
+    كل تعديل يُضاف كسطر واحد في السجل بدلاً من إعادة كتابة الملف كاملاً،
+    وتُعاد بناء الجداول في الذاكرة عند التشغيل، ويُدمج السجل في اللقطة دورياً.
+
+    التعديلات تُطبق في الذاكرة فوراً تحت قفل واحد، ثم يكتبها خيط كاتب وحيد
+    إلى السجل على دفعات (كل flush_ms أو batch_size سجل) مع fsync واحد للدفعة.
+    """
 
-    def __init__(self):
-        self.data_file = "data/local_storage.json"
+    # الفهارس الثانوية المعلنة لكل جدول (حقل -> قيمة -> مفاتيح العناصر)
+    INDEXES: Dict[str, tuple] = {
+        'leads': ('user_id', 'status', 'source', 'campaign'),
+    }
+
+    def __init__(self, data_file: str = "data/local_storage.json",
+                 compact_every: int = settings.LOCAL_STORAGE_COMPACT_EVERY,
+                 flush_ms: int = settings.LOCAL_STORAGE_FLUSH_MS,
+                 batch_size: int = settings.LOCAL_STORAGE_BATCH_SIZE):
+        self.data_file = data_file
+        self.log_file = os.path.splitext(data_file)[0] + ".log"
+        self.compact_every = compact_every
+        self.flush_interval = flush_ms / 1000
+        self.batch_size = batch_size
+        self._lock = threading.RLock()
+        self._cond = threading.Condition(self._lock)
+        self._pending: List[tuple] = []
+        self._writer: Optional[threading.Thread] = None
+        self._closed = False
+        self._log_records = 0
+        self._log_offset = 0
+        self._generation = 0
+        self._indexes: Dict[str, Dict[str, Dict[Any, Dict[str, None]]]] = {}
         self._ensure_file()
+        self._data: Dict[str, Dict[str, Any]] = {}
+        self._reload()
+        self._stamp = self._file_stamp()
+        atexit.register(self.close)
+
+    @property
+    def generation(self) -> int:
+        """عداد يزداد مع كل تعديل أو إعادة تحميل للجداول"""
+        return self._generation
+
+    @staticmethod
+    def _stat(path: str) -> Optional[tuple]:
+        """وقت التعديل وحجم الملف"""
+        try:
+            st = os.stat(path)
+            return st.st_mtime_ns, st.st_size
+        except OSError:
+            return None
+
+    def _file_stamp(self) -> tuple:
+        """بصمة ملفات التخزين للكشف عن التعديلات الخارجية"""
+        return self._stat(self.data_file), self._stat(self.log_file)
+
+    def _sync(self):
+        """إعادة تحميل الجداول فقط إذا تغيرت الملفات من خارج هذه النسخة"""
+        stamp = self._file_stamp()
+        if stamp == self._stamp:
+            return
+
+        snapshot_stamp, log_stamp = stamp
+        if snapshot_stamp == self._stamp[0] and log_stamp and log_stamp[1] >= self._log_offset:
+            # السجل نما فقط (عملية أخرى تضيف إليه) - نطبق الجزء الجديد فقط
+            count, self._log_offset = self._replay_log(self._apply, self._log_offset)
+            self._log_records += count
+        else:
+            self._reload()
+            # التعديلات التي لم تُكتب بعد ليست في الملفات - نعيد تطبيقها
+            for record, _ in self._pending:
+                self._apply(record)
+
+        self._generation += 1
+        self._stamp = stamp
+
+    @contextmanager
+    def _file_lock(self, exclusive: bool):
+        """
+        قفل ملفات التخزين بين العمليات
+
+        الإضافة إلى السجل تأخذ قفلاً مشتركاً، والدمج يأخذ قفلاً حصرياً فلا
+        يُفرغ السجل وعملية أخرى تكتب فيه.
+        """
+        if fcntl is None:
+            yield
+            return
+        with open(f"{self.log_file}.lock", 'a') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
 
     def _ensure_file(self):
         """التأكد من وجود ملف البيانات"""
-        os.makedirs(os.path.dirname(self.data_file), exist_ok=True)
+        os.makedirs(os.path.dirname(self.data_file) or ".", exist_ok=True)
         if not os.path.exists(self.data_file):
             self._save({})
 
     def _save(self, data: Dict[str, Any]):
-        """حفظ البيانات"""
-        with open(self.data_file, 'w', encoding='utf-8') as f:
+        """حفظ اللقطة (كتابة ذرية عبر ملف مؤقت ثم إعادة تسمية)"""
+        tmp_file = f"{self.data_file}.tmp"
+        with open(tmp_file, 'w', encoding='utf-8') as f:
             json.dump(data, f, ensure_ascii=False, indent=2)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_file, self.data_file)
 
     def _load(self) -> Dict[str, Any]:
-        """تحميل البيانات"""
+        """تحميل اللقطة ثم إعادة تطبيق السجل"""
         try:
             with open(self.data_file, 'r', encoding='utf-8') as f:
-                return json.load(f)
+                data = json.load(f)
         except:
+            data = {}
+
+        self._log_records, self._log_offset = self._replay_log(
+            lambda record: self._apply_record(data, record)
+        )
+        return data
+
+    def _reload(self):
+        """إعادة بناء الجداول والفهارس من الملفات"""
+        self._data = self._load()
+        self._indexes = {}
+        for table, fields in self.INDEXES.items():
+            self._indexes[table] = {field: {} for field in fields}
+            for key, item in self._data.get(table, {}).items():
+                self._reindex(table, key, {}, self._index_values(table, item))
+
+    def _replay_log(self, apply: Callable[[Dict[str, Any]], Any], offset: int = 0) -> tuple:
+        """
+        إعادة تطبيق سجلات التعديل عبر الدالة المعطاة
+
+        Returns:
+            tuple: (عدد السجلات المطبقة, موضع نهاية آخر سجل مكتمل)
+        """
+        if not os.path.exists(self.log_file):
+            return 0, 0
+
+        count = 0
+        with open(self.log_file, 'rb') as f:
+            f.seek(offset)
+            for raw in f:
+                if not raw.endswith(b"\n"):
+                    # سطر غير مكتمل (كتابة جارية) - يُقرأ في المرة القادمة
+                    break
+                offset += len(raw)
+                line = raw.strip()
+                if not line:
+                    continue
+                try:
+                    record = json.loads(line.decode('utf-8'))
+                except ValueError:
+                    # سطر تالف من كتابة غير مكتملة - يتم تجاهله
+                    print(f"Skipping corrupt log record in {self.log_file}")
+                    continue
+                apply(record)
+                count += 1
+        return count, offset
+
+    def _index_values(self, table: str, item: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+        """قيم الحقول المفهرسة لعنصر"""
+        if item is None:
             return {}
+        return {field: item.get(field) for field in self.INDEXES.get(table, ())}
+
+    def _reindex(self, table: str, key: str, old: Dict[str, Any], new: Dict[str, Any]):
+        """تحديث الفهارس للحقول التي تغيرت قيمتها فقط"""
+        table_indexes = self._indexes.get(table)
+        if not table_indexes:
+            return
+
+        for field, index in table_indexes.items():
+            if field in old and field in new and old[field] == new[field]:
+                continue
+            # قيمة غير قابلة للتجزئة لا تُفهرس (تُعالج بالمسح في الاستعلام)؛
+            # الإزالة والإضافة منفصلتان فلا تمنع قيمة قديمة فهرسة الجديدة
+            if field in old:
+                try:
+                    posting = index.get(old[field])
+                    if posting is not None:
+                        posting.pop(key, None)
+                        if not posting:
+                            del index[old[field]]
+                except TypeError:
+                    pass
+            if field in new:
+                try:
+                    index.setdefault(new[field], {})[key] = None
+                except TypeError:
+                    pass
+
+    def _apply(self, record: Dict[str, Any]) -> bool:
+        """تطبيق سجل تعديل على الجداول في الذاكرة مع تحديث الفهارس"""
+        if record.get('op') == 'insert_many':
+            for key, value in record['values'].items():
+                self._apply({'op': 'insert', 'table': record['table'], 'key': key, 'value': value})
+            return True
+
+        table, key = record['table'], record['key']
+        old = self._index_values(table, self._data.get(table, {}).get(key))
+        applied = self._apply_record(self._data, record)
+        if applied:
+            new = self._index_values(table, self._data.get(table, {}).get(key))
+            self._reindex(table, key, old, new)
+        return applied
+
+    @staticmethod
+    def _apply_record(data: Dict[str, Any], record: Dict[str, Any]) -> bool:
+        """تطبيق سجل تعديل واحد على البيانات"""
+        op = record.get('op')
+        table = data.setdefault(record['table'], {})
+
+        if op == 'insert_many':
+            for key, value in record['values'].items():
+                table[key] = dict(value)
+            return True
+
+        key = record['key']
+        if op == 'insert':
+            table[key] = dict(record['value'])
+        elif op == 'update':
+            if key not in table:
+                return False
+            table[key].update(record['value'])
+        elif op == 'delete':
+            if key not in table:
+                return False
+            del table[key]
+        else:
+            return False
+        return True
+
+    def _append(self, record: Dict[str, Any]) -> Future:
+        """إضافة سجل تعديل إلى طابور الكتابة (يُستدعى تحت القفل)"""
+        future: Future = Future()
+        self._pending.append((record, future))
+        self._generation += 1
+
+        if self._writer is None:
+            self._writer = threading.Thread(
+                target=self._writer_loop, name="local-storage-writer", daemon=True
+            )
+            self._writer.start()
+        # إيقاظ الكاتب عند أول تعديل في الدفعة (لبدء مهلتها) أو عند امتلائها
+        if len(self._pending) == 1 or len(self._pending) >= self.batch_size:
+            self._cond.notify()
+        return future
+
+    def _writer_loop(self):
+        """خيط الكتابة: تجميع التعديلات وكتابتها دفعة واحدة"""
+        with self._cond:
+            while not self._closed:
+                self._cond.wait_for(lambda: self._pending or self._closed)
+                # انتظار امتلاء الدفعة أو انقضاء المهلة
+                self._cond.wait_for(
+                    lambda: len(self._pending) >= self.batch_size or self._closed,
+                    timeout=self.flush_interval
+                )
+                self._flush_pending()
+
+    def _flush_pending(self):
+        """كتابة جميع التعديلات المعلقة إلى السجل (يُستدعى تحت القفل)"""
+        if not self._pending:
+            return
+
+        batch, self._pending = self._pending, []
+        payload = b"".join(
+            (json.dumps(record, ensure_ascii=False, separators=(',', ':')) + "\n").encode('utf-8')
+            for record, _ in batch
+        )
+
+        try:
+            expected_end = self._log_offset + len(payload)
+            with self._file_lock(exclusive=False), open(self.log_file, 'ab') as f:
+                f.write(payload)
+                f.flush()
+                os.fsync(f.fileno())
+                end = f.tell()
+                log_mtime = os.fstat(f.fileno()).st_mtime_ns
+        except Exception as e:
+            print(f"Error writing local storage log: {e}")
+            # تبقى التعديلات في الذاكرة وتُعاد محاولة كتابتها في الدفعة التالية
+            self._pending = [(record, None) for record, _ in batch] + self._pending
+            for _, future in batch:
+                if future is not None:
+                    future.set_exception(e)
+            return
+
+        self._log_records += len(batch)
+        self._log_offset = end
+
+        if end == expected_end:
+            # البصمة تُبنى من موضع كتابتنا لا من حجم الملف الحالي، فأي إضافة
+            # من عملية أخرى بعد كتابتنا تُكتشف وتُقرأ في المزامنة التالية
+            self._stamp = (self._stat(self.data_file), (log_mtime, end))
+        else:
+            # كتبت عملية أخرى في السجل قبل سجلاتنا - نفرض إعادة تحميل كاملة
+            self._stamp = (None, None)
+
+        if self._log_records >= self.compact_every:
+            self.compact()
+
+        for _, future in batch:
+            if future is not None:
+                future.set_result(True)
+
+    def flush(self):
+        """كتابة جميع التعديلات المعلقة فوراً"""
+        with self._lock:
+            self._flush_pending()
+
+    def durability_future(self) -> Future:
+        """Future يكتمل عند كتابة آخر تعديل حتى الآن إلى القرص"""
+        with self._lock:
+            for _, future in reversed(self._pending):
+                if future is not None:
+                    return future
+        done: Future = Future()
+        done.set_result(True)
+        return done
+
+    def close(self):
+        """كتابة التعديلات المعلقة وإيقاف خيط الكتابة"""
+        with self._cond:
+            self._flush_pending()
+            self._closed = True
+            self._cond.notify_all()
+        if self._writer is not None and self._writer is not threading.current_thread():
+            self._writer.join(timeout=5)
+
+    def compact(self):
+        """دمج السجل في اللقطة وتفريغه"""
+        with self._lock:
+            # اللقطة تُبنى من الذاكرة فيجب ألا يبقى تعديل معلق خارجها
+            if self._pending:
+                self._flush_pending()
+                return
+
+            with self._file_lock(exclusive=True):
+                # قد تكون عملية أخرى أضافت إلى السجل أو دمجته: نقرأ تعديلاتها
+                # أولاً حتى تدخل اللقطة ولا تضيع مع تفريغ السجل
+                self._sync()
+
+                # التطبيق المكرر للسجل على اللقطة الجديدة آمن (العمليات متساوية الأثر)
+                # لذلك لا ضرر إن توقف النظام بين حفظ اللقطة وتفريغ السجل
+                self._save(self._data)
+                with open(self.log_file, 'w', encoding='utf-8'):
+                    pass
+                self._log_records = 0
+                self._log_offset = 0
+                self._stamp = self._file_stamp()
+
+    def _commit(self, record: Dict[str, Any]) -> Future:
+        """تطبيق التعديل في الذاكرة ووضعه في طابور الكتابة (يُستدعى تحت القفل)"""
+        self._apply(record)
+        return self._append(record)
 
     def get(self, table: str, key: str) -> Optional[Dict[str, Any]]:
         """الحصول على عنصر"""
-        data = self._load()
-        table_data = data.get(table, {})
-        return table_data.get(key)
+        with self._lock:
+            self._sync()
+            item = self._data.get(table, {}).get(key)
+            return dict(item) if item is not None else None
 
     def get_all(self, table: str) -> List[Dict[str, Any]]:
         """الحصول على جميع العناصر من جدول"""
-        data = self._load()
-        return list(data.get(table, {}).values())
+        with self._lock:
+            self._sync()
+            return [dict(item) for item in self._data.get(table, {}).values()]
 
-    def insert(self, table: str, key: str, value: Dict[str, Any]) -> str:
-        """إضافة عنصر جديد"""
-        data = self._load()
-        if table not in data:
-            data[table] = {}
+    def insert(self, table: str, key: str, value: Dict[str, Any], durable: bool = False) -> str:
+        """
+        إضافة عنصر جديد
 
+        Args:
+            durable: انتظار كتابة التعديل إلى القرص قبل العودة
+        """
         value['id'] = key
         value['created_at'] = datetime.now().isoformat()
-        data[table][key] = value
-        self._save(data)
+
+        with self._lock:
+            self._sync()
+            future = self._commit({'op': 'insert', 'table': table, 'key': key, 'value': dict(value)})
+        if durable:
+            future.result()
         return key
 
-    def update(self, table: str, key: str, value: Dict[str, Any]) -> bool:
+    def insert_many(self, table: str, items: Dict[str, Dict[str, Any]], durable: bool = False) -> List[str]:
+        """
+        إضافة مجموعة عناصر في سجل واحد (تُكتب كلها أو لا يُكتب شيء منها)
+
+        Args:
+            items: العناصر مفهرسة بمفاتيحها
+            durable: انتظار كتابة التعديل إلى القرص قبل العودة
+        """
+        if not items:
+            return []
+
+        now = datetime.now().isoformat()
+        values = {}
+        for key, value in items.items():
+            value['id'] = key
+            value['created_at'] = now
+            values[key] = dict(value)
+
+        with self._lock:
+            self._sync()
+            future = self._commit({'op': 'insert_many', 'table': table, 'values': values})
+        if durable:
+            future.result()
+        return list(values.keys())
+
+    def update(self, table: str, key: str, value: Dict[str, Any], durable: bool = False) -> bool:
         """تحديث عنصر"""
-        data = self._load()
-        if table not in data or key not in data[table]:
-            return False
+        changes = dict(value)
+        changes['updated_at'] = datetime.now().isoformat()
 
-        existing = data[table][key]
-        existing.update(value)
-        existing['updated_at'] = datetime.now().isoformat()
-        data[table][key] = existing
-        self._save(data)
+        with self._lock:
+            self._sync()
+            if key not in self._data.get(table, {}):
+                return False
+            future = self._commit({'op': 'update', 'table': table, 'key': key, 'value': changes})
+        if durable:
+            future.result()
         return True
 
-    def delete(self, table: str, key: str) -> bool:
+    def delete(self, table: str, key: str, durable: bool = False) -> bool:
         """حذف عنصر"""
-        data = self._load()
-        if table not in data or key not in data[table]:
-            return False
-
-        del data[table][key]
-        self._save(data)
+        with self._lock:
+            self._sync()
+            if key not in self._data.get(table, {}):
+                return False
+            future = self._commit({'op': 'delete', 'table': table, 'key': key})
+        if durable:
+            future.result()
         return True
 
     def query(self, table: str, **filters) -> List[Dict[str, Any]]:
-        """استعلام بسيط"""
-        results = []
-        for item in self.get_all(table):
+        """
+        استعلام بسيط
+
+        الحقول المفهرسة تُحل بتقاطع قوائم المفاتيح (الأصغر أولاً)،
+        وبقية الشروط تُفحص على النتائج المرشحة فقط.
+        """
+        with self._lock:
+            self._sync()
+            return [dict(item) for item in self._matches(table, filters)]
+
+    def query_page(self, table: str, filters: Dict[str, Any], after: Optional[tuple] = None,
+                   limit: Optional[int] = None,
+                   order_by: tuple = ('created_at', 'id')) -> List[Dict[str, Any]]:
+        """
+        استعلام مع ترقيم بالمؤشر (keyset)
+
+        Args:
+            filters: شروط المساواة
+            after: قيم حقول الترتيب لآخر عنصر في الصفحة السابقة
+            limit: الحد الأقصى لعدد العناصر
+            order_by: حقول الترتيب
+        """
+        def sort_key(item):
+            return tuple(str(item.get(field) or '') for field in order_by)
+
+        with self._lock:
+            self._sync()
+            items = sorted(self._matches(table, filters), key=sort_key)
+            start = 0
+            if after:
+                start = bisect.bisect_right([sort_key(item) for item in items], tuple(after))
+            end = start + limit if limit else len(items)
+            # نسخ عناصر الصفحة فقط
+            return [dict(item) for item in items[start:end]]
+
+    def group_count(self, table: str, fields: tuple, filters: Optional[Dict[str, Any]] = None,
+                    sum_field: Optional[str] = None) -> List[Dict[str, Any]]:
+        """
+        عدّ العناصر مجمعة حسب حقول (مثل GROUP BY) دون نسخ العناصر
+
+        Returns:
+            List[Dict]: صف لكل مجموعة بقيم الحقول و count و <sum_field>_sum
+        """
+        with self._lock:
+            self._sync()
+
+            # تجميع حسب حقل مفهرس واحد بدون شروط: أطوال قوائم الفهرس مباشرة
+            index = self._indexes.get(table, {}).get(fields[0]) if len(fields) == 1 else None
+            if index is not None and not filters and not sum_field:
+                return [{fields[0]: value, 'count': len(keys)} for value, keys in index.items()]
+
+            groups: Dict[tuple, list] = {}
+            for item in self._matches(table, filters or {}):
+                key = tuple(item.get(field) for field in fields)
+                group = groups.get(key)
+                if group is None:
+                    group = groups[key] = [0, 0]
+                group[0] += 1
+                if sum_field:
+                    group[1] += item.get(sum_field) or 0
+
+        rows = []
+        for key, (count, total) in groups.items():
+            row = dict(zip(fields, key))
+            row['count'] = count
+            if sum_field:
+                row[f'{sum_field}_sum'] = total
+            rows.append(row)
+        return rows
+
+    def _matches(self, table: str, filters: Dict[str, Any]):
+        """العناصر المطابقة للشروط (يُستدعى تحت القفل)"""
+        table_data = self._data.get(table, {})
+        table_indexes = self._indexes.get(table, {})
+
+        postings = []
+        remaining = {}
+        for field, value in filters.items():
+            try:
+                if field in table_indexes:
+                    postings.append(table_indexes[field].get(value, {}))
+                    continue
+            except TypeError:
+                pass
+            remaining[field] = value
+
+        if postings:
+            postings.sort(key=len)
+            candidates = (
+                key for key in postings[0]
+                if all(key in posting for posting in postings[1:])
+            )
+            items = (table_data[key] for key in candidates)
+        else:
+            items = table_data.values()
+
+        for item in items:
             match = True
-            for key, value in filters.items():
+            for key, value in remaining.items():
                 if item.get(key) != value:
                     match = False
                     break
             if match:
-                results.append(item)
-        return results
+                yield item
+
+
+def create_local_storage():
+    """إنشاء التخزين المحلي حسب الإعدادات (json أو sqlite أو postgres)"""
+    if settings.STORAGE_BACKEND == "postgres":
+        from app.core.postgres_storage import PostgresStorage
+        return PostgresStorage(settings.get_database_url())
+    if settings.STORAGE_BACKEND == "sqlite":
+        from app.core.sqlite_storage import SQLiteStorage
+        return SQLiteStorage(settings.SQLITE_PATH)
+    return LocalStorage()
 
 
 # إنشاء تخزين محلي
-local_storage = LocalStorage()
+local_storage = create_local_storage()
+
+
+# الحقول المسموح بطلبها في عرض العملاء
+LEAD_FIELDS = (
+    'id', 'user_id', 'name', 'phone', 'email', 'status', 'notes',
+    'source', 'campaign', 'score', 'created_at', 'updated_at'
+)
+
+
+# أحرف معرفات العملاء المسموحة في المؤشر
+CURSOR_ID_PATTERN = re.compile(r'[A-Za-z0-9_-]{1,64}')
+
+
+def parse_cursor(cursor: Optional[str]) -> Optional[tuple]:
+    """
+    تحويل مؤشر الصفحة '<created_at>,<id>' إلى قيم
+
+    المؤشر يأتي من العميل ويُدرج في شرط PostgREST، لذا يُقبل فقط تاريخ ISO
+    ومعرف من الأحرف المسموحة (ValueError لغير ذلك).
+    """
+    if not cursor:
+        return None
+    created_at, sep, lead_id = cursor.rpartition(',')
+    if not sep or not created_at or not lead_id:
+        raise ValueError(f"Invalid cursor: {cursor}")
+    if not CURSOR_ID_PATTERN.fullmatch(lead_id):
+        raise ValueError(f"Invalid cursor id: {lead_id}")
+    try:
+        datetime.fromisoformat(created_at.replace('Z', '+00:00'))
+    except ValueError:
+        raise ValueError(f"Invalid cursor timestamp: {created_at}")
+    return created_at, lead_id
+
+
+def make_cursor(lead: Dict[str, Any]) -> str:
+    """بناء مؤشر الصفحة التالية من آخر عميل"""
+    return f"{lead.get('created_at', '')},{lead.get('id', '')}"
+
+
+def cursor_filter(after: tuple) -> str:
+    """شرط PostgREST لما بعد المؤشر (created_at, id)"""
+    created_at, lead_id = after
+    return f'created_at.gt."{created_at}",and(created_at.eq."{created_at}",id.gt."{lead_id}")'
+
+
+def select_columns(fields: Optional[List[str]]) -> str:
+    """أعمدة الاستعلام (مع حقول المؤشر دائماً)"""
+    if not fields:
+        return '*'
+    columns = list(dict.fromkeys([*fields, 'id', 'created_at']))
+    return ','.join(columns)
+
+
+def project(rows: List[Dict[str, Any]], fields: Optional[List[str]]) -> List[Dict[str, Any]]:
+    """إبقاء الحقول المطلوبة فقط"""
+    if not fields:
+        return rows
+    columns = select_columns(fields).split(',')
+    return [{field: row.get(field) for field in columns} for row in rows]
+
+
+# دالة التجميع في Supabase/Postgres (تُنشأ مرة واحدة من محرر SQL)
+LEAD_STATS_SQL = """
+create or replace function lead_stats(p_user_id text default null)
+returns table(status text, source text, count bigint, score_sum numeric)
+language sql stable as $$
+    select status, source, count(*), coalesce(sum(score), 0)
+    from leads
+    where p_user_id is null or user_id = p_user_id
+    group by status, source
+$$;
+"""
+
+# عدد العملاء لكل (مستخدم، حالة، مصدر) لإعادة بناء الإسقاطات
+LEAD_COUNTS_SQL = """
+create or replace function lead_counts()
+returns table(user_id text, status text, source text, count bigint)
+language sql stable as $$
+    select user_id, status, source, count(*)
+    from leads
+    group by user_id, status, source
+$$;
+"""
+
+
+def fold_lead_stats(rows: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    تحويل صفوف التجميع (status, source, count, score_sum) إلى إحصائيات
+
+    Returns:
+        Dict: total و by_status و by_source (count, converted, total_score)
+    """
+    stats = {'total': 0, 'by_status': {}, 'by_source': {}}
+    for row in rows:
+        status = row.get('status')
+        source = row.get('source')
+        status = 'unknown' if status is None else status
+        source = 'unknown' if source is None else source
+        count = int(row.get('count') or 0)
+        score = row.get('score_sum') or 0
+
+        stats['total'] += count
+        stats['by_status'][status] = stats['by_status'].get(status, 0) + count
+
+        source_stats = stats['by_source'].setdefault(
+            source, {'count': 0, 'converted': 0, 'total_score': 0}
+        )
+        source_stats['count'] += count
+        source_stats['total_score'] += score
+        if status == 'closed':
+            source_stats['converted'] += count
+    return stats
 
 
 class DatabaseOperations:
@@ -156,12 +802,44 @@ class DatabaseOperations:
 
     @staticmethod
     def get_user(username: str) -> Optional[Dict[str, Any]]:
-        """الحصول على المستخدم"""
+        """الحصول على المستخدم (عبر سياق الطلب ثم الذاكرة المؤقتة)"""
+        return DatabaseOperations._load(
+            ('user', username), lambda: DatabaseOperations._fetch_user(username)
+        )
+
+    @staticmethod
+    def get_user_for_update(username: str) -> Optional[Dict[str, Any]]:
+        """
+        قراءة المستخدم من قاعدة البيانات مباشرة قبل قراءة-تعديل-كتابة (الرصيد)
+
+        الذاكرة المؤقتة وسياق الطلب خاصان بالعملية، فقد تحمل رصيداً قديماً
+        إن عدّلته عملية أخرى. القراءة الجديدة تُحدّثهما.
+        """
+        key = ('user', username)
+        version = entity_cache.version()
+        user = DatabaseOperations._fetch_user(username)
+        entity_cache.set(key, user, version=version)
+        unit = current_unit()
+        return unit.refresh(key, user) if unit else user
+
+    @staticmethod
+    def _load(key: tuple, loader: Callable[[], Any]) -> Any:
+        """قراءة كيان مرة واحدة لكل طلب (identity map) وعبر الذاكرة المؤقتة"""
+        def read():
+            return entity_cache.read_through(key, loader)
+
+        unit = current_unit()
+        return unit.load(key, read) if unit else read()
+
+    @staticmethod
+    def _fetch_user(username: str) -> Optional[Dict[str, Any]]:
+        """قراءة المستخدم من قاعدة البيانات"""
         client = get_supabase_client()
         if client:
             try:
-                result = client.table('users').select('*').eq('username', username).execute()
-                return result.data[0] if result.data else None
+                with supabase_breaker:
+                    result = client.table('users').select('*').eq('username', username).execute()
+                    return result.data[0] if result.data else None
             except Exception as e:
                 print(f"Error getting user: {e}")
 
@@ -169,9 +847,9 @@ class DatabaseOperations:
         return local_storage.get('users', username)
 
     @staticmethod
-    def create_user(username: str, data: Dict[str, Any]) -> Dict[str, Any]:
-        """إنشاء مستخدم جديد"""
-        user_data = {
+    def _build_user(username: str, data: Dict[str, Any]) -> Dict[str, Any]:
+        """بناء بيانات مستخدم جديد"""
+        return {
             'username': username,
             'wallet_balance': data.get('wallet_balance', settings.DEFAULT_BALANCE),
             'is_admin': data.get('is_admin', False),
@@ -179,63 +857,316 @@ class DatabaseOperations:
             'created_at': datetime.now().isoformat()
         }
 
+    @staticmethod
+    def _prepare_lead(user_id: str, lead_data: Dict[str, Any], created_at: Optional[str] = None) -> str:
+        """تعيين المعرف والمالك ووقت الإنشاء لعميل جديد"""
+        import uuid
+        lead_id = str(uuid.uuid4())[:8]
+        lead_data['user_id'] = user_id
+        lead_data['id'] = lead_id
+        lead_data['created_at'] = created_at or datetime.now().isoformat()
+        return lead_id
+
+    @staticmethod
+    def _leads_cache_key(user_id: str, status: Optional[str], source: Optional[str],
+                         after: Optional[tuple], limit: Optional[int],
+                         fields: Optional[List[str]]) -> tuple:
+        """مفتاح قائمة العملاء في الذاكرة المؤقتة"""
+        return ('leads', user_id, status, source, after, limit, tuple(fields) if fields else None)
+
+    @staticmethod
+    def _leads_tags(user_id: str) -> tuple:
+        """وسوم قوائم العملاء (لإخلائها عند أي كتابة على عملاء المستخدم)"""
+        return (('leads', user_id), 'leads')
+
+    @staticmethod
+    def _user_created(username: str, user: Dict[str, Any]):
+        """تسجيل المستخدم الجديد في الذاكرة المؤقتة وسياق الطلب"""
+        entity_cache.set(('user', username), user)
+        unit = current_unit()
+        if unit:
+            unit.register(('user', username), dict(user))
+
+    @staticmethod
+    def _user_written(username: str, data: Dict[str, Any], updated: bool):
+        """تحديث المستخدم المخزن مؤقتاً بعد الكتابة (أو إخلاؤه عند الفشل)"""
+        if updated:
+            entity_cache.merge(('user', username), data)
+        else:
+            entity_cache.evict(('user', username))
+
+    @staticmethod
+    def _lead_written(lead_id: str, updates: Optional[Dict[str, Any]] = None):
+        """
+        تحديث العميل المخزن مؤقتاً وإخلاء قوائم مالكه بعد التحديث أو الحذف
+
+        Args:
+            lead_id: معرف العميل
+            updates: التحديثات الناجحة (None للحذف أو الفشل)
+        """
+        key = ('lead', lead_id)
+        lead = entity_cache.peek(key)
+        lead = lead if isinstance(lead, dict) else None
+        if updates is not None and lead:
+            entity_cache.merge(key, updates)
+        else:
+            entity_cache.evict(key)
+
+        owner = lead.get('user_id') if lead else None
+        if owner and not (updates and 'user_id' in updates):
+            entity_cache.invalidate(('leads', owner))
+        else:
+            # المالك غير معروف: إخلاء جميع قوائم العملاء
+            entity_cache.invalidate('leads')
+
+    @staticmethod
+    def create_user(username: str, data: Dict[str, Any]) -> Dict[str, Any]:
+        """إنشاء مستخدم جديد"""
+        user_data = DatabaseOperations._build_user(username, data)
+
         client = get_supabase_client()
         if client:
             try:
-                result = client.table('users').insert(user_data).execute()
-                return result.data[0]
+                with supabase_breaker:
+                    result = client.table('users').insert(user_data).execute()
+                    DatabaseOperations._user_created(username, result.data[0])
+                    return result.data[0]
             except Exception as e:
                 print(f"Error creating user: {e}")
 
         # استخدام التخزين المحلي
         local_storage.insert('users', username, user_data)
+        DatabaseOperations._user_created(username, user_data)
         return user_data
 
     @staticmethod
     def update_user(username: str, data: Dict[str, Any]) -> bool:
-        """تحديث المستخدم"""
+        """تحديث المستخدم (يُؤجل إلى نهاية الطلب إن كان محمّلاً في سياقه)"""
+        unit = current_unit()
+        if unit:
+            if unit.defer(('user', username), data):
+                return True
+            data = unit.write_through(('user', username), data)
+
+        updated = None
         client = get_supabase_client()
         if client:
             try:
-                result = client.table('users').update(data).eq('username', username).execute()
-                return bool(result.data)
+                with supabase_breaker:
+                    result = client.table('users').update(data).eq('username', username).execute()
+                    updated = bool(result.data)
             except Exception as e:
                 print(f"Error updating user: {e}")
 
-        return local_storage.update('users', username, data)
+        if updated is None:
+            updated = local_storage.update('users', username, data)
+        if unit and not updated:
+            unit.forget(('user', username))
+        DatabaseOperations._user_written(username, data, updated)
+        return updated
 
     @staticmethod
     def add_lead(user_id: str, lead_data: Dict[str, Any]) -> str:
         """إضافة عميل محتمل"""
-        import uuid
-        lead_id = str(uuid.uuid4())[:8]
-        lead_data['user_id'] = user_id
-        lead_data['id'] = lead_id
-        lead_data['created_at'] = datetime.now().isoformat()
+        lead_id = DatabaseOperations._prepare_lead(user_id, lead_data)
+        added_id = None
 
         client = get_supabase_client()
         if client:
             try:
-                result = client.table('leads').insert(lead_data).execute()
-                return result.data[0].get('id', lead_id)
+                with supabase_breaker:
+                    result = client.table('leads').insert(lead_data).execute()
+                    added_id = result.data[0].get('id', lead_id)
             except Exception as e:
                 print(f"Error adding lead: {e}")
 
-        local_storage.insert('leads', lead_id, lead_data)
-        return lead_id
+        if added_id is None:
+            local_storage.insert('leads', lead_id, lead_data)
+            added_id = lead_id
+        entity_cache.invalidate(('leads', user_id))
+        return added_id
+
+    @staticmethod
+    def add_leads_bulk(user_id: str, leads: List[Dict[str, Any]],
+                       chunk_size: int = settings.BULK_INSERT_CHUNK_SIZE) -> List[str]:
+        """
+        إضافة مجموعة عملاء دفعة واحدة
+
+        Args:
+            user_id: معرف المستخدم
+            leads: بيانات العملاء
+            chunk_size: عدد الصفوف في كل طلب إدراج
+
+        Returns:
+            List[str]: معرفات العملاء المضافين
+        """
+        now = datetime.now().isoformat()
+        for lead_data in leads:
+            DatabaseOperations._prepare_lead(user_id, lead_data, now)
+
+        lead_ids = []
+        remaining = leads
+
+        client = get_supabase_client()
+        if client:
+            try:
+                with supabase_breaker:
+                    # إدراج متعدد الصفوف: طلب واحد لكل دفعة بدلاً من طلب لكل عميل
+                    while remaining:
+                        chunk = remaining[:chunk_size]
+                        result = client.table('leads').insert(chunk).execute()
+                        lead_ids.extend(row.get('id') for row in result.data)
+                        remaining = remaining[chunk_size:]
+            except Exception as e:
+                print(f"Error adding leads in bulk: {e}")
+
+        if remaining:
+            lead_ids.extend(local_storage.insert_many(
+                'leads', {lead['id']: lead for lead in remaining}
+            ))
+        entity_cache.invalidate(('leads', user_id))
+        return lead_ids
+
+    @staticmethod
+    def get_leads(user_id: str, status: Optional[str] = None, source: Optional[str] = None,
+                  after: Optional[tuple] = None, limit: Optional[int] = None,
+                  fields: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+        """
+        الحصول على عملاء المستخدم
+
+        Args:
+            user_id: معرف المستخدم
+            status: تصفية حسب الحالة
+            source: تصفية حسب المصدر
+            after: مؤشر (created_at, id) لآخر عميل في الصفحة السابقة
+            limit: حجم الصفحة (الترتيب حسب created_at ثم id)
+            fields: الحقول المطلوبة فقط
+        """
+        return entity_cache.read_through(
+            DatabaseOperations._leads_cache_key(user_id, status, source, after, limit, fields),
+            lambda: DatabaseOperations._fetch_leads(user_id, status, source, after, limit, fields),
+            DatabaseOperations._leads_tags(user_id)
+        )
 
     @staticmethod
-    def get_leads(user_id: str) -> List[Dict[str, Any]]:
-        """الحصول على عملاء المستخدم"""
+    def _fetch_leads(user_id: str, status: Optional[str], source: Optional[str],
+                     after: Optional[tuple], limit: Optional[int],
+                     fields: Optional[List[str]]) -> List[Dict[str, Any]]:
+        """قراءة عملاء المستخدم من قاعدة البيانات"""
+        filters = DatabaseOperations._lead_filters(user_id, status, source)
+        paginate = after is not None or limit is not None
+
         client = get_supabase_client()
         if client:
             try:
-                result = client.table('leads').select('*').eq('user_id', user_id).execute()
-                return result.data
+                with supabase_breaker:
+                    query = client.table('leads').select(select_columns(fields))
+                    for field, value in filters.items():
+                        query = query.eq(field, value)
+                    if after:
+                        query = query.or_(cursor_filter(after))
+                    if paginate:
+                        query = query.order('created_at').order('id')
+                    if limit:
+                        query = query.limit(limit)
+                    return query.execute().data
             except Exception as e:
                 print(f"Error getting leads: {e}")
 
-        return local_storage.query('leads', user_id=user_id)
+        if paginate:
+            rows = local_storage.query_page('leads', filters, after=after, limit=limit)
+        else:
+            rows = local_storage.query('leads', **filters)
+        return project(rows, fields)
+
+    @staticmethod
+    def _lead_filters(user_id: str, status: Optional[str], source: Optional[str]) -> Dict[str, Any]:
+        """شروط استعلام العملاء"""
+        filters = {'user_id': user_id}
+        if status:
+            filters['status'] = status
+        if source:
+            filters['source'] = source
+        return filters
+
+    @staticmethod
+    def get_lead_stats(user_id: Optional[str] = None) -> Dict[str, Any]:
+        """
+        إحصائيات العملاء محسوبة داخل قاعدة البيانات (GROUP BY status, source)
+
+        Args:
+            user_id: معرف المستخدم (None لجميع العملاء)
+        """
+        client = get_supabase_client()
+        if client:
+            try:
+                with supabase_breaker:
+                    result = client.rpc('lead_stats', {'p_user_id': user_id}).execute()
+                    return fold_lead_stats(result.data)
+            except Exception as e:
+                print(f"Error getting lead stats: {e}")
+
+            # بدون دالة lead_stats: جلب الأعمدة اللازمة فقط (إن لم تُفتح الدائرة بالمحاولة الأولى)
+            if supabase_breaker.allow():
+                try:
+                    with supabase_breaker:
+                        query = client.table('leads').select('status,source,score')
+                        if user_id:
+                            query = query.eq('user_id', user_id)
+                        rows = [dict(row, count=1, score_sum=row.get('score')) for row in query.execute().data]
+                        return fold_lead_stats(rows)
+                except Exception as e:
+                    print(f"Error getting lead stats: {e}")
+
+        filters = {'user_id': user_id} if user_id else None
+        return fold_lead_stats(
+            local_storage.group_count('leads', ('status', 'source'), filters, sum_field='score')
+        )
+
+    @staticmethod
+    def get_lead_counts() -> List[Dict[str, Any]]:
+        """
+        عدد العملاء لكل (مستخدم، حالة، مصدر) - لإعادة بناء الإسقاطات
+
+        Returns:
+            List[Dict]: صفوف user_id و status و source و count
+        """
+        client = get_supabase_client()
+        if client:
+            try:
+                with supabase_breaker:
+                    return client.rpc('lead_counts', {}).execute().data
+            except Exception as e:
+                print(f"Error getting lead counts: {e}")
+
+            # بدون دالة lead_counts: العد على صفحات مرتبة بالمعرف حتى لا يقطعها حد صفوف PostgREST
+            # كل صفحة طلب مستقل يمر بقاطع الدائرة؛ رفضه يعني العد من التخزين المحلي
+            try:
+                counts: Dict[tuple, int] = {}
+                last_id = None
+                page_size = settings.LEADS_MAX_PAGE_SIZE
+                while True:
+                    if not supabase_breaker.allow():
+                        raise ConnectionError("Supabase circuit is open")
+                    with supabase_breaker:
+                        query = client.table('leads').select('id,user_id,status,source')
+                        if last_id is not None:
+                            query = query.gt('id', last_id)
+                        rows = query.order('id').limit(page_size).execute().data
+                    for row in rows:
+                        key = (row.get('user_id'), row.get('status'), row.get('source'))
+                        counts[key] = counts.get(key, 0) + 1
+                    if len(rows) < page_size:
+                        break
+                    last_id = rows[-1]['id']
+                return [
+                    {'user_id': user_id, 'status': status, 'source': source, 'count': count}
+                    for (user_id, status, source), count in counts.items()
+                ]
+            except Exception as e:
+                print(f"Error getting lead counts: {e}")
+
+        return local_storage.group_count('leads', ('user_id', 'status', 'source'))
 
     @staticmethod
     def get_all_leads() -> List[Dict[str, Any]]:
@@ -243,9 +1174,99 @@ class DatabaseOperations:
         client = get_supabase_client()
         if client:
             try:
-                result = client.table('leads').select('*').execute()
-                return result.data
+                with supabase_breaker:
+                    result = client.table('leads').select('*').execute()
+                    return result.data
             except Exception as e:
                 print(f"Error getting all leads: {e}")
 
         return local_storage.get_all('leads')
+
+    @staticmethod
+    def get_lead_by_id(lead_id: str) -> Optional[Dict[str, Any]]:
+        """الحصول على عميل بالمعرف (عبر سياق الطلب ثم الذاكرة المؤقتة)"""
+        return DatabaseOperations._load(
+            ('lead', lead_id), lambda: DatabaseOperations._fetch_lead(lead_id)
+        )
+
+    @staticmethod
+    def _fetch_lead(lead_id: str) -> Optional[Dict[str, Any]]:
+        """قراءة عميل من قاعدة البيانات"""
+        client = get_supabase_client()
+        if client:
+            try:
+                with supabase_breaker:
+                    result = client.table('leads').select('*').eq('id', lead_id).execute()
+                    return result.data[0] if result.data else None
+            except Exception as e:
+                print(f"Error getting lead: {e}")
+
+        return local_storage.get('leads', lead_id)
+
+    @staticmethod
+    def update_lead(lead_id: str, updates: Dict[str, Any]) -> bool:
+        """تحديث بيانات عميل (يُؤجل إلى نهاية الطلب إن كان محمّلاً في سياقه)"""
+        unit = current_unit()
+        if unit:
+            if unit.defer(('lead', lead_id), updates):
+                return True
+            updates = unit.write_through(('lead', lead_id), updates)
+
+        updated = None
+        client = get_supabase_client()
+        if client:
+            try:
+                with supabase_breaker:
+                    result = client.table('leads').update(updates).eq('id', lead_id).execute()
+                    updated = bool(result.data)
+            except Exception as e:
+                print(f"Error updating lead: {e}")
+
+        if updated is None:
+            updated = local_storage.update('leads', lead_id, updates)
+        if unit and not updated:
+            unit.forget(('lead', lead_id))
+        DatabaseOperations._lead_written(lead_id, updates if updated else None)
+        return updated
+
+    @staticmethod
+    def delete_lead(lead_id: str) -> bool:
+        """حذف عميل"""
+        unit = current_unit()
+        if unit:
+            unit.discard(('lead', lead_id))
+
+        deleted = None
+        client = get_supabase_client()
+        if client:
+            try:
+                with supabase_breaker:
+                    result = client.table('leads').delete().eq('id', lead_id).execute()
+                    deleted = bool(result.data)
+            except Exception as e:
+                print(f"Error deleting lead: {e}")
+
+        if deleted is None:
+            deleted = local_storage.delete('leads', lead_id)
+        DatabaseOperations._lead_written(lead_id)
+        return deleted
+
+    @staticmethod
+    def flush_unit(unit: UnitOfWork):
+        """
+        كتابة التحديثات المؤجلة في سياق الطلب (تحديث واحد لكل كيان)
+
+        Raises:
+            UnitOfWorkError: إن لم يُكتب أي من التحديثات
+        """
+        failed = []
+        for (kind, key), changes in unit.take_pending().items():
+            update = DatabaseOperations.update_user if kind == 'user' else DatabaseOperations.update_lead
+            try:
+                if not update(key, changes):
+                    failed.append(f"{kind}:{key}")
+            except Exception as e:
+                print(f"Error flushing {kind} {key}: {e}")
+                failed.append(f"{kind}:{key}")
+        if failed:
+            raise UnitOfWorkError(f"Deferred writes failed: {', '.join(failed)}")
@@ -0,0 +1,244 @@
+"""
+Event Bus - Bounded Queue and Worker Pool for Event Listeners
+Brilliox Pro CRM v7.0
+"""
+import asyncio
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from typing import Optional, Dict, Any, Callable
+
+from app.core.config import settings
+from app.core.event_metrics import EventMetrics
+
+
+# سياسات الضغط الخلفي عند امتلاء الطابور
+BLOCK = "block"
+DROP_OLDEST = "drop_oldest"
+REJECT = "reject"
+POLICIES = (BLOCK, DROP_OLDEST, REJECT)
+
+
+def _on_event_loop() -> bool:
+    """هل الخيط الحالي ينفذ حلقة asyncio؟"""
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return False
+    return True
+
+
+class Subscription:
+    """مستمع مسجل مع مهلة التنفيذ وسياسة الضغط الخلفي الخاصة به"""
+
+    __slots__ = ("callback", "timeout", "policy", "inline", "replicate", "is_async", "name")
+
+    def __init__(self, callback: Callable, timeout: Optional[float] = None,
+                 policy: Optional[str] = None, inline: bool = False,
+                 replicate: bool = False):
+        if policy is not None and policy not in POLICIES:
+            raise ValueError(f"Unknown backpressure policy: {policy}")
+        self.callback = callback
+        self.timeout = timeout
+        self.policy = policy
+        # ينفذ داخل emit حتى في الوضع غير المتزامن (لمستمعين سريعين يجب أن يسبقوا القراءة التالية)
+        self.inline = inline
+        # يُنفذ أيضاً لأحداث العمليات الأخرى (لمستمعين يحفظون حالة داخل كل عملية)
+        self.replicate = replicate
+        self.is_async = asyncio.iscoroutinefunction(callback)
+        # اسم المستمع في القياسات
+        self.name = f"{getattr(callback, '__module__', None) or '?'}.{getattr(callback, '__qualname__', repr(callback))}"
+
+
+class EventBus:
+    """
+    ناقل أحداث غير متزامن
+
+    كل استدعاء مستمع يوضع كمهمة في طابور محدود الحجم، ويستهلكه عدد ثابت من
+    العمال في الخلفية، فلا يدخل زمن تنفيذ المستمعين في زمن الطلب.
+    لكل عامل حلقة asyncio خاصة به لتنفيذ المستمعين غير المتزامنين مع مهلة،
+    والمستمعون المتزامنون ذوو المهلة يُنفذون في مجمع خيوط حتى يتابع العامل
+    عند تجاوزها.
+
+    عند امتلاء الطابور تُطبق سياسة المستمع (أو السياسة الافتراضية):
+        block: الانتظار حتى block_timeout ثانية ثم الرفض (والرفض فوراً إن
+               كان الإرسال من خيط حلقة asyncio حتى لا تتوقف الحلقة)
+        drop_oldest: إسقاط أقدم مهمة تسمح سياسة مستمعها بالإسقاط، وإلا الرفض
+        reject: رفض المهمة الجديدة
+    """
+
+    def __init__(self, max_size: int = settings.EVENT_QUEUE_SIZE,
+                 workers: int = settings.EVENT_WORKERS,
+                 policy: str = settings.EVENT_QUEUE_POLICY,
+                 listener_timeout: float = settings.EVENT_LISTENER_TIMEOUT,
+                 block_timeout: float = settings.EVENT_BLOCK_TIMEOUT,
+                 metrics: Optional[EventMetrics] = None):
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown backpressure policy: {policy}")
+        self.max_size = max_size
+        self.workers = max(1, workers)
+        self.policy = policy
+        self.listener_timeout = listener_timeout
+        self.block_timeout = block_timeout
+        self.metrics = metrics
+
+        self._cond = threading.Condition()
+        self._queue: deque = deque()
+        self._active = 0
+        self._closed = False
+        self._threads: list = []
+        self._executor: Optional[ThreadPoolExecutor] = None
+
+        self.enqueued = 0
+        self.processed = 0
+        self.dropped = 0
+        self.rejected = 0
+        self.timeouts = 0
+        self.errors = 0
+
+    def submit(self, subscription: Subscription, event, data: Dict[str, Any]) -> bool:
+        """
+        وضع استدعاء مستمع في الطابور
+
+        Returns:
+            False إن رُفضت المهمة بسبب امتلاء الطابور أو إغلاق الناقل
+        """
+        policy = subscription.policy or self.policy
+        if policy == BLOCK and _on_event_loop():
+            policy = REJECT
+        with self._cond:
+            if self._closed:
+                self.rejected += 1
+                return False
+            if not self._threads:
+                self._start()
+
+            if len(self._queue) >= self.max_size:
+                if policy == BLOCK:
+                    deadline = time.monotonic() + self.block_timeout
+                    while len(self._queue) >= self.max_size and not self._closed:
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            break
+                        self._cond.wait(remaining)
+                if policy == DROP_OLDEST and self._drop_oldest():
+                    self.dropped += 1
+                elif len(self._queue) >= self.max_size or self._closed:
+                    self.rejected += 1
+                    return False
+
+            self._queue.append((subscription, event, data))
+            self.enqueued += 1
+            self._cond.notify_all()
+        return True
+
+    def _drop_oldest(self) -> bool:
+        """إسقاط أقدم مهمة لمستمع سياسته drop_oldest (يُستدعى تحت القفل)"""
+        for position, (subscription, _, _) in enumerate(self._queue):
+            if (subscription.policy or self.policy) == DROP_OLDEST:
+                del self._queue[position]
+                return True
+        return False
+
+    def _start(self):
+        """تشغيل العمال (يُستدعى تحت القفل)"""
+        self._executor = ThreadPoolExecutor(
+            max_workers=self.workers, thread_name_prefix="event-listener"
+        )
+        for index in range(self.workers):
+            thread = threading.Thread(
+                target=self._worker, name=f"event-worker-{index}", daemon=True
+            )
+            thread.start()
+            self._threads.append(thread)
+
+    def _worker(self):
+        """حلقة العامل: سحب المهام وتنفيذها حتى إغلاق الناقل وتفريغ الطابور"""
+        loop = asyncio.new_event_loop()
+        try:
+            while True:
+                with self._cond:
+                    while not self._queue and not self._closed:
+                        self._cond.wait()
+                    if not self._queue:
+                        return
+                    subscription, event, data = self._queue.popleft()
+                    self._active += 1
+                    # إفساح مكان لمنتج ينتظر (سياسة block)
+                    self._cond.notify_all()
+                try:
+                    self._run(loop, subscription, event, data)
+                finally:
+                    with self._cond:
+                        self._active -= 1
+                        self.processed += 1
+                        self._cond.notify_all()
+        finally:
+            loop.close()
+
+    def _run(self, loop, subscription: Subscription, event, data: Dict[str, Any]):
+        """تنفيذ مستمع واحد مع مهلته"""
+        timeout = subscription.timeout if subscription.timeout is not None else self.listener_timeout
+        error = timed_out = False
+        started = time.perf_counter()
+        try:
+            if subscription.is_async:
+                loop.run_until_complete(
+                    asyncio.wait_for(subscription.callback(event, data), timeout or None)
+                )
+            elif timeout:
+                future = self._executor.submit(subscription.callback, event, data)
+                future.result(timeout)
+            else:
+                subscription.callback(event, data)
+        except (asyncio.TimeoutError, FutureTimeoutError):
+            self.timeouts += 1
+            timed_out = True
+            print(f"Event listener timed out after {timeout}s: {subscription.name}")
+        except Exception as e:
+            self.errors += 1
+            error = True
+            print(f"Error in event listener {subscription.name}: {e}")
+        if self.metrics is not None:
+            self.metrics.observe_listener(
+                subscription.name, time.perf_counter() - started, error=error, timeout=timed_out
+            )
+
+    def drain(self, timeout: Optional[float] = None) -> bool:
+        """انتظار تنفيذ كل المهام الموجودة في الطابور (للاختبارات والإيقاف)"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            while self._queue or self._active:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+        return True
+
+    def close(self, timeout: Optional[float] = 5.0):
+        """إيقاف استقبال المهام وانتظار العمال حتى تفريغ الطابور"""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+            threads = list(self._threads)
+        for thread in threads:
+            thread.join(timeout)
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+
+    def stats(self) -> Dict[str, Any]:
+        """إحصائيات الناقل"""
+        return {
+            "queued": len(self._queue),
+            "max_size": self.max_size,
+            "workers": self.workers,
+            "policy": self.policy,
+            "enqueued": self.enqueued,
+            "processed": self.processed,
+            "dropped": self.dropped,
+            "rejected": self.rejected,
+            "timeouts": self.timeouts,
+            "errors": self.errors
+        }
+
@@ -0,0 +1,352 @@
+"""
+Event Log - Segmented Append-Only Event Log with Sparse Time Index
+Brilliox Pro CRM v7.0
+"""
+import bisect
+import json
+import os
+import threading
+import time
+from typing import Optional, Dict, List, Any, Iterator
+
+from app.core.config import settings
+
+try:
+    import fcntl
+except ImportError:  # بدون أقفال ملفات (ويندوز): عملية واحدة تكتب السجل
+    fcntl = None
+
+
+class Segment:
+    """
+    مقطع واحد من سجل الأحداث
+
+    ملف JSON Lines اسمه وقت أول حدث فيه، وبجانبه ملف فهرس متفرق (.idx)
+    يحوي سطراً "وقت إزاحة" لكل index_every حدث.
+    """
+
+    __slots__ = ("path", "start", "times", "offsets", "size", "since_index", "last_ts")
+
+    def __init__(self, path: str, start: float):
+        self.path = path
+        self.start = start
+        self.times: List[float] = []
+        self.offsets: List[int] = []
+        self.size = 0
+        self.since_index = 0
+        self.last_ts = start
+
+    @property
+    def index_path(self) -> str:
+        return self.path[:-len(".jsonl")] + ".idx"
+
+    def seek_offset(self, since: Optional[float]) -> int:
+        """أكبر إزاحة مفهرسة لا يتجاوز وقتها since"""
+        if since is None or not self.times:
+            return 0
+        position = bisect.bisect_right(self.times, since) - 1
+        return self.offsets[position] if position >= 0 else 0
+
+
+class EventLog:
+    """
+    سجل أحداث دائم مقسم إلى مقاطع حسب الزمن والحجم
+
+    الكتابة إضافة سطر إلى المقطع النشط فقط (مع تخزين مؤقت، تُفرغ عند flush).
+    يبدأ مقطع جديد عند تجاوز segment_bytes أو segment_seconds، وتُحذف
+    المقاطع التي انتهت قبل مدة الاحتفاظ. الاستعلام الزمني يختار المقاطع
+    من أسمائها ثم يقفز داخل أولها بالفهرس المتفرق دون قراءة السجل كاملاً.
+
+    كل عملية تحجز مجلداً خاصاً بها (worker-N) داخل المجلد المشترك بقفل
+    ملف، فلا تكتب عمليتان في نفس المقطع ولا تحذف عملية مقاطع غيرها. العملية
+    التي تُعاد تشغيلها تحجز أول مجلد متاح فتكمل سجله.
+    """
+
+    def __init__(self, directory: str = settings.EVENT_LOG_DIR,
+                 segment_bytes: int = settings.EVENT_LOG_SEGMENT_BYTES,
+                 segment_seconds: float = settings.EVENT_LOG_SEGMENT_SECONDS,
+                 index_every: int = settings.EVENT_LOG_INDEX_EVERY,
+                 retention_days: float = settings.EVENT_LOG_RETENTION_DAYS):
+        self.root = directory
+        # مجلد هذه العملية (يُحدد عند أول استخدام)
+        self.directory = directory
+        self.slot: Optional[int] = None
+        self._slot_lock = None
+        self.segment_bytes = segment_bytes
+        self.segment_seconds = segment_seconds
+        self.index_every = max(1, index_every)
+        self.retention = retention_days * 86400
+        self._lock = threading.RLock()
+        self._segments: List[Segment] = []
+        self._file = None
+        self._index_file = None
+        self._loaded = False
+
+    # ==================== التحميل ====================
+
+    def _load(self):
+        """قراءة المقاطع الموجودة وفهارسها (يُستدعى تحت القفل)"""
+        if self._loaded:
+            return
+        self._loaded = True
+        self._claim_slot()
+        if not os.path.isdir(self.directory):
+            return
+
+        for name in sorted(os.listdir(self.directory)):
+            if not (name.startswith("events-") and name.endswith(".jsonl")):
+                continue
+            try:
+                start = int(name[len("events-"):-len(".jsonl")]) / 1000
+            except ValueError:
+                continue
+            segment = Segment(os.path.join(self.directory, name), start)
+            segment.size = os.path.getsize(segment.path)
+            if os.path.exists(segment.index_path):
+                with open(segment.index_path, 'r', encoding='utf-8') as f:
+                    for line in f:
+                        parts = line.split()
+                        if len(parts) == 2:
+                            segment.times.append(float(parts[0]))
+                            segment.offsets.append(int(parts[1]))
+            self._segments.append(segment)
+
+        self._segments.sort(key=lambda s: s.start)
+        for segment in self._segments[:-1]:
+            segment.last_ts = self._read_tail(segment)[0]
+        if self._segments:
+            self._recover_tail(self._segments[-1])
+            self._apply_retention(time.time())
+
+    def _claim_slot(self):
+        """حجز أول مجلد worker-N غير محجوز لعملية أخرى (يُستدعى تحت القفل)"""
+        os.makedirs(self.root, exist_ok=True)
+        slot = 0
+        while True:
+            lock = open(os.path.join(self.root, f"worker-{slot}.lock"), 'a')
+            if fcntl is None:
+                break
+            try:
+                fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                break
+            except OSError:
+                lock.close()
+                slot += 1
+        self._slot_lock = lock
+        self.slot = slot
+        self.directory = os.path.join(self.root, f"worker-{slot}")
+
+        # مقاطع سجل عملية واحدة قبل المجلدات الخاصة تنتقل إلى worker-0
+        if slot == 0:
+            legacy = [name for name in os.listdir(self.root)
+                      if name.startswith("events-") and name.endswith((".jsonl", ".idx"))]
+            if legacy:
+                os.makedirs(self.directory, exist_ok=True)
+                for name in legacy:
+                    os.replace(os.path.join(self.root, name), os.path.join(self.directory, name))
+
+    def _read_tail(self, segment: Segment) -> tuple:
+        """
+        قراءة المقطع بعد آخر إدخال في فهرسه
+
+        Returns:
+            (وقت آخر حدث، نهاية آخر سطر كامل، عدد الأسطر بعد إدخال الفهرس)
+        """
+        position = bisect.bisect_left(segment.offsets, segment.size) - 1
+        offset = segment.offsets[position] if position >= 0 else 0
+        last_ts = segment.times[position] if position >= 0 else segment.start
+        valid_end, count = offset, 0
+        with open(segment.path, 'rb') as f:
+            f.seek(offset)
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break
+                try:
+                    last_ts = max(last_ts, json.loads(line)["ts"])
+                except (ValueError, KeyError):
+                    pass
+                valid_end += len(line)
+                count += 1
+        return last_ts, valid_end, count
+
+    def _recover_tail(self, segment: Segment):
+        """
+        تجهيز المقطع الأخير للإضافة: معرفة وقت آخر حدث فيه، وقص أي سطر ناقص
+        كُتب جزئياً قبل توقف مفاجئ
+        """
+        segment.last_ts, valid_end, segment.since_index = self._read_tail(segment)
+        if valid_end < segment.size:
+            with open(segment.path, 'r+b') as f:
+                f.truncate(valid_end)
+            segment.size = valid_end
+
+        # إدخالات فهرس تشير إلى بيانات لم تصل إلى القرص
+        if segment.offsets and segment.offsets[-1] >= segment.size:
+            keep = bisect.bisect_left(segment.offsets, segment.size)
+            del segment.offsets[keep:], segment.times[keep:]
+            segment.since_index = 0
+            with open(segment.index_path, 'w', encoding='utf-8') as f:
+                f.writelines(f"{ts!r} {offset}\n" for ts, offset in zip(segment.times, segment.offsets))
+
+    # ==================== الكتابة ====================
+
+    def append(self, record: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        إضافة حدث إلى السجل
+
+        يُضاف الحقل ts (ثوانٍ منذ epoch) إن لم يكن موجوداً، ويُضمن تزايده
+        داخل السجل حتى يبقى الفهرس مرتباً.
+        """
+        with self._lock:
+            self._load()
+            active = self._segments[-1] if self._segments else None
+            ts = max(record.get("ts") or time.time(), active.last_ts if active else 0.0)
+
+            if active is None or active.size >= self.segment_bytes or ts - active.start >= self.segment_seconds:
+                active = self._roll(ts)
+                ts = max(ts, active.start)
+            elif self._file is None:
+                self._open(active)
+
+            record["ts"] = ts
+            line = (json.dumps(record, ensure_ascii=False, default=str) + "\n").encode("utf-8")
+
+            if active.since_index == 0 or active.since_index >= self.index_every:
+                active.times.append(ts)
+                active.offsets.append(active.size)
+                self._index_file.write(f"{ts!r} {active.size}\n")
+                active.since_index = 0
+            self._file.write(line)
+            active.size += len(line)
+            active.since_index += 1
+            active.last_ts = ts
+        return record
+
+    def _open(self, segment: Segment):
+        """فتح المقطع النشط للإضافة (يُستدعى تحت القفل)"""
+        self._file = open(segment.path, 'ab')
+        self._index_file = open(segment.index_path, 'a', encoding='utf-8')
+
+    def _roll(self, ts: float) -> Segment:
+        """بدء مقطع جديد وتطبيق مدة الاحتفاظ (يُستدعى تحت القفل)"""
+        self._close_files()
+        os.makedirs(self.directory, exist_ok=True)
+        start_ms = int(ts * 1000)
+        if self._segments and start_ms <= int(self._segments[-1].start * 1000):
+            start_ms = int(self._segments[-1].start * 1000) + 1
+        segment = Segment(os.path.join(self.directory, f"events-{start_ms:015d}.jsonl"), start_ms / 1000)
+        self._segments.append(segment)
+        self._open(segment)
+        self._apply_retention(ts)
+        return segment
+
+    def _apply_retention(self, now: float):
+        """حذف المقاطع التي انتهت قبل مدة الاحتفاظ (عدا المقطع النشط)"""
+        if self.retention <= 0:
+            return
+        cutoff = now - self.retention
+        while len(self._segments) > 1 and self._segments[0].last_ts < cutoff:
+            segment = self._segments.pop(0)
+            for path in (segment.path, segment.index_path):
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+
+    def flush(self):
+        """تفريغ المخزن المؤقت للمقطع النشط إلى القرص"""
+        with self._lock:
+            if self._file is not None:
+                self._file.flush()
+                self._index_file.flush()
+
+    def _close_files(self):
+        if self._file is not None:
+            self._file.close()
+            self._index_file.close()
+            self._file = None
+            self._index_file = None
+
+    def close(self):
+        """إغلاق المقطع النشط وتحرير مجلد العملية (الاستخدام التالي يعيد التحميل)"""
+        with self._lock:
+            self._close_files()
+            if self._slot_lock is not None:
+                self._slot_lock.close()
+                self._slot_lock = None
+            self._segments = []
+            self._loaded = False
+
+    # ==================== القراءة ====================
+
+    def history(self, since: Optional[float] = None, until: Optional[float] = None,
+                event_type: Optional[str] = None, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        """
+        الأحداث بين وقتين (ثوانٍ منذ epoch) بترتيب زمني
+
+        Args:
+            since: من (شامل)
+            until: إلى (شامل)
+            event_type: قيمة نوع الحدث (مثل "lead_added")
+            limit: أقصى عدد نتائج (الأقدم أولاً)
+        """
+        results = []
+        for record in self._scan(since, until):
+            if event_type is not None and record.get("event") != event_type:
+                continue
+            results.append(record)
+            if limit is not None and len(results) >= limit:
+                break
+        return results
+
+    def _scan(self, since: Optional[float], until: Optional[float]) -> Iterator[Dict[str, Any]]:
+        """قراءة السجلات في النطاق من المقاطع المعنية فقط"""
+        with self._lock:
+            self._load()
+            if self._file is not None:
+                self._file.flush()
+                self._index_file.flush()
+            segments = list(self._segments)
+            # الحجم الحالي حتى لا تُقرأ إضافات تحدث أثناء القراءة
+            sizes = [segment.size for segment in segments]
+
+        starts = [segment.start for segment in segments]
+        first = 0 if since is None else max(0, bisect.bisect_right(starts, since) - 1)
+        for position in range(first, len(segments)):
+            segment = segments[position]
+            if until is not None and segment.start > until:
+                return
+            offset = segment.seek_offset(since) if position == first else 0
+            try:
+                f = open(segment.path, 'rb')
+            except FileNotFoundError:
+                # حُذف بسبب مدة الاحتفاظ أثناء القراءة
+                continue
+            with f:
+                f.seek(offset)
+                while offset < sizes[position]:
+                    line = f.readline()
+                    if not line:
+                        break
+                    offset += len(line)
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        continue
+                    ts = record.get("ts", 0)
+                    if since is not None and ts < since:
+                        continue
+                    if until is not None and ts > until:
+                        return
+                    yield record
+
+    def stats(self) -> Dict[str, Any]:
+        """إحصائيات السجل"""
+        with self._lock:
+            self._load()
+            return {
+                "slot": self.slot,
+                "segments": len(self._segments),
+                "bytes": sum(segment.size for segment in self._segments),
+                "oldest": self._segments[0].start if self._segments else None
+            }
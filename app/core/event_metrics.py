@@ -0,0 +1,141 @@
+"""
+Event Metrics - Listener, Rule and Persistence Instrumentation
+Brilliox Pro CRM v7.0
+"""
+import bisect
+import threading
+from typing import Dict, Any, Optional
+
+
+# حدود فئات المدرج التكراري بالثواني (الفئة الأخيرة لما يتجاوزها)
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class LatencyHistogram:
+    """مدرج تكراري ثابت الفئات للمدد مع عدادات الأخطاء والمهلات"""
+
+    __slots__ = ("counts", "count", "total", "max", "errors", "timeouts")
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.errors = 0
+        self.timeouts = 0
+
+    def observe(self, seconds: float):
+        self.counts[bisect.bisect_left(BUCKETS, seconds)] += 1
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def quantile(self, q: float) -> float:
+        """تقدير النسبة المئوية بالحد الأعلى لفئتها (بالثواني)"""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for position, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank:
+                return BUCKETS[position] if position < len(BUCKETS) else self.max
+        return self.max
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "count": self.count,
+            "errors": self.errors,
+            "timeouts": self.timeouts,
+            "total_ms": round(self.total * 1000, 3),
+            "avg_ms": round(self.total / self.count * 1000, 3) if self.count else 0.0,
+            "max_ms": round(self.max * 1000, 3),
+            "p50_ms": round(self.quantile(0.5) * 1000, 3),
+            "p95_ms": round(self.quantile(0.95) * 1000, 3),
+            "p99_ms": round(self.quantile(0.99) * 1000, 3),
+            "buckets_ms": {
+                (f"{bound * 1000:g}" if position < len(BUCKETS) else "+Inf"): count
+                for position, (bound, count) in enumerate(zip(BUCKETS + (None,), self.counts))
+                if count
+            }
+        }
+
+
+class EventMetrics:
+    """
+    قياسات نظام الأحداث
+
+    - عدد مرات إرسال كل نوع حدث
+    - مدرج تكراري لمدة كل مستمع مع عدد الاستثناءات والمهلات
+    - مدة التحقق من القواعد (إجمالاً ولكل قاعدة) ومدة حفظ بيانات النظام
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.emits: Dict[str, int] = {}
+        self.listeners: Dict[str, LatencyHistogram] = {}
+        self.rules: Dict[str, LatencyHistogram] = {}
+        self.check_rules = LatencyHistogram()
+        self.save = LatencyHistogram()
+
+    def count_emit(self, event_type: str):
+        with self._lock:
+            self.emits[event_type] = self.emits.get(event_type, 0) + 1
+
+    def observe_listener(self, name: str, seconds: float, error: bool = False, timeout: bool = False):
+        self._observe(self.listeners, name, seconds, error, timeout)
+
+    def observe_rule(self, rule_id: str, seconds: float, error: bool = False):
+        self._observe(self.rules, rule_id, seconds, error, False)
+
+    def observe_check_rules(self, seconds: float):
+        with self._lock:
+            self.check_rules.observe(seconds)
+
+    def observe_save(self, seconds: float, error: bool = False):
+        with self._lock:
+            self.save.observe(seconds)
+            if error:
+                self.save.errors += 1
+
+    def _observe(self, table: Dict[str, LatencyHistogram], name: str, seconds: float,
+                 error: bool, timeout: bool):
+        with self._lock:
+            histogram = table.get(name)
+            if histogram is None:
+                histogram = table[name] = LatencyHistogram()
+            histogram.observe(seconds)
+            if error:
+                histogram.errors += 1
+            if timeout:
+                histogram.timeouts += 1
+
+    def snapshot(self, top: Optional[int] = None) -> Dict[str, Any]:
+        """
+        القياسات الحالية - المستمعون والقواعد مرتبون حسب إجمالي الوقت
+
+        Args:
+            top: عدد المستمعين والقواعد الأبطأ المعروضين (None للجميع)
+        """
+        with self._lock:
+            def ranked(table: Dict[str, LatencyHistogram]) -> Dict[str, Any]:
+                names = sorted(table, key=lambda name: table[name].total, reverse=True)
+                return {name: table[name].snapshot() for name in names[:top]}
+
+            return {
+                "emits": dict(self.emits),
+                "listeners": ranked(self.listeners),
+                "rules": ranked(self.rules),
+                "check_rules": self.check_rules.snapshot(),
+                "save": self.save.snapshot()
+            }
+
+    def reset(self):
+        """تصفير القياسات"""
+        with self._lock:
+            self.emits.clear()
+            self.listeners.clear()
+            self.rules.clear()
+            self.check_rules = LatencyHistogram()
+            self.save = LatencyHistogram()
@@ -0,0 +1,117 @@
+"""
+Event Transport - Cross-Process Event Fan-Out
+Brilliox Pro CRM v7.0
+"""
+import json
+import threading
+from abc import ABC, abstractmethod
+from typing import Optional, Dict, Any, Callable, List
+
+from app.core.config import settings
+
+
+Handler = Callable[[Dict[str, Any]], None]
+
+
+class EventTransport(ABC):
+    """
+    واجهة نقل الأحداث بين العمليات
+
+    كل عملية تنشر رسائلها (أحداث، أنماط، تحديثات الحالة) وتستقبل رسائل
+    العمليات الأخرى عبر handler. الرسائل قواميس قابلة للتحويل إلى JSON
+    وتحمل id و origin.
+    """
+
+    @abstractmethod
+    def start(self, handler: Handler):
+        """بدء الاستقبال"""
+
+    @abstractmethod
+    def publish(self, message: Dict[str, Any]):
+        """نشر رسالة لبقية العمليات"""
+
+    def close(self):
+        """إيقاف النقل"""
+
+    def stats(self) -> Dict[str, Any]:
+        return {"transport": type(self).__name__}
+
+
+class MemoryHub:
+    """موزع رسائل داخل العملية (بديل Redis للاختبارات والتشغيل المحلي)"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscribers: List["MemoryTransport"] = []
+
+    def subscribe(self, transport: "MemoryTransport"):
+        with self._lock:
+            self._subscribers.append(transport)
+
+    def unsubscribe(self, transport: "MemoryTransport"):
+        with self._lock:
+            if transport in self._subscribers:
+                self._subscribers.remove(transport)
+
+    def broadcast(self, payload: str):
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for transport in subscribers:
+            transport._deliver(payload)
+
+
+# الموزع الافتراضي لـ EVENT_TRANSPORT=memory
+default_hub = MemoryHub()
+
+
+class MemoryTransport(EventTransport):
+    """
+    نقل عبر MemoryHub
+
+    الرسائل تمر بتحويل JSON كما في Redis، وتصل لكل المشتركين بما فيهم
+    المرسل نفسه (يتجاهلها المستقبل حسب origin).
+    """
+
+    def __init__(self, hub: Optional[MemoryHub] = None):
+        self.hub = hub or default_hub
+        self._handler: Optional[Handler] = None
+        self.published = 0
+        self.received = 0
+
+    def start(self, handler: Handler):
+        self._handler = handler
+        self.hub.subscribe(self)
+
+    def publish(self, message: Dict[str, Any]):
+        self.published += 1
+        self.hub.broadcast(json.dumps(message, ensure_ascii=False, default=str))
+
+    def _deliver(self, payload: str):
+        if self._handler is None:
+            return
+        self.received += 1
+        try:
+            self._handler(json.loads(payload))
+        except Exception as e:
+            print(f"Error handling event message: {e}")
+
+    def close(self):
+        self.hub.unsubscribe(self)
+        self._handler = None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "transport": "memory",
+            "published": self.published,
+            "received": self.received
+        }
+
+
+def create_event_transport() -> Optional[EventTransport]:
+    """إنشاء نقل الأحداث حسب EVENT_TRANSPORT (redis أو memory أو none)"""
+    if settings.EVENT_TRANSPORT == "redis":
+        from app.core.redis_transport import RedisTransport
+        return RedisTransport(settings.REDIS_URL, settings.EVENT_CHANNEL)
+    if settings.EVENT_TRANSPORT == "memory":
+        return MemoryTransport()
+    return None
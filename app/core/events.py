@@ -2,14 +2,28 @@
 نظام الأحداث الموحد - Event-Driven Architecture
 Brilliox Pro CRM v7.0
 """
-from typing import Dict, List, Optional, Any, Callable
+from typing import Dict, List, Optional, Any, Callable, Union
 from enum import Enum
 from datetime import datetime
 import asyncio
+import atexit
 import json
 import os
+import socket
+import threading
+import time
+import uuid
+from collections import OrderedDict, deque
 from pathlib import Path
 
+from app.core.config import settings
+from app.core.event_bus import EventBus, Subscription
+from app.core.event_log import EventLog
+from app.core.event_metrics import EventMetrics
+from app.core.pattern_store import PatternStore
+from app.core.event_transport import EventTransport, create_event_transport
+from app.core.rules import ANY_EVENT, build_rule_index, is_declarative, serialize_rule
+
 
 class SystemEvent(Enum):
     """أحداث النظام الرئيسية"""
@@ -90,50 +104,182 @@ class UnifiedSystem:
 
     def __init__(self):
         if not UnifiedSystem._initialized:
-            self._listeners: Dict[SystemEvent, List[Callable]] = {}
+            self._listeners: Dict[SystemEvent, List[Subscription]] = {}
             self._state: Dict[str, Any] = {}
             self._rules: List[Dict] = []
-            self._learned_patterns: List[Dict] = []
+            self._rule_index: Dict[Any, List] = {}
+            # الأنماط المتعلمة في مخزن مفهرس يُحفظ في ملف مستقل
+            self._patterns = PatternStore()
             self._active_campaigns: Dict[str, Dict] = {}
-            self._event_history: List[Dict] = []
+            # آخر الأحداث في الذاكرة، والسجل الكامل في مقاطع على القرص
+            self._event_history: deque = deque(maxlen=settings.EVENT_HISTORY_SIZE)
+            self._event_log = EventLog()
             self._data_file = Path("data/system_data.json")
+
+            # الحفظ المؤجل: التعديلات تُعلّم فقط، وخيط خلفي يحفظ كل flush_interval ثانية على الأكثر
+            self._flush_interval = settings.SYSTEM_DATA_FLUSH_SECONDS
+            self._persist_cond = threading.Condition(threading.RLock())
+            self._write_lock = threading.Lock()
+            self._dirty = False
+            self._patterns_pending = False
+            self._closed = False
+            self._version = 0
+            self._saved_version = 0
+            self._last_save = 0.0
+            self._writer: Optional[threading.Thread] = None
+
+            # المستمعون يُنفذون في عمال ناقل الأحداث بدلاً من مسار الطلب
+            self._async_dispatch = settings.EVENT_DISPATCH_MODE == "async"
+            self._metrics = EventMetrics()
+            self._bus = EventBus(metrics=self._metrics)
+
+            # توزيع الأحداث على بقية العمليات (يبدأ عند initialize)
+            self._origin = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+            self._transport: Optional[EventTransport] = None
+            self._seen: "OrderedDict[str, None]" = OrderedDict()
+            self._seen_lock = threading.Lock()
+
             self._load_data()
+            atexit.register(self.close)
             UnifiedSystem._initialized = True
 
     def _load_data(self):
         """تحميل البيانات المحفوظة"""
+        patterns_loaded = self._patterns.load()
         try:
             if self._data_file.exists():
                 with open(self._data_file, 'r', encoding='utf-8') as f:
                     data = json.load(f)
                     self._state = data.get('state', {})
-                    self._rules = data.get('rules', [])
-                    self._learned_patterns = data.get('patterns', [])
+                    self._rules = self._restore_rules(data.get('rules', []))
+                    self._rebuild_rule_index()
+                    # الأنماط كانت تُحفظ في نفس الملف قبل المخزن المستقل
+                    if not patterns_loaded:
+                        self._patterns.extend(data.get('patterns', []))
         except Exception as e:
             print(f"Error loading system data: {e}")
 
-    def _save_data(self):
-        """حفظ البيانات"""
+    def _restore_rules(self, saved: List[Dict]) -> List[Dict]:
+        """استعادة القواعد المحفوظة الصالحة فقط"""
+        rules = []
+        for rule in saved:
+            # القواعد القديمة المحفوظة بدون شروط لا يمكن استعادتها
+            if not is_declarative(rule):
+                continue
+            try:
+                build_rule_index([rule], SystemEvent)
+            except ValueError as e:
+                print(f"Skipping invalid rule {rule.get('id')}: {e}")
+                continue
+            rules.append(rule)
+        return rules
+
+    def _serialize(self) -> str:
+        """تسلسل البيانات المحفوظة (يُستدعى تحت القفل)"""
+        # القواعد ذات الشروط كدوال لا يمكن تسلسلها
+        serializable_rules = [serialize_rule(r) for r in self._rules if is_declarative(r)]
+
+        data = {
+            'state': self._state,
+            'rules': serializable_rules
+        }
+        return json.dumps(data, ensure_ascii=False, indent=2, default=str)
+
+    def _mark_dirty(self):
+        """تعليم البيانات كمعدلة - الحفظ الفعلي يتم لاحقاً في خيط الخلفية"""
+        with self._persist_cond:
+            self._version += 1
+            if self._dirty:
+                return
+            self._dirty = True
+            self._wake_writer()
+
+    def _mark_patterns_dirty(self):
+        """جدولة حفظ مخزن الأنماط دون إعادة كتابة بيانات النظام"""
+        with self._persist_cond:
+            if self._patterns_pending:
+                return
+            self._patterns_pending = True
+            self._wake_writer()
+
+    def _wake_writer(self):
+        """تشغيل خيط الحفظ أو إيقاظه (يُستدعى تحت القفل)"""
+        if self._writer is None and not self._closed:
+            self._writer = threading.Thread(
+                target=self._persist_loop, name="system-data-writer", daemon=True
+            )
+            self._writer.start()
+        self._persist_cond.notify()
+
+    def _persist_loop(self):
+        """خيط الحفظ: ينتظر التعديلات ثم يحفظ مرة واحدة لكل فترة"""
+        while True:
+            with self._persist_cond:
+                while not (self._dirty or self._patterns_pending) and not self._closed:
+                    self._persist_cond.wait()
+                if self._closed:
+                    return
+                remaining = self._last_save + self._flush_interval - time.monotonic()
+                if remaining > 0:
+                    self._persist_cond.wait(remaining)
+                    continue
+            self.flush()
+
+    def flush(self) -> None:
+        """حفظ التعديلات المعلقة فوراً (كتابة ذرية عبر ملف مؤقت ثم rename)"""
         try:
-            # إنشاء نسخة من القواعد بدون الدوال (لأنها لا يمكن تسلسلها)
-            serializable_rules = []
-            for rule in self._rules:
-                serializable_rule = {
-                    'id': rule.get('id'),
-                    'name': rule.get('name'),
-                    'action': rule.get('action')
-                }
-                serializable_rules.append(serializable_rule)
-
-            data = {
-                'state': self._state,
-                'rules': serializable_rules,
-                'patterns': self._learned_patterns
-            }
-            with open(self._data_file, 'w', encoding='utf-8') as f:
-                json.dump(data, f, ensure_ascii=False, indent=2)
-        except Exception as e:
-            print(f"Error saving system data: {e}")
+            self._event_log.flush()
+        except OSError as e:
+            print(f"Error flushing event log: {e}")
+        with self._persist_cond:
+            if self._patterns_pending:
+                self._patterns_pending = False
+                self._last_save = time.monotonic()
+        self._patterns.flush()
+        started = time.perf_counter()
+        with self._persist_cond:
+            if not self._dirty:
+                return
+            try:
+                payload = self._serialize()
+            except Exception as e:
+                print(f"Error saving system data: {e}")
+                self._metrics.observe_save(time.perf_counter() - started, error=True)
+                return
+            version = self._version
+            self._dirty = False
+            self._last_save = time.monotonic()
+
+        with self._write_lock:
+            # حفظ متزامن أحدث سبقنا إلى الملف
+            if version <= self._saved_version:
+                return
+            temp_file = self._data_file.with_name(self._data_file.name + ".tmp")
+            error = False
+            try:
+                self._data_file.parent.mkdir(parents=True, exist_ok=True)
+                with open(temp_file, 'w', encoding='utf-8') as f:
+                    f.write(payload)
+                os.replace(temp_file, self._data_file)
+                self._saved_version = version
+            except Exception as e:
+                print(f"Error saving system data: {e}")
+                error = True
+                with self._persist_cond:
+                    self._dirty = True
+        self._metrics.observe_save(time.perf_counter() - started, error=error)
+
+    def close(self) -> None:
+        """إيقاف ناقل الأحداث وخيط الحفظ بعد حفظ التعديلات المعلقة"""
+        if self._transport is not None:
+            self._transport.close()
+        self._bus.close()
+        with self._persist_cond:
+            self._closed = True
+            self._persist_cond.notify_all()
+        self.flush()
+        self._patterns.flush(force=True)
+        self._event_log.close()
 
     def initialize(self):
         """تهيئة النظام"""
@@ -146,34 +292,126 @@ class UnifiedSystem:
             "conversion_rate": 0.0,
             "system_status": "ready"
         }
-        self._rules = self._load_default_rules()
-        self._listeners = {event: [] for event in SystemEvent}
-        self._save_data()
+        # القواعد المحفوظة تحل محل الافتراضية ذات نفس المعرف
+        saved_rules = {rule.get("id"): rule for rule in self._rules}
+        defaults = self._load_default_rules()
+        self._rules = [saved_rules.pop(rule["id"], rule) for rule in defaults]
+        self._rules.extend(saved_rules.values())
+        self._rebuild_rule_index()
+        # المستمعون المسجلون عند الاستيراد (مثل الإسقاطات) يبقون بعد التهيئة
+        for event in SystemEvent:
+            self._listeners.setdefault(event, [])
+        if self._transport is None:
+            try:
+                self.set_transport(create_event_transport())
+            except Exception as e:
+                print(f"Event transport unavailable, events stay in this process: {e}")
+        self._mark_dirty()
         print("System initialized successfully")
 
+    def set_transport(self, transport: Optional[EventTransport]) -> None:
+        """تبديل نقل الأحداث بين العمليات (None لإيقافه)"""
+        if self._transport is not None:
+            self._transport.close()
+        self._transport = transport
+        if transport is not None:
+            transport.start(self._receive)
+
+    def _publish(self, kind: str, **payload) -> None:
+        """نشر رسالة لبقية العمليات"""
+        if self._transport is None:
+            return
+        message = {"kind": kind, "id": payload.pop("id", None) or uuid.uuid4().hex,
+                   "origin": self._origin, **payload}
+        try:
+            self._transport.publish(message)
+        except Exception as e:
+            print(f"Error publishing {kind} message: {e}")
+
+    def _first_delivery(self, message_id: str) -> bool:
+        """هل هذه أول مرة تصل فيها الرسالة؟ (معرفات آخر EVENT_DEDUP_SIZE رسالة)"""
+        with self._seen_lock:
+            if message_id in self._seen:
+                return False
+            self._seen[message_id] = None
+            if len(self._seen) > settings.EVENT_DEDUP_SIZE:
+                self._seen.popitem(last=False)
+            return True
+
+    def _receive(self, message: Dict[str, Any]) -> None:
+        """
+        تطبيق رسالة من عملية أخرى
+
+        الأحداث تُحدّث الحالة والتاريخ وسجل الأحداث وتُنفذ المستمعين ذوي
+        replicate فقط؛ بقية المستمعين والقواعد نُفذت مرة واحدة في العملية
+        المرسلة. يُستدعى من خيط النقل.
+        """
+        if message.get("origin") == self._origin or not self._first_delivery(message.get("id")):
+            return
+
+        kind = message.get("kind")
+        if kind == "event":
+            try:
+                event = SystemEvent(message["event"])
+            except ValueError:
+                return
+            data = message.get("data") or {}
+            self._record_event({
+                "id": message["id"],
+                "event": event.value,
+                "data": data,
+                "timestamp": datetime.fromtimestamp(message["ts"]).isoformat(),
+                "ts": message["ts"]
+            })
+            self._mark_dirty()
+            for subscription in self._listeners.get(event, []):
+                if subscription.replicate:
+                    self._dispatch(subscription, event, data)
+        elif kind == "pattern":
+            self._add_pattern(message["pattern"])
+        elif kind == "state":
+            with self._persist_cond:
+                self._state[message["key"]] = message["value"]
+            self._mark_dirty()
+
     def _load_default_rules(self) -> List[Dict]:
         """تحميل القواعد الافتراضية"""
         return [
             {
                 "id": "auto_score_new_leads",
                 "name": "تقييم العملاء الجدد تلقائياً",
-                "condition": lambda data: data.get("event") == SystemEvent.LEAD_ADDED,
+                "event": SystemEvent.LEAD_ADDED.value,
+                "conditions": {},
                 "action": "score_lead"
             },
             {
                 "id": "notify_admin_on_hot_lead",
                 "name": "إشعار الأدمن عند عميل ساخن",
-                "condition": lambda data: data.get("stage") == "hot",
+                "event": ANY_EVENT,
+                "conditions": {"stage": "hot"},
                 "action": "notify_admin"
             }
         ]
 
-    def on(self, event: SystemEvent) -> Callable:
-        """ديكوريتور للتسجيل في الأحداث"""
+    def on(self, event: SystemEvent, timeout: Optional[float] = None,
+           policy: Optional[str] = None, inline: bool = False,
+           replicate: bool = False) -> Callable:
+        """
+        ديكوريتور للتسجيل في الأحداث
+
+        Args:
+            event: الحدث
+            timeout: مهلة تنفيذ المستمع بالثواني (الافتراضي EVENT_LISTENER_TIMEOUT)
+            policy: سياسة امتلاء الطابور (block, drop_oldest, reject)
+            inline: التنفيذ داخل emit دون المرور بناقل الأحداث
+            replicate: التنفيذ أيضاً لأحداث العمليات الأخرى (وإلا يُنفذ المستمع
+                       مرة واحدة لكل حدث في العملية التي أرسلته)
+        """
         def decorator(func: Callable):
+            subscription = Subscription(func, timeout, policy, inline, replicate)
             if event not in self._listeners:
                 self._listeners[event] = []
-            self._listeners[event].append(func)
+            self._listeners[event].append(subscription)
             return func
         return decorator
 
@@ -182,44 +420,96 @@ class UnifiedSystem:
         if event not in self._listeners:
             return
 
-        self._state["total_events"] += 1
+        self._metrics.count_emit(event.value)
+        now = time.time()
         event_record = {
+            "id": uuid.uuid4().hex,
             "event": event.value,
             "data": data,
-            "timestamp": datetime.now().isoformat()
+            "timestamp": datetime.fromtimestamp(now).isoformat(),
+            "ts": now
         }
-        self._event_history.append(event_record)
-
-        # الاحتفاظ بـ 1000 حدث فقط في التاريخ
-        if len(self._event_history) > 1000:
-            self._event_history = self._event_history[-1000:]
+        self._record_event(event_record)
 
-        # تنفيذ المستمعين بشكل متزامن
-        for callback in self._listeners[event]:
-            try:
-                if asyncio.iscoroutinefunction(callback):
-                    asyncio.create_task(callback(event, data))
-                else:
-                    callback(event, data)
-            except Exception as e:
-                print(f"Error in event listener: {e}")
+        for subscription in self._listeners[event]:
+            self._dispatch(subscription, event, data)
 
         # التحقق من القواعد
         self._check_rules(event, data)
-        self._save_data()
+        self._mark_dirty()
+        self._publish("event", id=event_record["id"], event=event.value, data=data, ts=event_record["ts"])
+
+    def _record_event(self, record: Dict[str, Any]) -> None:
+        """
+        عد الحدث وإضافته إلى سجل الأحداث وآخر الأحداث
+
+        كل عملية تسجل كل حدث تطبقه (أحداثها وأحداث العمليات الأخرى) في
+        مجلد سجلها الخاص، فيطابق سجلها على القرص تاريخها في الذاكرة.
+        """
+        try:
+            self._event_log.append(record)
+        except OSError as e:
+            print(f"Error writing event log: {e}")
+        with self._persist_cond:
+            self._state["total_events"] = self._state.get("total_events", 0) + 1
+            self._event_history.append(record)
+
+    def _dispatch(self, subscription: Subscription, event: SystemEvent, data: Dict[str, Any]) -> None:
+        """تنفيذ مستمع عبر ناقل الأحداث أو مباشرة حسب الوضع"""
+        if self._async_dispatch and not subscription.inline:
+            self._bus.submit(subscription, event, data)
+        else:
+            self._dispatch_inline(subscription, event, data)
+
+    def _dispatch_inline(self, subscription: Subscription, event: SystemEvent, data: Dict[str, Any]) -> None:
+        """تنفيذ مستمع داخل مسار الطلب (EVENT_DISPATCH_MODE=sync أو inline)"""
+        error = False
+        started = time.perf_counter()
+        try:
+            if subscription.is_async:
+                coroutine = subscription.callback(event, data)
+                try:
+                    asyncio.get_running_loop().create_task(coroutine)
+                except RuntimeError:
+                    # لا توجد حلقة أحداث نشطة في هذا الخيط
+                    asyncio.run(coroutine)
+            else:
+                subscription.callback(event, data)
+        except Exception as e:
+            error = True
+            print(f"Error in event listener {subscription.name}: {e}")
+        self._metrics.observe_listener(subscription.name, time.perf_counter() - started, error=error)
+
+    def drain(self, timeout: Optional[float] = None) -> bool:
+        """انتظار انتهاء المستمعين المعلقين في ناقل الأحداث"""
+        return self._bus.drain(timeout)
+
+    def _rebuild_rule_index(self) -> None:
+        """ترجمة القواعد إلى دوال وفهرستها حسب نوع الحدث"""
+        self._rule_index = build_rule_index(self._rules, SystemEvent)
 
     def _check_rules(self, event: SystemEvent, data: Dict[str, Any]) -> None:
-        """التحقق من القواعد وتنفيذ الإجراءات"""
-        for rule in self._rules:
+        """التحقق من القواعد المرتبطة بالحدث فقط وتنفيذ الإجراءات"""
+        candidates = self._rule_index.get(event, []) + self._rule_index.get(ANY_EVENT, [])
+        if not candidates:
+            return
+        context = {"event": event, **data}
+        check_started = time.perf_counter()
+        for rule, condition in candidates:
+            error = False
+            started = time.perf_counter()
             try:
-                if rule["condition"]({"event": event, **data}):
+                if condition(context):
                     action = rule.get("action")
                     if action == "score_lead":
                         self._auto_score_lead(data)
                     elif action == "notify_admin":
                         self._notify_admin(data)
             except Exception as e:
+                error = True
                 print(f"Error checking rule {rule.get('id')}: {e}")
+            self._metrics.observe_rule(str(rule.get("id")), time.perf_counter() - started, error=error)
+        self._metrics.observe_check_rules(time.perf_counter() - check_started)
 
     def _auto_score_lead(self, data: Dict[str, Any]) -> None:
         """تقييم تلقائي للعميل الجديد"""
@@ -233,27 +523,81 @@ class UnifiedSystem:
         print(f"Notifying admin about hot lead: {lead_id}")
 
     def add_rule(self, rule: Dict) -> None:
-        """إضافة قاعدة جديدة"""
+        """
+        إضافة قاعدة جديدة
+
+        Raises:
+            ValueError: إن كان الحدث أو أحد معاملات الشروط غير معروف
+        """
+        # الترجمة قبل الإضافة حتى لا تدخل قاعدة غير صالحة إلى الفهرس
+        build_rule_index([rule], SystemEvent)
         self._rules.append(rule)
-        self._save_data()
+        self._rebuild_rule_index()
+        self._mark_dirty()
 
     def remove_rule(self, rule_id: str) -> None:
         """حذف قاعدة"""
         self._rules = [r for r in self._rules if r.get("id") != rule_id]
-        self._save_data()
+        self._rebuild_rule_index()
+        self._mark_dirty()
 
     def learn_pattern(self, pattern: Dict) -> None:
-        """تعلم نمط جديد"""
-        pattern["learned_at"] = datetime.now().isoformat()
-        self._learned_patterns.append(pattern)
-        # الاحتفاظ بـ 500 نمط فقط
-        if len(self._learned_patterns) > 500:
-            self._learned_patterns = self._learned_patterns[-500:]
-        self._save_data()
+        """تعلم نمط جديد (يُنشر بنفس المعرف لبقية العمليات)"""
+        pattern = {**pattern, "learned_at": datetime.now().isoformat()}
+        pattern.setdefault("id", uuid.uuid4().hex)
+        self._add_pattern(pattern)
+        self._publish("pattern", pattern=pattern)
+
+    def _add_pattern(self, pattern: Dict) -> None:
+        self._patterns.add(pattern)
+        self._mark_patterns_dirty()
 
     def get_patterns(self) -> List[Dict]:
-        """الحصول على الأنماط المتعلمة"""
-        return self._learned_patterns
+        """الحصول على الأنماط المتعلمة (الأقدم مطابقة أولاً)"""
+        return self._patterns.all()
+
+    def match_patterns(self, text: str, limit: int = 5,
+                       where: Optional[Dict[str, Any]] = None) -> List[Dict]:
+        """الأنماط المتعلمة المطابقة لكلمات نص (مثل رسالة المستخدم)"""
+        return self._patterns.match(text, limit, where)
+
+    def history(self, since: Union[datetime, float, None] = None,
+                until: Union[datetime, float, None] = None,
+                event_type: Union[SystemEvent, str, None] = None,
+                limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        """
+        الأحداث بين وقتين بترتيب زمني
+
+        تُقرأ من الذاكرة إن كان النطاق ضمن آخر الأحداث، وإلا من سجل الأحداث.
+
+        Args:
+            since: من (datetime أو ثوانٍ منذ epoch)
+            until: إلى
+            event_type: نوع الحدث
+            limit: أقصى عدد نتائج
+        """
+        if isinstance(since, datetime):
+            since = since.timestamp()
+        if isinstance(until, datetime):
+            until = until.timestamp()
+        if isinstance(event_type, SystemEvent):
+            event_type = event_type.value
+
+        with self._persist_cond:
+            tail = list(self._event_history)
+        if since is None or not tail or tail[0]["ts"] > since:
+            return self._event_log.history(since, until, event_type, limit)
+
+        results = []
+        for record in tail:
+            if record["ts"] < since or (event_type is not None and record["event"] != event_type):
+                continue
+            if until is not None and record["ts"] > until:
+                break
+            results.append(record)
+            if limit is not None and len(results) >= limit:
+                break
+        return results
 
     def get_state(self) -> Dict[str, Any]:
         """الحصول على حالة النظام"""
@@ -261,18 +605,38 @@ class UnifiedSystem:
 
     def update_state(self, key: str, value: Any) -> None:
         """تحديث حالة النظام"""
-        self._state[key] = value
-        self._save_data()
+        with self._persist_cond:
+            self._state[key] = value
+        self._mark_dirty()
+        self._publish("state", key=key, value=value)
 
     def get_stats(self) -> Dict[str, Any]:
         """الحصول على إحصائيات النظام"""
+        with self._persist_cond:
+            state = dict(self._state)
         return {
-            **self._state,
+            **state,
             "active_rules": len(self._rules),
-            "learned_patterns": len(self._learned_patterns),
-            "event_history_count": len(self._event_history)
+            "learned_patterns": len(self._patterns),
+            "pattern_store": self._patterns.stats(),
+            "event_history_count": len(self._event_history),
+            "event_log": self._event_log.stats(),
+            "event_bus": self._bus.stats(),
+            "transport": self._transport.stats() if self._transport else None,
+            "metrics": self._metrics.snapshot()
         }
 
+    def get_metrics(self, top: Optional[int] = None) -> Dict[str, Any]:
+        """قياسات المستمعين والقواعد والحفظ (الأبطأ أولاً)"""
+        return {
+            **self._metrics.snapshot(top),
+            "event_bus": self._bus.stats()
+        }
+
+    def reset_metrics(self) -> None:
+        """تصفير القياسات"""
+        self._metrics.reset()
+
 
 # إنشاء نسخة واحدة من النظام
 unified_system = UnifiedSystem()
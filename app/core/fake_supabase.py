@@ -0,0 +1,421 @@
+"""
+Fake Supabase - In-Process PostgREST Stand-In for Benchmarks
+Brilliox Pro CRM v7.0
+"""
+import asyncio
+import random
+import threading
+import time
+import uuid
+from typing import Optional, Dict, Any, List
+
+import httpx
+from postgrest.exceptions import APIError
+
+from app.core.config import settings
+
+
+# المفتاح الأساسي لكل جدول (لرفض الإدراج المكرر كما تفعل PostgreSQL)
+PRIMARY_KEYS: Dict[str, str] = {
+    'users': 'username',
+    'leads': 'id',
+    'lead_shares': 'id',
+}
+
+_OPERATORS = {
+    'eq': lambda a, b: a == b,
+    'neq': lambda a, b: a != b,
+    'gt': lambda a, b: a > b,
+    'gte': lambda a, b: a >= b,
+    'lt': lambda a, b: a < b,
+    'lte': lambda a, b: a <= b,
+}
+
+
+def _comparable(row_value: Any, value: Any) -> tuple:
+    """
+    تحويل قيمة الشرط إلى نوع العمود (PostgREST يستقبل كل القيم كنص)
+
+    الأعمدة الرقمية تُقارن كأرقام، وبقية الأعمدة كنص كما في PostgreSQL.
+    """
+    if row_value is None:
+        return None, value
+    if isinstance(row_value, bool):
+        return str(row_value).lower(), str(value).lower()
+    if isinstance(row_value, (int, float)):
+        try:
+            return float(row_value), float(value)
+        except (TypeError, ValueError):
+            pass
+    return str(row_value), str(value)
+
+
+def _split_top_level(text: str) -> List[str]:
+    """تقسيم الشروط بالفواصل خارج الأقواس وعلامات الاقتباس"""
+    parts, depth, quoted, current = [], 0, False, []
+    for char in text:
+        if char == '"':
+            quoted = not quoted
+        elif not quoted and char == '(':
+            depth += 1
+        elif not quoted and char == ')':
+            depth -= 1
+        elif not quoted and depth == 0 and char == ',':
+            parts.append("".join(current))
+            current = []
+            continue
+        current.append(char)
+    if current:
+        parts.append("".join(current))
+    return parts
+
+
+def _parse_logic(text: str):
+    """تحويل شرط or/and بصيغة PostgREST إلى دالة تحقق"""
+    text = text.strip()
+    for combinator, reducer in (('and(', all), ('or(', any)):
+        if text.startswith(combinator) and text.endswith(')'):
+            checks = [_parse_logic(part) for part in _split_top_level(text[len(combinator):-1])]
+            return lambda row: reducer(check(row) for check in checks)
+
+    field, op, value = text.split('.', 2)
+    if op not in _OPERATORS:
+        raise APIError({'code': 'PGRST100', 'message': f'unsupported operator: {op}'})
+    value = value[1:-1] if value.startswith('"') and value.endswith('"') else value
+    return lambda row: _matches(row, field, op, value)
+
+
+def _matches(row: Dict[str, Any], field: str, op: str, value: Any) -> bool:
+    """تحقق شرط واحد على صف"""
+    left, right = _comparable(row.get(field), value)
+    if left is None:
+        return op == 'eq' and value is None
+    return _OPERATORS[op](left, right)
+
+
+class FakePostgREST:
+    """
+    محرك PostgREST داخل العملية مع زمن استجابة وأخطاء مُحقنة
+
+    يُشاركه العميل المتزامن وغير المتزامن، فتُقاس تغييرات التجميع والدفعات
+    والذاكرة المؤقتة بتكرار ثابت دون الحاجة لخدمة Supabase حقيقية.
+    """
+
+    def __init__(self, latency_ms: float = 0.0, jitter_ms: float = 0.0,
+                 error_rate: float = 0.0, seed: Optional[int] = None):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.tables: Dict[str, List[Dict[str, Any]]] = {}
+        self.requests = 0
+        self.failures = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def delay(self) -> float:
+        """زمن الانتظار للطلب التالي (يرفع خطأ اتصال عند حقن الخطأ)"""
+        with self._lock:
+            self.requests += 1
+            delay = (self.latency_ms + self._random.uniform(0, self.jitter_ms)) / 1000
+            failed = self._random.random() < self.error_rate
+            if failed:
+                self.failures += 1
+        if failed:
+            raise httpx.ConnectError("Injected failure (fake Supabase)")
+        return delay
+
+    def run(self, request: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """تنفيذ طلب مبني على الجدول (بعد الانتظار)"""
+        table = request['table']
+        method = request['method']
+        checks = [
+            (lambda row, f=field, o=op, v=value: _matches(row, f, o, v))
+            for field, op, value in request.get('filters', [])
+        ]
+        if request.get('or'):
+            checks.append(_parse_logic(f"or({request['or']})"))
+
+        with self._lock:
+            rows = self.tables.setdefault(table, [])
+            if method == 'insert':
+                return self._insert(table, rows, request['payload'])
+
+            matched = [row for row in rows if all(check(row) for check in checks)]
+            if method == 'update':
+                for row in matched:
+                    row.update(request['payload'])
+                return [dict(row) for row in matched]
+            if method == 'delete':
+                removed = {id(row) for row in matched}
+                self.tables[table] = [row for row in rows if id(row) not in removed]
+                return [dict(row) for row in matched]
+
+            for column, desc in reversed(request.get('order', [])):
+                matched.sort(key=lambda row: (row.get(column) is None, row.get(column)), reverse=desc)
+            if request.get('limit'):
+                matched = matched[:request['limit']]
+            return [self._project(row, request.get('columns', '*')) for row in matched]
+
+    def _insert(self, table: str, rows: List[Dict[str, Any]], payload: Any) -> List[Dict[str, Any]]:
+        """إدراج صف أو عدة صفوف (كلها أو لا شيء)"""
+        new_rows = [dict(item) for item in (payload if isinstance(payload, list) else [payload])]
+        key = PRIMARY_KEYS.get(table, 'id')
+        existing = {row.get(key) for row in rows}
+        for row in new_rows:
+            if key == 'id' and row.get('id') is None:
+                row['id'] = str(uuid.uuid4())[:8]
+            if row.get(key) in existing:
+                raise APIError({
+                    'code': '23505',
+                    'message': f'duplicate key value violates unique constraint "{table}_pkey"'
+                })
+            existing.add(row.get(key))
+        rows.extend(new_rows)
+        return [dict(row) for row in new_rows]
+
+    @staticmethod
+    def _project(row: Dict[str, Any], columns: str) -> Dict[str, Any]:
+        """اختيار الأعمدة المطلوبة"""
+        if not columns or columns == '*':
+            return dict(row)
+        return {column: row.get(column) for column in columns.split(',')}
+
+    def rpc(self, function: str, params: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """تنفيذ دوال قاعدة البيانات المعروفة"""
+        if function == 'lead_counts':
+            return self._lead_counts()
+        if function != 'lead_stats':
+            raise APIError({'code': 'PGRST202', 'message': f'function {function} not found'})
+
+        user_id = params.get('p_user_id')
+        groups: Dict[tuple, Dict[str, Any]] = {}
+        with self._lock:
+            for row in self.tables.get('leads', []):
+                if user_id is not None and row.get('user_id') != user_id:
+                    continue
+                group = groups.setdefault((row.get('status'), row.get('source')), {
+                    'status': row.get('status'), 'source': row.get('source'), 'count': 0, 'score_sum': 0
+                })
+                group['count'] += 1
+                group['score_sum'] += row.get('score') or 0
+        return list(groups.values())
+
+    def _lead_counts(self) -> List[Dict[str, Any]]:
+        """نفس lead_counts: عدد العملاء لكل (مستخدم، حالة، مصدر)"""
+        groups: Dict[tuple, Dict[str, Any]] = {}
+        with self._lock:
+            for row in self.tables.get('leads', []):
+                key = (row.get('user_id'), row.get('status'), row.get('source'))
+                group = groups.setdefault(key, {
+                    'user_id': key[0], 'status': key[1], 'source': key[2], 'count': 0
+                })
+                group['count'] += 1
+        return list(groups.values())
+
+    def stats(self) -> Dict[str, Any]:
+        """عدد الطلبات والأخطاء المحقونة"""
+        return {
+            "requests": self.requests,
+            "failures": self.failures,
+            "rows": {table: len(rows) for table, rows in self.tables.items()}
+        }
+
+
+class FakeResponse:
+    """استجابة بنفس شكل APIResponse"""
+
+    def __init__(self, data: List[Dict[str, Any]]):
+        self.data = data
+        self.count = None
+
+
+class FakeQuery:
+    """بانِي الاستعلام بنفس واجهة postgrest (select/insert/update/delete ثم eq/or_/order/limit)"""
+
+    def __init__(self, backend: FakePostgREST, table: str):
+        self._backend = backend
+        self._request: Dict[str, Any] = {'table': table, 'method': 'select', 'filters': [], 'order': []}
+
+    def select(self, columns: str = '*', *args, **kwargs) -> 'FakeQuery':
+        self._request.update(method='select', columns=columns)
+        return self
+
+    def insert(self, payload: Any, *args, **kwargs) -> 'FakeQuery':
+        self._request.update(method='insert', payload=payload)
+        return self
+
+    def update(self, payload: Dict[str, Any], *args, **kwargs) -> 'FakeQuery':
+        self._request.update(method='update', payload=payload)
+        return self
+
+    def delete(self, *args, **kwargs) -> 'FakeQuery':
+        self._request['method'] = 'delete'
+        return self
+
+    def _filter(self, field: str, op: str, value: Any) -> 'FakeQuery':
+        self._request['filters'].append((field, op, value))
+        return self
+
+    def eq(self, field: str, value: Any) -> 'FakeQuery':
+        return self._filter(field, 'eq', value)
+
+    def neq(self, field: str, value: Any) -> 'FakeQuery':
+        return self._filter(field, 'neq', value)
+
+    def gt(self, field: str, value: Any) -> 'FakeQuery':
+        return self._filter(field, 'gt', value)
+
+    def gte(self, field: str, value: Any) -> 'FakeQuery':
+        return self._filter(field, 'gte', value)
+
+    def lt(self, field: str, value: Any) -> 'FakeQuery':
+        return self._filter(field, 'lt', value)
+
+    def lte(self, field: str, value: Any) -> 'FakeQuery':
+        return self._filter(field, 'lte', value)
+
+    def or_(self, filters: str, *args, **kwargs) -> 'FakeQuery':
+        self._request['or'] = filters
+        return self
+
+    def order(self, column: str, *args, desc: bool = False, **kwargs) -> 'FakeQuery':
+        self._request['order'].append((column, desc))
+        return self
+
+    def limit(self, size: int, *args, **kwargs) -> 'FakeQuery':
+        self._request['limit'] = size
+        return self
+
+    def execute(self) -> FakeResponse:
+        time.sleep(self._backend.delay())
+        return FakeResponse(self._backend.run(self._request))
+
+
+class FakeRPC:
+    """استدعاء دالة قاعدة بيانات مؤجل حتى execute()"""
+
+    def __init__(self, backend: FakePostgREST, function: str, params: Dict[str, Any]):
+        self._backend = backend
+        self._function = function
+        self._params = params
+
+    def execute(self) -> FakeResponse:
+        time.sleep(self._backend.delay())
+        return FakeResponse(self._backend.rpc(self._function, self._params))
+
+
+class FakeSupabaseClient:
+    """بديل supabase.Client المتزامن"""
+
+    def __init__(self, backend: FakePostgREST):
+        self.backend = backend
+
+    def table(self, name: str) -> FakeQuery:
+        return FakeQuery(self.backend, name)
+
+    from_ = table
+
+    def rpc(self, function: str, params: Optional[Dict[str, Any]] = None) -> FakeRPC:
+        return FakeRPC(self.backend, function, params or {})
+
+
+class FakeAsyncSupabaseClient:
+    """بديل AsyncSupabaseClient بنفس الواجهة"""
+
+    def __init__(self, backend: FakePostgREST):
+        self.backend = backend
+
+    async def _run(self, request: Dict[str, Any]) -> List[Dict[str, Any]]:
+        await asyncio.sleep(self.backend.delay())
+        return self.backend.run(request)
+
+    @staticmethod
+    def _filters(filters: Optional[Dict[str, Any]]) -> List[tuple]:
+        return [(field, 'eq', value) for field, value in (filters or {}).items()]
+
+    async def select(self, table: str, filters: Optional[Dict[str, Any]] = None,
+                     columns: str = "*", or_filter: Optional[str] = None,
+                     order: Optional[str] = None, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        ordering = []
+        for part in (order or "").split(","):
+            if part:
+                column, _, direction = part.partition(".")
+                ordering.append((column, direction == "desc"))
+        return await self._run({
+            'table': table, 'method': 'select', 'filters': self._filters(filters),
+            'columns': columns, 'or': or_filter, 'order': ordering, 'limit': limit
+        })
+
+    async def insert(self, table: str, rows: Any) -> List[Dict[str, Any]]:
+        return await self._run({'table': table, 'method': 'insert', 'payload': rows})
+
+    async def update(self, table: str, values: Dict[str, Any],
+                     filters: Dict[str, Any]) -> List[Dict[str, Any]]:
+        return await self._run({
+            'table': table, 'method': 'update', 'payload': values, 'filters': self._filters(filters)
+        })
+
+    async def delete(self, table: str, filters: Dict[str, Any]) -> List[Dict[str, Any]]:
+        return await self._run({'table': table, 'method': 'delete', 'filters': self._filters(filters)})
+
+    async def rpc(self, function: str, params: Dict[str, Any]) -> Any:
+        await asyncio.sleep(self.backend.delay())
+        return self.backend.rpc(function, params)
+
+    async def aclose(self):
+        """لا اتصالات لإغلاقها"""
+
+
+# المحرك المشترك بين العميلين
+_backend: Optional[FakePostgREST] = None
+_backend_lock = threading.Lock()
+
+
+def get_fake_backend() -> FakePostgREST:
+    """المحرك المشترك مُعداً من الإعدادات (SUPABASE_FAKE_*)"""
+    global _backend
+    with _backend_lock:
+        if _backend is None:
+            _backend = FakePostgREST(
+                latency_ms=settings.SUPABASE_FAKE_LATENCY_MS,
+                jitter_ms=settings.SUPABASE_FAKE_JITTER_MS,
+                error_rate=settings.SUPABASE_FAKE_ERROR_RATE,
+                seed=settings.SUPABASE_FAKE_SEED
+            )
+        return _backend
+
+
+if __name__ == "__main__":
+    # python -m app.core.fake_supabase [requests] [latency_ms] [error_rate]
+    import os
+    import sys
+    from app.core import database
+    from app.core.cache import entity_cache
+    from app.core.database import DatabaseOperations
+
+    args = sys.argv[1:]
+    total = int(args[0]) if len(args) > 0 else 200
+    fake = FakePostgREST(
+        latency_ms=float(args[1]) if len(args) > 1 else 5.0,
+        error_rate=float(args[2]) if len(args) > 2 else 0.0,
+        seed=42
+    )
+    database._supabase_client = FakeSupabaseClient(fake)
+    # الرجوع للتخزين المحلي عند الأخطاء المحقونة يكتب في ملف مؤقت وليس في data/
+    import tempfile
+    database.local_storage = database.LocalStorage(
+        data_file=os.path.join(tempfile.mkdtemp(), "bench_storage.json")
+    )
+
+    started = time.perf_counter()
+    for i in range(total):
+        username = f"bench_user_{i % 10}"
+        if DatabaseOperations.get_user(username) is None:
+            DatabaseOperations.create_user(username, {})
+        DatabaseOperations.add_lead(username, {'name': f'lead {i}', 'status': 'new', 'source': 'bench'})
+        DatabaseOperations.get_leads(username, limit=20)
+    elapsed = time.perf_counter() - started
+
+    print(f"{total} iterations in {elapsed:.2f}s ({elapsed / total * 1000:.1f} ms/iteration)")
+    print(f"backend: {fake.stats()}")
+    print(f"cache: {entity_cache.stats()}")
@@ -0,0 +1,225 @@
+"""
+Pattern Store - Keyword-Indexed Learned Patterns with LRU Eviction
+Brilliox Pro CRM v7.0
+"""
+import json
+import os
+import re
+import threading
+import uuid
+from collections import OrderedDict
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Any, Iterable, Optional, Set
+
+from app.core.config import settings
+
+
+# التشكيل والتطويل في النص العربي
+_DIACRITICS = re.compile(r'[\u064B-\u0652\u0670\u0640]')
+_WORDS = re.compile(r'\w+', re.UNICODE)
+_LETTERS = str.maketrans({'أ': 'ا', 'إ': 'ا', 'آ': 'ا', 'ى': 'ي', 'ة': 'ه'})
+
+# كلمات شائعة لا تصلح للفهرسة
+STOPWORDS = frozenset({
+    'في', 'من', 'على', 'الي', 'عن', 'مع', 'هل', 'ما', 'هذا', 'هذه', 'او', 'ثم', 'ان', 'كان',
+    'the', 'a', 'an', 'and', 'or', 'of', 'to', 'in', 'on', 'for', 'is', 'are', 'with', 'how', 'what',
+})
+
+# حقول النمط التي تُستخرج منها الكلمات المفتاحية (إن لم تُحدد keywords)
+TEXT_FIELDS = ('trigger', 'prompt', 'input', 'question', 'text')
+
+
+def normalize_terms(text: str) -> Set[str]:
+    """
+    تحويل نص إلى كلمات مفتاحية موحدة
+
+    حروف صغيرة، بدون تشكيل، توحيد الألف والياء والتاء المربوطة،
+    وحذف الكلمات الشائعة والحروف المفردة.
+    """
+    text = _DIACRITICS.sub('', text.lower()).translate(_LETTERS)
+    return {word for word in _WORDS.findall(text) if len(word) > 1 and word not in STOPWORDS}
+
+
+def pattern_keywords(pattern: Dict[str, Any]) -> Set[str]:
+    """الكلمات المفتاحية للنمط: keywords أو triggers صريحة، وإلا من حقوله النصية"""
+    explicit = pattern.get('keywords') or pattern.get('triggers')
+    if explicit:
+        if isinstance(explicit, str):
+            explicit = [explicit]
+        return set().union(*(normalize_terms(str(term)) for term in explicit))
+    terms: Set[str] = set()
+    for field in TEXT_FIELDS:
+        if isinstance(pattern.get(field), str):
+            terms |= normalize_terms(pattern[field])
+    return terms
+
+
+class PatternStore:
+    """
+    مخزن الأنماط المتعلمة
+
+    الأنماط مفهرسة بكلماتها المفتاحية (كلمة -> معرفات الأنماط)، فالبحث عن
+    أنماط نص معين يمر على كلمات النص فقط لا على كل الأنماط. عند تجاوز
+    الحد يُحذف النمط الأقدم مطابقة (LRU) بدلاً من الأقدم إضافة.
+    يُحفظ في ملف مستقل ولا يُعاد كتابته إلا عند تغير الأنماط.
+    """
+
+    def __init__(self, path: str = "data/patterns.json", max_size: int = settings.PATTERN_STORE_SIZE):
+        self.path = Path(path)
+        self.max_size = max_size
+        self._lock = threading.RLock()
+        self._write_lock = threading.Lock()
+        # الترتيب: الأقدم مطابقة أولاً
+        self._patterns: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._keywords: Dict[str, Set[str]] = {}
+        self._index: Dict[str, Set[str]] = {}
+        # dirty: تغير المحتوى، touched: تغير ترتيب المطابقة فقط (يُحفظ عند الإغلاق)
+        self._dirty = False
+        self._touched = False
+        self._version = 0
+        self._saved_version = 0
+        self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self._patterns)
+
+    # ==================== التعديل ====================
+
+    def add(self, pattern: Dict[str, Any]) -> str:
+        """إضافة نسخة من نمط (أو استبدال نمط بنفس المعرف) وإرجاع معرفه"""
+        pattern = dict(pattern)
+        with self._lock:
+            pattern_id = pattern.setdefault('id', uuid.uuid4().hex)
+            if pattern_id in self._patterns:
+                self._unindex(pattern_id)
+            self._patterns[pattern_id] = pattern
+            self._patterns.move_to_end(pattern_id)
+            keywords = pattern_keywords(pattern)
+            self._keywords[pattern_id] = keywords
+            for keyword in keywords:
+                self._index.setdefault(keyword, set()).add(pattern_id)
+
+            while len(self._patterns) > self.max_size:
+                oldest = next(iter(self._patterns))
+                self._unindex(oldest)
+                del self._patterns[oldest]
+                self.evictions += 1
+            self._dirty = True
+            return pattern_id
+
+    def extend(self, patterns: Iterable[Dict[str, Any]]):
+        for pattern in patterns:
+            self.add(pattern)
+
+    def remove(self, pattern_id: str) -> bool:
+        with self._lock:
+            if pattern_id not in self._patterns:
+                return False
+            self._unindex(pattern_id)
+            del self._patterns[pattern_id]
+            self._dirty = True
+            return True
+
+    def _unindex(self, pattern_id: str):
+        """إزالة كلمات نمط من الفهرس (يُستدعى تحت القفل)"""
+        for keyword in self._keywords.pop(pattern_id, ()):
+            ids = self._index.get(keyword)
+            if ids is not None:
+                ids.discard(pattern_id)
+                if not ids:
+                    del self._index[keyword]
+
+    # ==================== البحث ====================
+
+    def match(self, text: str, limit: int = 5,
+              where: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+        """
+        الأنماط المطابقة لنص مرتبة حسب عدد الكلمات المشتركة
+
+        Args:
+            text: النص
+            limit: أقصى عدد نتائج
+            where: حقول يجب أن تساويها الأنماط (مثل {"user_id": ...})
+
+        الأنماط المطابقة تنتقل إلى نهاية ترتيب الإخلاء.
+        """
+        terms = normalize_terms(text)
+        with self._lock:
+            scores: Dict[str, int] = {}
+            for term in terms:
+                for pattern_id in self._index.get(term, ()):
+                    if where and any(self._patterns[pattern_id].get(field) != value
+                                     for field, value in where.items()):
+                        continue
+                    scores[pattern_id] = scores.get(pattern_id, 0) + 1
+            if not scores:
+                return []
+
+            best = sorted(scores, key=lambda pattern_id: scores[pattern_id], reverse=True)[:limit]
+            now = datetime.now().isoformat()
+            results = []
+            for pattern_id in best:
+                pattern = self._patterns[pattern_id]
+                pattern['hits'] = pattern.get('hits', 0) + 1
+                pattern['last_matched'] = now
+                self._patterns.move_to_end(pattern_id)
+                results.append(dict(pattern))
+            self._touched = True
+            return results
+
+    def all(self) -> List[Dict[str, Any]]:
+        """جميع الأنماط (الأقدم مطابقة أولاً)"""
+        with self._lock:
+            return [dict(pattern) for pattern in self._patterns.values()]
+
+    # ==================== الحفظ ====================
+
+    def load(self) -> bool:
+        """تحميل الأنماط من الملف (False إن لم يوجد)"""
+        if not self.path.exists():
+            return False
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                patterns = json.load(f)
+        except Exception as e:
+            print(f"Error loading patterns: {e}")
+            return False
+        with self._lock:
+            self.extend(patterns)
+            self._dirty = False
+        return True
+
+    def flush(self, force: bool = False):
+        """حفظ الأنماط إن تغيرت (force: حفظ ترتيب المطابقة أيضاً)"""
+        with self._lock:
+            if not (self._dirty or (force and self._touched)):
+                return
+            payload = json.dumps(list(self._patterns.values()), ensure_ascii=False, indent=2, default=str)
+            self._dirty = self._touched = False
+            self._version += 1
+            version = self._version
+
+        with self._write_lock:
+            # حفظ متزامن أحدث سبقنا إلى الملف
+            if version <= self._saved_version:
+                return
+            temp_file = self.path.with_name(self.path.name + ".tmp")
+            try:
+                self.path.parent.mkdir(parents=True, exist_ok=True)
+                with open(temp_file, 'w', encoding='utf-8') as f:
+                    f.write(payload)
+                os.replace(temp_file, self.path)
+                self._saved_version = version
+            except Exception as e:
+                print(f"Error saving patterns: {e}")
+                with self._lock:
+                    self._dirty = True
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "patterns": len(self._patterns),
+            "keywords": len(self._index),
+            "max_size": self.max_size,
+            "evictions": self.evictions
+        }
@@ -0,0 +1,340 @@
+"""
+PostgreSQL Storage Driver - Direct Database Backend
+Brilliox Pro CRM v7.0
+"""
+import atexit
+import hashlib
+import json
+import re
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+from decimal import Decimal
+from typing import Optional, Dict, Any, List
+
+import psycopg2
+from psycopg2 import pool as pg_pool
+from psycopg2.extras import execute_values
+
+from app.core.config import settings
+
+
+# الأعمدة المستخرجة من بيانات كل جدول (لتصفية وفهرسة الاستعلامات في SQL)
+COLUMNS: Dict[str, tuple] = {
+    'users': ('username',),
+    'leads': ('user_id', 'status', 'source', 'campaign', 'created_at'),
+}
+
+# الفهارس المعلنة لكل جدول
+INDEXES: Dict[str, List[tuple]] = {
+    'leads': [('user_id', 'status'), ('user_id', 'created_at', 'key'), ('source',), ('campaign',)],
+}
+
+_TABLE_NAME = re.compile(r'^[A-Za-z_][A-Za-z0-9_]*$')
+
+
+def _placeholders(start: int, count: int) -> str:
+    """معاملات الجمل المُحضّرة ($1, $2, ...)"""
+    return ", ".join(f"${i}" for i in range(start, start + count))
+
+
+def _column_value(value: Any) -> Optional[str]:
+    """قيمة العمود المستخرج (الأعمدة نصية)"""
+    return None if value is None else str(value)
+
+
+def _number(value: Any) -> Any:
+    """تحويل Decimal الناتج عن SUM إلى رقم Python"""
+    if isinstance(value, Decimal):
+        return int(value) if value == value.to_integral_value() else float(value)
+    return value
+
+
+class PostgresStorage:
+    """
+    تخزين PostgreSQL مباشر بنفس واجهة LocalStorage
+
+    يحفظ العنصر كاملاً في عمود JSONB مع نسخ الحقول المستخدمة في التصفية
+    إلى أعمدة مفهرسة. الاتصالات من مجمع محدود الحجم، وكل جملة SQL تُحضّر
+    (PREPARE) مرة واحدة لكل اتصال ثم تُنفذ بـ EXECUTE في الطلبات التالية.
+    """
+
+    def __init__(self, dsn: Optional[str] = None,
+                 min_connections: int = settings.POSTGRES_POOL_MIN,
+                 max_connections: int = settings.POSTGRES_POOL_MAX):
+        self.dsn = dsn or settings.get_database_url()
+        self.min_connections = min_connections
+        self.max_connections = max_connections
+
+        self._pool: Optional[pg_pool.ThreadedConnectionPool] = None
+        self._pool_lock = threading.Lock()
+        # المجمع يرفض الطلب عند امتلائه، لذلك ننتظر على semaphore بدلاً من ذلك
+        self._slots = threading.BoundedSemaphore(max_connections)
+        # أسماء الجمل المُحضّرة على كل اتصال
+        self._prepared: Dict[int, set] = {}
+        self._tables: set = set()
+        atexit.register(self.close)
+
+    def bootstrap(self):
+        """فتح المجمع وإنشاء الجداول والفهارس (يُستدعى عند بدء التطبيق)"""
+        self._get_pool()
+
+    def _get_pool(self) -> pg_pool.ThreadedConnectionPool:
+        """إنشاء المجمع وتهيئة الجداول عند أول استخدام"""
+        if self._pool is None:
+            with self._pool_lock:
+                if self._pool is None:
+                    connection_pool = pg_pool.ThreadedConnectionPool(
+                        self.min_connections, self.max_connections, self.dsn,
+                        connect_timeout=settings.POSTGRES_CONNECT_TIMEOUT
+                    )
+                    self._pool = connection_pool
+                    for table in COLUMNS:
+                        self._ensure_table(table)
+        return self._pool
+
+    @contextmanager
+    def _connection(self):
+        """استعارة اتصال من المجمع داخل معاملة واحدة"""
+        connection_pool = self._get_pool()
+        self._slots.acquire()
+        try:
+            conn = connection_pool.getconn()
+            broken = False
+            try:
+                with conn:
+                    yield conn
+            except (psycopg2.OperationalError, psycopg2.InterfaceError):
+                broken = True
+                raise
+            finally:
+                if broken or conn.closed:
+                    self._prepared.pop(id(conn), None)
+                connection_pool.putconn(conn, close=broken or bool(conn.closed))
+        finally:
+            self._slots.release()
+
+    def _execute(self, cursor, sql: str, params: tuple = ()):
+        """تنفيذ جملة مُحضّرة (تُحضّر عند أول استخدام على هذا الاتصال)"""
+        name = "brx_" + hashlib.md5(sql.encode()).hexdigest()[:16]
+        prepared = self._prepared.setdefault(id(cursor.connection), set())
+        if name not in prepared:
+            cursor.execute(f"PREPARE {name} AS {sql}")
+            prepared.add(name)
+        if params:
+            cursor.execute(f"EXECUTE {name} ({', '.join('%s' for _ in params)})", params)
+        else:
+            cursor.execute(f"EXECUTE {name}")
+
+    def _ensure_table(self, table: str):
+        """إنشاء الجدول وفهارسه عند أول استخدام"""
+        if table in self._tables:
+            return
+        if not _TABLE_NAME.match(table):
+            raise ValueError(f"Invalid table name: {table}")
+
+        columns = "".join(f", {col} TEXT" for col in COLUMNS.get(table, ()))
+        with self._connection() as conn, conn.cursor() as cursor:
+            cursor.execute(
+                f"CREATE TABLE IF NOT EXISTS {table} "
+                f"(seq BIGSERIAL, key TEXT PRIMARY KEY{columns}, data JSONB NOT NULL)"
+            )
+            for index_columns in INDEXES.get(table, []):
+                name = f"idx_{table}_{'_'.join(index_columns)}"
+                cursor.execute(
+                    f"CREATE INDEX IF NOT EXISTS {name} ON {table} ({', '.join(index_columns)})"
+                )
+        self._tables.add(table)
+
+    def _insert_sql(self, table: str) -> str:
+        """جملة الإدراج أو الاستبدال لجدول"""
+        columns = ("key", *COLUMNS.get(table, ()), "data")
+        updates = ", ".join(f"{col} = EXCLUDED.{col}" for col in columns[1:])
+        return (
+            f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({_placeholders(1, len(columns))}) "
+            f"ON CONFLICT (key) DO UPDATE SET {updates}"
+        )
+
+    def _row_values(self, table: str, key: str, value: Dict[str, Any]) -> tuple:
+        """قيم الصف: المفتاح ثم الأعمدة المستخرجة ثم JSON"""
+        columns = tuple(_column_value(value.get(col)) for col in COLUMNS.get(table, ()))
+        return (key, *columns, json.dumps(value, ensure_ascii=False, default=str))
+
+    def _put(self, cursor, table: str, key: str, value: Dict[str, Any]):
+        """كتابة عنصر كما هو (إدراج أو استبدال)"""
+        self._execute(cursor, self._insert_sql(table), self._row_values(table, key, value))
+
+    def get(self, table: str, key: str) -> Optional[Dict[str, Any]]:
+        """الحصول على عنصر"""
+        self._ensure_table(table)
+        with self._connection() as conn, conn.cursor() as cursor:
+            self._execute(cursor, f"SELECT data FROM {table} WHERE key = $1", (key,))
+            row = cursor.fetchone()
+        return row[0] if row else None
+
+    def get_all(self, table: str) -> List[Dict[str, Any]]:
+        """الحصول على جميع العناصر من جدول"""
+        self._ensure_table(table)
+        with self._connection() as conn, conn.cursor() as cursor:
+            self._execute(cursor, f"SELECT data FROM {table} ORDER BY seq")
+            return [row[0] for row in cursor.fetchall()]
+
+    def insert(self, table: str, key: str, value: Dict[str, Any], durable: bool = False) -> str:
+        """إضافة عنصر جديد (كل عملية تُثبّت فوراً لذلك durable لا يغير شيئاً)"""
+        self._ensure_table(table)
+        value['id'] = key
+        value['created_at'] = datetime.now().isoformat()
+        with self._connection() as conn, conn.cursor() as cursor:
+            self._put(cursor, table, key, value)
+        return key
+
+    def insert_many(self, table: str, items: Dict[str, Dict[str, Any]], durable: bool = False) -> List[str]:
+        """إضافة مجموعة عناصر بجملة INSERT متعددة الصفوف في معاملة واحدة"""
+        if not items:
+            return []
+
+        self._ensure_table(table)
+        now = datetime.now().isoformat()
+        rows = []
+        for key, value in items.items():
+            value['id'] = key
+            value['created_at'] = now
+            rows.append(self._row_values(table, key, value))
+
+        columns = ("key", *COLUMNS.get(table, ()), "data")
+        updates = ", ".join(f"{col} = EXCLUDED.{col}" for col in columns[1:])
+        with self._connection() as conn, conn.cursor() as cursor:
+            execute_values(
+                cursor,
+                f"INSERT INTO {table} ({', '.join(columns)}) VALUES %s "
+                f"ON CONFLICT (key) DO UPDATE SET {updates}",
+                rows,
+                page_size=settings.BULK_INSERT_CHUNK_SIZE
+            )
+        return list(items.keys())
+
+    def update(self, table: str, key: str, value: Dict[str, Any], durable: bool = False) -> bool:
+        """تحديث عنصر (قراءة مع قفل الصف ثم كتابة في نفس المعاملة)"""
+        self._ensure_table(table)
+        with self._connection() as conn, conn.cursor() as cursor:
+            self._execute(cursor, f"SELECT data FROM {table} WHERE key = $1 FOR UPDATE", (key,))
+            row = cursor.fetchone()
+            if not row:
+                return False
+
+            existing = row[0]
+            existing.update(value)
+            existing['updated_at'] = datetime.now().isoformat()
+            self._put(cursor, table, key, existing)
+        return True
+
+    def delete(self, table: str, key: str, durable: bool = False) -> bool:
+        """حذف عنصر"""
+        self._ensure_table(table)
+        with self._connection() as conn, conn.cursor() as cursor:
+            self._execute(cursor, f"DELETE FROM {table} WHERE key = $1", (key,))
+            return cursor.rowcount > 0
+
+    def _where(self, table: str, filters: Dict[str, Any]) -> tuple:
+        """
+        بناء شروط WHERE لكل الشروط داخل SQL
+
+        الأعمدة المستخرجة تُقارن مباشرة (مفهرسة)، وبقية الحقول تُقارن داخل JSONB.
+        """
+        columns = COLUMNS.get(table, ())
+        clauses = []
+        params = []
+        for field, value in filters.items():
+            if field in columns:
+                if value is None:
+                    clauses.append(f"{field} IS NULL")
+                else:
+                    params.append(_column_value(value))
+                    clauses.append(f"{field} = ${len(params)}")
+            elif value is None:
+                params.append(field)
+                clauses.append(f"data->>${len(params)}::text IS NULL")
+            else:
+                params.append(json.dumps({field: value}, ensure_ascii=False, default=str))
+                clauses.append(f"data @> ${len(params)}::jsonb")
+        return clauses, params
+
+    def _select(self, table: str, clauses: List[str], params: List[Any],
+                order: str, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        """تنفيذ استعلام"""
+        sql = f"SELECT data FROM {table}"
+        if clauses:
+            sql += " WHERE " + " AND ".join(clauses)
+        sql += f" ORDER BY {order}"
+        if limit:
+            params = [*params, limit]
+            sql += f" LIMIT ${len(params)}"
+
+        with self._connection() as conn, conn.cursor() as cursor:
+            self._execute(cursor, sql, tuple(params))
+            return [row[0] for row in cursor.fetchall()]
+
+    def query(self, table: str, **filters) -> List[Dict[str, Any]]:
+        """استعلام بسيط (كل الشروط تُصفى داخل PostgreSQL)"""
+        self._ensure_table(table)
+        clauses, params = self._where(table, filters)
+        return self._select(table, clauses, params, "seq")
+
+    def group_count(self, table: str, fields: tuple, filters: Optional[Dict[str, Any]] = None,
+                    sum_field: Optional[str] = None) -> List[Dict[str, Any]]:
+        """عدّ العناصر مجمعة حسب أعمدة (GROUP BY داخل PostgreSQL)"""
+        self._ensure_table(table)
+        columns = COLUMNS.get(table, ())
+        if any(field not in columns for field in fields):
+            raise ValueError(f"Cannot group {table} by {fields}")
+        if sum_field and not _TABLE_NAME.match(sum_field):
+            raise ValueError(f"Invalid field name: {sum_field}")
+
+        clauses, params = self._where(table, filters or {})
+        group = ", ".join(fields)
+        select = f"{group}, COUNT(*)"
+        if sum_field:
+            select += f", COALESCE(SUM((data->>'{sum_field}')::numeric), 0)"
+        sql = f"SELECT {select} FROM {table}"
+        if clauses:
+            sql += " WHERE " + " AND ".join(clauses)
+        sql += f" GROUP BY {group}"
+
+        with self._connection() as conn, conn.cursor() as cursor:
+            self._execute(cursor, sql, tuple(params))
+            result = cursor.fetchall()
+
+        rows = []
+        for values in result:
+            row = dict(zip(fields, values))
+            row['count'] = values[len(fields)]
+            if sum_field:
+                row[f'{sum_field}_sum'] = _number(values[len(fields) + 1])
+            rows.append(row)
+        return rows
+
+    def query_page(self, table: str, filters: Dict[str, Any], after: Optional[tuple] = None,
+                   limit: Optional[int] = None,
+                   order_by: tuple = ('created_at', 'id')) -> List[Dict[str, Any]]:
+        """استعلام مع ترقيم بالمؤشر (keyset) باستخدام مقارنة الصفوف"""
+        self._ensure_table(table)
+        clauses, params = self._where(table, filters)
+        order_column = order_by[0]
+        if order_column not in COLUMNS.get(table, ()):
+            raise ValueError(f"Cannot paginate {table} by {order_column}")
+
+        if after:
+            params.extend([after[0], after[1]])
+            clauses.append(f"({order_column}, key) > (${len(params) - 1}::text, ${len(params)}::text)")
+        return self._select(table, clauses, params, f"{order_column}, key", limit)
+
+    def flush(self):
+        """لا توجد كتابة معلقة - للتوافق مع LocalStorage"""
+
+    def close(self):
+        """إغلاق جميع اتصالات المجمع"""
+        with self._pool_lock:
+            if self._pool is not None:
+                self._pool.closeall()
+                self._pool = None
+                self._prepared.clear()
@@ -0,0 +1,173 @@
+"""
+Projections - Incrementally Maintained Lead Metrics
+Brilliox Pro CRM v7.0
+"""
+import threading
+from datetime import datetime
+from typing import Optional, Dict, Any, List, Callable
+
+from app.core.database import DatabaseOperations
+from app.core.events import unified_system, SystemEvent
+
+
+def _empty_scope() -> Dict[str, Any]:
+    return {'total': 0, 'by_status': {}, 'by_source': {}}
+
+
+def _bump(counts: Dict[str, int], key: str, delta: int):
+    """تعديل عداد وحذفه عند الوصول إلى صفر"""
+    value = counts.get(key, 0) + delta
+    if value:
+        counts[key] = value
+    else:
+        counts.pop(key, None)
+
+
+def _label(value: Optional[str]) -> str:
+    """نفس تسمية fold_lead_stats للقيم الفارغة"""
+    return 'unknown' if value is None else value
+
+
+class LeadProjection:
+    """
+    إحصائيات العملاء محدثة تدريجياً من أحداث النظام
+
+    تحتفظ لكل مستخدم وللجميع بالإجمالي والتوزيع حسب الحالة والمصدر، وتُحدث
+    عند LEAD_ADDED و LEAD_STAGE_CHANGED و LEAD_DELETED دون إعادة العد.
+    تُبنى من قاعدة البيانات عند أول قراءة، وتُعاد بناؤها بـ rebuild عند الحاجة
+    (مثلاً بعد تعديل العملاء مباشرة في قاعدة البيانات). الأحداث التي تصل
+    أثناء إعادة البناء تُحفظ وتُطبق على النتيجة الجديدة حتى لا تضيع.
+    """
+
+    def __init__(self, loader: Callable[[], List[Dict[str, Any]]]):
+        # loader: صفوف (user_id, status, source, count) من قاعدة البيانات
+        self._loader = loader
+        self._lock = threading.Lock()
+        self._rebuild_lock = threading.Lock()
+        # الأحداث الواصلة أثناء إعادة البناء (None خارجها)
+        self._buffer: Optional[List[Callable[[], None]]] = None
+        self._scopes: Dict[Optional[str], Dict[str, Any]] = {}
+        self._ready = False
+        self.rebuilt_at: Optional[str] = None
+
+    @property
+    def ready(self) -> bool:
+        return self._ready
+
+    @staticmethod
+    def _keys(user_id: Optional[str]) -> tuple:
+        """نطاقات العميل: العام ونطاق مستخدمه (العميل بلا مستخدم يُحسب مرة واحدة)"""
+        return (None,) if user_id is None else (None, user_id)
+
+    def _apply(self, user_id: Optional[str], status: Optional[str], source: Optional[str], delta: int):
+        """إضافة أو طرح عميل من إسقاط المستخدم والإسقاط العام (تحت القفل)"""
+        for key in self._keys(user_id):
+            scope = self._scopes.get(key)
+            if scope is None:
+                scope = self._scopes[key] = _empty_scope()
+            scope['total'] += delta
+            _bump(scope['by_status'], _label(status), delta)
+            _bump(scope['by_source'], _label(source), delta)
+
+    def _change_status(self, user_id: Optional[str], old_status: Optional[str], new_status: Optional[str]):
+        """نقل عميل بين حالتين (تحت القفل)"""
+        for key in self._keys(user_id):
+            scope = self._scopes.setdefault(key, _empty_scope())
+            _bump(scope['by_status'], _label(old_status), -1)
+            _bump(scope['by_status'], _label(new_status), 1)
+
+    def _handle(self, operation: Callable[[], None]):
+        """تطبيق حدث، وحفظه لإعادة تطبيقه إن كانت الإسقاطات تُعاد بناؤها"""
+        with self._lock:
+            if self._buffer is not None:
+                self._buffer.append(operation)
+            if self._ready:
+                operation()
+
+    def lead_added(self, user_id: str, status: Optional[str], source: Optional[str]):
+        self._handle(lambda: self._apply(user_id, status, source, 1))
+
+    def lead_deleted(self, user_id: str, status: Optional[str], source: Optional[str]):
+        self._handle(lambda: self._apply(user_id, status, source, -1))
+
+    def status_changed(self, user_id: str, old_status: Optional[str], new_status: Optional[str]):
+        self._handle(lambda: self._change_status(user_id, old_status, new_status))
+
+    def rebuild(self) -> Dict[str, Any]:
+        """إعادة بناء الإسقاطات من قاعدة البيانات"""
+        with self._rebuild_lock:
+            with self._lock:
+                self._buffer = []
+            try:
+                rows = self._loader()
+                scopes: Dict[Optional[str], Dict[str, Any]] = {None: _empty_scope()}
+                for row in rows:
+                    count = int(row.get('count') or 0)
+                    for key in self._keys(row.get('user_id')):
+                        scope = scopes.setdefault(key, _empty_scope())
+                        scope['total'] += count
+                        _bump(scope['by_status'], _label(row.get('status')), count)
+                        _bump(scope['by_source'], _label(row.get('source')), count)
+
+                with self._lock:
+                    self._scopes = scopes
+                    # الأحداث التي وصلت أثناء القراءة تُطبق على النتيجة الجديدة
+                    for operation in self._buffer:
+                        operation()
+                    self._ready = True
+                    self.rebuilt_at = datetime.now().isoformat()
+            finally:
+                with self._lock:
+                    self._buffer = None
+        return self.stats()
+
+    def snapshot(self, user_id: Optional[str] = None) -> Dict[str, Any]:
+        """
+        إحصائيات مستخدم (أو الجميع عند None) دون الوصول إلى قاعدة البيانات
+
+        Returns:
+            Dict: total و by_status و by_source (عدد لكل مصدر)
+        """
+        if not self._ready:
+            self.rebuild()
+        with self._lock:
+            scope = self._scopes.get(user_id) or _empty_scope()
+            return {
+                'total': scope['total'],
+                'by_status': dict(scope['by_status']),
+                'by_source': dict(scope['by_source'])
+            }
+
+    def stats(self) -> Dict[str, Any]:
+        """حالة الإسقاطات"""
+        with self._lock:
+            return {
+                'ready': self._ready,
+                'users': len(self._scopes) - (1 if None in self._scopes else 0),
+                'total_leads': self._scopes.get(None, {}).get('total', 0),
+                'rebuilt_at': self.rebuilt_at
+            }
+
+
+# إسقاط إحصائيات العملاء
+lead_projection = LeadProjection(DatabaseOperations.get_lead_counts)
+
+
+@unified_system.on(SystemEvent.LEAD_ADDED, inline=True, replicate=True)
+def _on_lead_added(event: SystemEvent, data: Dict[str, Any]):
+    lead_projection.lead_added(data.get('user_id'), data.get('status'), data.get('source'))
+
+
+@unified_system.on(SystemEvent.LEAD_STAGE_CHANGED, inline=True, replicate=True)
+def _on_lead_stage_changed(event: SystemEvent, data: Dict[str, Any]):
+    lead_projection.status_changed(data.get('user_id'), data.get('old_status'), data.get('new_status'))
+
+
+@unified_system.on(SystemEvent.LEAD_DELETED, inline=True, replicate=True)
+def _on_lead_deleted(event: SystemEvent, data: Dict[str, Any]):
+    lead_projection.lead_deleted(data.get('user_id'), data.get('status'), data.get('source'))
+
+
+def rebuild_lead_projections() -> Dict[str, Any]:
+    """إعادة بناء إسقاطات العملاء من قاعدة البيانات"""
+    return lead_projection.rebuild()
@@ -0,0 +1,132 @@
+"""
+Redis Event Transport - Pub/Sub Fan-Out Between Workers
+Brilliox Pro CRM v7.0
+"""
+import json
+import threading
+import time
+from collections import deque
+from typing import Optional, Dict, Any
+
+import redis
+
+from app.core.config import settings
+from app.core.event_transport import EventTransport, Handler
+
+
+class RedisTransport(EventTransport):
+    """
+    نقل الأحداث عبر Redis pub/sub
+
+    النشر لا يدخل في مسار الطلب: الرسائل توضع في طابور محدود ويرسلها خيط
+    خلفي. خيط ثانٍ يستقبل رسائل القناة ويعيد الاشتراك تلقائياً عند انقطاع
+    الاتصال. Redis pub/sub لا يضمن التسليم؛ الرسائل أثناء الانقطاع تُفقد.
+    """
+
+    def __init__(self, url: Optional[str], channel: str = settings.EVENT_CHANNEL,
+                 max_pending: int = settings.EVENT_TRANSPORT_QUEUE):
+        if not url:
+            raise ValueError("REDIS_URL is required for EVENT_TRANSPORT=redis")
+        self.channel = channel
+        self.max_pending = max_pending
+        self._client = redis.Redis.from_url(url, socket_connect_timeout=5, socket_timeout=5)
+        self._handler: Optional[Handler] = None
+        self._cond = threading.Condition()
+        self._pending: deque = deque()
+        self._closed = False
+        self._threads = []
+
+        self.published = 0
+        self.received = 0
+        self.dropped = 0
+        self.errors = 0
+
+    def start(self, handler: Handler):
+        self._handler = handler
+        for target, name in ((self._publish_loop, "event-publisher"),
+                             (self._subscribe_loop, "event-subscriber")):
+            thread = threading.Thread(target=target, name=name, daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def publish(self, message: Dict[str, Any]):
+        payload = json.dumps(message, ensure_ascii=False, default=str)
+        with self._cond:
+            if self._closed:
+                return
+            if len(self._pending) >= self.max_pending:
+                self._pending.popleft()
+                self.dropped += 1
+            self._pending.append(payload)
+            self._cond.notify()
+
+    def _publish_loop(self):
+        """إرسال الرسائل المعلقة بدفعات عبر pipeline"""
+        while True:
+            with self._cond:
+                while not self._pending and not self._closed:
+                    self._cond.wait()
+                if not self._pending:
+                    return
+                batch = list(self._pending)
+                self._pending.clear()
+            try:
+                pipe = self._client.pipeline(transaction=False)
+                for payload in batch:
+                    pipe.publish(self.channel, payload)
+                pipe.execute()
+                self.published += len(batch)
+            except redis.RedisError as e:
+                self.errors += 1
+                self.dropped += len(batch)
+                print(f"Error publishing events to Redis: {e}")
+                time.sleep(1)
+
+    def _subscribe_loop(self):
+        """استقبال رسائل القناة مع إعادة الاشتراك عند الانقطاع"""
+        backoff = 0.5
+        while not self._closed:
+            pubsub = None
+            try:
+                pubsub = self._client.pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(self.channel)
+                backoff = 0.5
+                while not self._closed:
+                    message = pubsub.get_message(timeout=1.0)
+                    if message is None:
+                        continue
+                    self.received += 1
+                    try:
+                        self._handler(json.loads(message["data"]))
+                    except Exception as e:
+                        print(f"Error handling event message: {e}")
+            except redis.RedisError as e:
+                self.errors += 1
+                print(f"Redis event subscription lost: {e}")
+                time.sleep(backoff)
+                backoff = min(backoff * 2, 30)
+            finally:
+                if pubsub is not None:
+                    try:
+                        pubsub.close()
+                    except redis.RedisError:
+                        pass
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        for thread in self._threads:
+            thread.join(2)
+        self._client.close()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "transport": "redis",
+            "channel": self.channel,
+            "pending": len(self._pending),
+            "published": self.published,
+            "received": self.received,
+            "dropped": self.dropped,
+            "errors": self.errors
+        }
@@ -0,0 +1,137 @@
+"""
+Rule Engine - Declarative, Serializable Event Rules
+Brilliox Pro CRM v7.0
+"""
+import operator
+from enum import Enum
+from typing import Optional, Dict, List, Any, Callable, Tuple
+
+from app.core.cache import MISSING
+
+
+# المعاملات المتاحة في شروط القواعد
+OPERATORS: Dict[str, Callable[[Any, Any], bool]] = {
+    "eq": operator.eq,
+    "ne": operator.ne,
+    "gt": operator.gt,
+    "gte": operator.ge,
+    "lt": operator.lt,
+    "lte": operator.le,
+    "in": lambda value, options: value in options,
+    "nin": lambda value, options: value not in options,
+    "contains": lambda value, item: item in value,
+}
+
+# قاعدة بدون حدث تُطبق على جميع الأحداث
+ANY_EVENT = "*"
+
+Predicate = Callable[[Dict[str, Any]], bool]
+
+
+def _field_getter(path: str) -> Callable[[Dict[str, Any]], Any]:
+    """دالة قراءة حقل (يدعم المسارات المتداخلة مثل lead.score)"""
+    parts = path.split(".")
+    if len(parts) == 1:
+        return lambda data: data.get(path, MISSING)
+
+    def getter(data: Dict[str, Any]) -> Any:
+        value: Any = data
+        for part in parts:
+            if not isinstance(value, dict):
+                return MISSING
+            value = value.get(part, MISSING)
+        return value
+    return getter
+
+
+def _compile_condition(field: str, spec: Any) -> Predicate:
+    """تحويل شرط حقل واحد إلى دالة"""
+    get = _field_getter(field)
+    # {"stage": "hot"} اختصار لـ {"stage": {"eq": "hot"}}
+    if not isinstance(spec, dict):
+        spec = {"eq": spec}
+
+    checks: List[Tuple[Callable, Any]] = []
+    expect_exists: Optional[bool] = None
+    for op, expected in spec.items():
+        if op == "exists":
+            expect_exists = bool(expected)
+        elif op in OPERATORS:
+            checks.append((OPERATORS[op], expected))
+        else:
+            raise ValueError(f"Unknown rule operator '{op}' for field '{field}'")
+
+    def predicate(data: Dict[str, Any]) -> bool:
+        value = get(data)
+        if value is MISSING:
+            return expect_exists is False
+        if expect_exists is False:
+            return False
+        try:
+            return all(check(value, expected) for check, expected in checks)
+        except TypeError:
+            # مقارنة أنواع غير متوافقة (مثل None > 5)
+            return False
+    return predicate
+
+
+def compile_rule(rule: Dict[str, Any]) -> Predicate:
+    """
+    تحويل شروط قاعدة إلى دالة واحدة تُنفذ على بيانات الحدث
+
+    الصيغة:
+        {
+            "id": "notify_admin_on_hot_lead",
+            "event": "lead_stage_changed",      # أو "*" لجميع الأحداث
+            "conditions": {"stage": "hot", "score": {"gte": 80}},
+            "action": "notify_admin"
+        }
+
+    القواعد القديمة ذات "condition" كدالة ما زالت مدعومة لكنها لا تُحفظ.
+    """
+    condition = rule.get("condition")
+    if callable(condition):
+        return condition
+
+    predicates = [
+        _compile_condition(field, spec)
+        for field, spec in (rule.get("conditions") or {}).items()
+    ]
+    if not predicates:
+        return lambda data: True
+    if len(predicates) == 1:
+        return predicates[0]
+    return lambda data: all(predicate(data) for predicate in predicates)
+
+
+def is_declarative(rule: Dict[str, Any]) -> bool:
+    """هل يمكن حفظ القاعدة واستعادتها من الملف؟"""
+    return not callable(rule.get("condition")) and ("event" in rule or "conditions" in rule)
+
+
+def serialize_rule(rule: Dict[str, Any]) -> Dict[str, Any]:
+    """نسخة قابلة للحفظ من القاعدة (بدون الدوال، والحدث باسمه لا كتعداد)"""
+    saved = {key: value for key, value in rule.items() if not callable(value)}
+    if isinstance(saved.get("event"), Enum):
+        saved["event"] = saved["event"].value
+    return saved
+
+
+def build_rule_index(rules: List[Dict[str, Any]], event_type) -> Dict[Any, List[Tuple[Dict, Predicate]]]:
+    """
+    ترجمة القواعد وفهرستها حسب نوع الحدث
+
+    Args:
+        rules: القواعد
+        event_type: نوع تعداد الأحداث (لتحويل أسماء الأحداث)
+
+    Returns:
+        {حدث: [(قاعدة، دالة الشرط)]} مع ANY_EVENT للقواعد العامة
+    """
+    index: Dict[Any, List[Tuple[Dict, Predicate]]] = {}
+    for rule in rules:
+        event = rule.get("event") or ANY_EVENT
+        if event != ANY_EVENT and not isinstance(event, event_type):
+            event = event_type(event)
+        index.setdefault(event, []).append((rule, compile_rule(rule)))
+    return index
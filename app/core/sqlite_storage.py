@@ -0,0 +1,308 @@
+"""
+SQLite Storage Driver - Embedded Storage Backend
+Brilliox Pro CRM v7.0
+"""
+import json
+import os
+import re
+import sqlite3
+import sys
+import threading
+from datetime import datetime
+from typing import Optional, Dict, Any, List
+
+from app.core.config import settings
+
+
+# الأعمدة المستخرجة من بيانات كل جدول (لتصفية وفهرسة الاستعلامات في SQL)
+COLUMNS: Dict[str, tuple] = {
+    'leads': ('user_id', 'status', 'source', 'campaign', 'created_at'),
+}
+
+# الفهارس المعلنة لكل جدول
+INDEXES: Dict[str, List[tuple]] = {
+    'leads': [('user_id', 'status'), ('user_id', 'created_at'), ('source',), ('campaign',)],
+}
+
+_TABLE_NAME = re.compile(r'^[A-Za-z_][A-Za-z0-9_]*$')
+
+
+class SQLiteStorage:
+    """
+    تخزين SQLite بنفس واجهة LocalStorage
+
+    كل جدول يحفظ العنصر كاملاً في عمود JSON، مع نسخ الحقول المستخدمة
+    في التصفية إلى أعمدة مفهرسة حتى تُنفذ الاستعلامات داخل SQLite.
+    """
+
+    def __init__(self, db_path: str = settings.SQLITE_PATH):
+        self.db_path = db_path
+        self._lock = threading.RLock()
+        self._tables: set = set()
+
+        os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+        # الاستعلامات ثابتة النص لكل جدول فيعيد sqlite3 استخدام الجمل المُحضّرة من ذاكرته
+        self._conn = sqlite3.connect(
+            db_path,
+            check_same_thread=False,
+            isolation_level=None,
+            cached_statements=256
+        )
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+
+        for table in COLUMNS:
+            self._ensure_table(table)
+
+    def _ensure_table(self, table: str):
+        """إنشاء الجدول وفهارسه عند أول استخدام"""
+        if table in self._tables:
+            return
+        if not _TABLE_NAME.match(table):
+            raise ValueError(f"Invalid table name: {table}")
+
+        columns = "".join(f", {col} TEXT" for col in COLUMNS.get(table, ()))
+        with self._lock:
+            self._conn.execute(
+                f"CREATE TABLE IF NOT EXISTS {table} (key TEXT PRIMARY KEY{columns}, data TEXT NOT NULL)"
+            )
+            for index_columns in INDEXES.get(table, []):
+                name = f"idx_{table}_{'_'.join(index_columns)}"
+                self._conn.execute(
+                    f"CREATE INDEX IF NOT EXISTS {name} ON {table} ({', '.join(index_columns)})"
+                )
+        self._tables.add(table)
+
+    def _row_values(self, table: str, key: str, value: Dict[str, Any]) -> tuple:
+        """قيم الصف: المفتاح ثم الأعمدة المستخرجة ثم JSON"""
+        columns = tuple(value.get(col) for col in COLUMNS.get(table, ()))
+        return (key, *columns, json.dumps(value, ensure_ascii=False, default=str))
+
+    def _put(self, table: str, key: str, value: Dict[str, Any]):
+        """كتابة عنصر كما هو (إدراج أو استبدال)"""
+        self._ensure_table(table)
+        row = self._row_values(table, key, value)
+        placeholders = ", ".join("?" for _ in row)
+        with self._lock:
+            self._conn.execute(f"INSERT OR REPLACE INTO {table} VALUES ({placeholders})", row)
+
+    def get(self, table: str, key: str) -> Optional[Dict[str, Any]]:
+        """الحصول على عنصر"""
+        self._ensure_table(table)
+        with self._lock:
+            row = self._conn.execute(f"SELECT data FROM {table} WHERE key = ?", (key,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def get_all(self, table: str) -> List[Dict[str, Any]]:
+        """الحصول على جميع العناصر من جدول"""
+        self._ensure_table(table)
+        with self._lock:
+            rows = self._conn.execute(f"SELECT data FROM {table} ORDER BY rowid").fetchall()
+        return [json.loads(row[0]) for row in rows]
+
+    def insert(self, table: str, key: str, value: Dict[str, Any], durable: bool = False) -> str:
+        """إضافة عنصر جديد (كل عملية تُثبّت فوراً لذلك durable لا يغير شيئاً)"""
+        value['id'] = key
+        value['created_at'] = datetime.now().isoformat()
+        self._put(table, key, value)
+        return key
+
+    def insert_many(self, table: str, items: Dict[str, Dict[str, Any]], durable: bool = False) -> List[str]:
+        """إضافة مجموعة عناصر في معاملة واحدة"""
+        if not items:
+            return []
+
+        self._ensure_table(table)
+        now = datetime.now().isoformat()
+        rows = []
+        for key, value in items.items():
+            value['id'] = key
+            value['created_at'] = now
+            rows.append(self._row_values(table, key, value))
+
+        placeholders = ", ".join("?" for _ in rows[0])
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.executemany(f"INSERT OR REPLACE INTO {table} VALUES ({placeholders})", rows)
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return list(items.keys())
+
+    def update(self, table: str, key: str, value: Dict[str, Any], durable: bool = False) -> bool:
+        """تحديث عنصر"""
+        self._ensure_table(table)
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute(f"SELECT data FROM {table} WHERE key = ?", (key,)).fetchone()
+                if not row:
+                    self._conn.execute("ROLLBACK")
+                    return False
+
+                existing = json.loads(row[0])
+                existing.update(value)
+                existing['updated_at'] = datetime.now().isoformat()
+                self._put(table, key, existing)
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return True
+
+    def delete(self, table: str, key: str, durable: bool = False) -> bool:
+        """حذف عنصر"""
+        self._ensure_table(table)
+        with self._lock:
+            cursor = self._conn.execute(f"DELETE FROM {table} WHERE key = ?", (key,))
+        return cursor.rowcount > 0
+
+    def _where(self, table: str, filters: Dict[str, Any]) -> tuple:
+        """بناء شروط WHERE للأعمدة المستخرجة وإرجاع بقية الشروط"""
+        columns = COLUMNS.get(table, ())
+        clauses = []
+        params = []
+        remaining = {}
+        for field, value in filters.items():
+            if field in columns:
+                if value is None:
+                    clauses.append(f"{field} IS NULL")
+                else:
+                    clauses.append(f"{field} = ?")
+                    params.append(value)
+            else:
+                remaining[field] = value
+        return clauses, params, remaining
+
+    def _select(self, table: str, clauses: List[str], params: List[Any],
+                remaining: Dict[str, Any], order: str, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        """تنفيذ استعلام وتطبيق بقية الشروط"""
+        sql = f"SELECT data FROM {table}"
+        if clauses:
+            sql += " WHERE " + " AND ".join(clauses)
+        sql += f" ORDER BY {order}"
+        # الحد يُطبق في SQL فقط إن لم تتبق شروط تُفحص بعد الاستعلام
+        if limit and not remaining:
+            sql += " LIMIT ?"
+            params = [*params, limit]
+
+        with self._lock:
+            rows = self._conn.execute(sql, params).fetchall()
+
+        results = []
+        for row in rows:
+            item = json.loads(row[0])
+            if all(item.get(k) == v for k, v in remaining.items()):
+                results.append(item)
+        return results[:limit] if limit else results
+
+    def query(self, table: str, **filters) -> List[Dict[str, Any]]:
+        """استعلام بسيط (الأعمدة المستخرجة تُصفى داخل SQL)"""
+        self._ensure_table(table)
+        clauses, params, remaining = self._where(table, filters)
+        return self._select(table, clauses, params, remaining, "rowid")
+
+    def group_count(self, table: str, fields: tuple, filters: Optional[Dict[str, Any]] = None,
+                    sum_field: Optional[str] = None) -> List[Dict[str, Any]]:
+        """عدّ العناصر مجمعة حسب أعمدة (GROUP BY داخل SQLite)"""
+        self._ensure_table(table)
+        columns = COLUMNS.get(table, ())
+        if any(field not in columns for field in fields):
+            raise ValueError(f"Cannot group {table} by {fields}")
+        if sum_field and not _TABLE_NAME.match(sum_field):
+            raise ValueError(f"Invalid field name: {sum_field}")
+
+        clauses, params, remaining = self._where(table, filters or {})
+        if remaining:
+            raise ValueError(f"Cannot filter {table} by {tuple(remaining)} in SQL")
+
+        group = ", ".join(fields)
+        select = f"{group}, COUNT(*)"
+        if sum_field:
+            select += f", COALESCE(SUM(json_extract(data, '$.{sum_field}')), 0)"
+        sql = f"SELECT {select} FROM {table}"
+        if clauses:
+            sql += " WHERE " + " AND ".join(clauses)
+        sql += f" GROUP BY {group}"
+
+        with self._lock:
+            result = self._conn.execute(sql, params).fetchall()
+
+        rows = []
+        for values in result:
+            row = dict(zip(fields, values))
+            row['count'] = values[len(fields)]
+            if sum_field:
+                row[f'{sum_field}_sum'] = values[len(fields) + 1]
+            rows.append(row)
+        return rows
+
+    def query_page(self, table: str, filters: Dict[str, Any], after: Optional[tuple] = None,
+                   limit: Optional[int] = None,
+                   order_by: tuple = ('created_at', 'id')) -> List[Dict[str, Any]]:
+        """استعلام مع ترقيم بالمؤشر (keyset) داخل SQL"""
+        self._ensure_table(table)
+        clauses, params, remaining = self._where(table, filters)
+        order_column = order_by[0]
+        if order_column not in COLUMNS.get(table, ()):
+            raise ValueError(f"Cannot paginate {table} by {order_column}")
+
+        if after:
+            clauses.append(f"({order_column} > ? OR ({order_column} = ? AND key > ?))")
+            params.extend([after[0], after[0], after[1]])
+        return self._select(table, clauses, params, remaining, f"{order_column}, key", limit)
+
+    def flush(self):
+        """لا توجد كتابة معلقة - للتوافق مع LocalStorage"""
+
+    def close(self):
+        """إغلاق الاتصال"""
+        with self._lock:
+            self._conn.close()
+
+
+def migrate_from_json(json_path: str = "data/local_storage.json",
+                      db_path: str = settings.SQLITE_PATH) -> Dict[str, int]:
+    """
+    ترحيل البيانات من التخزين المحلي (JSON + السجل) إلى SQLite
+
+    Args:
+        json_path: مسار ملف التخزين المحلي
+        db_path: مسار قاعدة بيانات SQLite
+
+    Returns:
+        Dict[str, int]: عدد العناصر المرحّلة لكل جدول
+    """
+    from app.core.database import LocalStorage
+
+    source = LocalStorage(data_file=json_path)
+    target = SQLiteStorage(db_path)
+    migrated = {}
+
+    try:
+        with target._lock:
+            target._conn.execute("BEGIN")
+            try:
+                for table in list(source._data.keys()):
+                    items = source._data[table]
+                    for key, value in items.items():
+                        target._put(table, key, dict(value))
+                    migrated[table] = len(items)
+                target._conn.execute("COMMIT")
+            except Exception:
+                target._conn.execute("ROLLBACK")
+                raise
+    finally:
+        target.close()
+
+    return migrated
+
+
+if __name__ == "__main__":
+    # python -m app.core.sqlite_storage [json_path] [db_path]
+    args = sys.argv[1:]
+    counts = migrate_from_json(*args)
+    for table_name, count in counts.items():
+        print(f"Migrated {count} rows into {table_name}")
@@ -0,0 +1,135 @@
+"""
+Unit of Work - Request-Scoped Identity Map and Deferred Writes
+Brilliox Pro CRM v7.0
+"""
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Optional, Dict, Any, Hashable
+
+from app.core.cache import MISSING
+
+
+# حقول تُكتب مباشرة ولا تُؤجل: الرصيد (قراءة-تعديل-كتابة) وحالة العميل
+WRITE_THROUGH_FIELDS = frozenset({'wallet_balance', 'status'})
+
+
+class UnitOfWorkError(Exception):
+    """فشل كتابة التحديثات المؤجلة في نهاية الطلب"""
+
+
+class UnitOfWork:
+    """
+    سياق عمل لطلب واحد
+
+    يحفظ كل كيان يُقرأ مرة واحدة (identity map) فتعيد القراءات التالية
+    في نفس الطلب نفس الكائن دون الوصول إلى قاعدة البيانات، ويجمع تحديثات
+    الكيانات المقروءة لتُكتب مرة واحدة في نهاية الطلب.
+    """
+
+    def __init__(self):
+        self.identity: Dict[Hashable, Any] = {}
+        self.pending: Dict[Hashable, Dict[str, Any]] = {}
+        # بعد بدء الكتابة تُنفذ التحديثات مباشرة
+        self.closed = False
+
+    def load(self, key: Hashable, loader) -> Any:
+        """الحصول على كيان من السياق أو تحميله مرة واحدة"""
+        value = self.identity.get(key, MISSING)
+        if value is MISSING:
+            value = self.identity[key] = loader()
+        return value
+
+    async def load_async(self, key: Hashable, loader) -> Any:
+        """نفس load مع دالة تحميل غير متزامنة"""
+        value = self.identity.get(key, MISSING)
+        if value is MISSING:
+            value = self.identity[key] = await loader()
+        return value
+
+    def register(self, key: Hashable, value: Any):
+        """تسجيل كيان أُنشئ خلال الطلب"""
+        self.identity[key] = value
+
+    def defer(self, key: Hashable, changes: Dict[str, Any]) -> bool:
+        """
+        تأجيل تحديث كيان حتى نهاية الطلب
+
+        يُؤجل التحديث فقط إن كان الكيان محمّلاً وموجوداً في هذا السياق ولا
+        يمس WRITE_THROUGH_FIELDS، وإلا يرجع False ليُكتب التحديث مباشرة
+        (عبر write_through).
+        """
+        entity = self.identity.get(key)
+        if self.closed or not isinstance(entity, dict) or not WRITE_THROUGH_FIELDS.isdisjoint(changes):
+            return False
+        entity.update(changes)
+        self.pending.setdefault(key, {}).update(changes)
+        return True
+
+    def write_through(self, key: Hashable, changes: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        تحديث يُكتب مباشرة مدمجاً مع التحديثات المؤجلة لنفس الكيان
+
+        تُكتب التحديثات السابقة معه حتى لا تسبقها كتابة لاحقة. عند فشل
+        الكتابة يجب استدعاء forget ليُعاد تحميل الكيان.
+        """
+        pending = self.pending.pop(key, None)
+        entity = self.identity.get(key)
+        if isinstance(entity, dict):
+            entity.update(changes)
+        return {**pending, **changes} if pending else changes
+
+    def refresh(self, key: Hashable, value: Any) -> Any:
+        """
+        استبدال كيان بقراءة جديدة من قاعدة البيانات
+
+        القاموس المحمّل يُحدّث في مكانه (فيرى من يحمله القيم الجديدة) مع
+        إبقاء التحديثات المؤجلة عليه.
+        """
+        entity = self.identity.get(key)
+        if isinstance(value, dict):
+            if isinstance(entity, dict) and entity is not value:
+                entity.clear()
+                entity.update(value)
+                value = entity
+            value.update(self.pending.get(key, {}))
+        self.identity[key] = value
+        return value
+
+    def forget(self, key: Hashable):
+        """إزالة كيان من السياق ليُقرأ من جديد"""
+        self.identity.pop(key, None)
+        self.pending.pop(key, None)
+
+    def discard(self, key: Hashable):
+        """إزالة كيان محذوف وتحديثاته المؤجلة"""
+        self.identity[key] = None
+        self.pending.pop(key, None)
+
+    def take_pending(self) -> Dict[Hashable, Dict[str, Any]]:
+        """التحديثات المؤجلة للكتابة (وإغلاق السياق أمام تأجيل المزيد)"""
+        self.closed = True
+        pending, self.pending = self.pending, {}
+        return pending
+
+    def rollback(self):
+        """إلغاء التحديثات المؤجلة (عند فشل الطلب)"""
+        self.closed = True
+        self.pending = {}
+
+
+_current_unit: ContextVar[Optional[UnitOfWork]] = ContextVar('unit_of_work', default=None)
+
+
+def current_unit() -> Optional[UnitOfWork]:
+    """سياق العمل النشط للطلب الحالي (أو None)"""
+    return _current_unit.get()
+
+
+@contextmanager
+def activate(unit: UnitOfWork):
+    """تفعيل سياق عمل داخل الكتلة"""
+    token = _current_unit.set(unit)
+    try:
+        yield unit
+    finally:
+        _current_unit.reset(token)
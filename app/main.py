@@ -2,6 +2,7 @@
 Main Application Entry Point
 Brilliox Pro CRM v7.0
 """
+import asyncio
 import os
 import sys
 
@@ -16,6 +17,9 @@ from starlette.middleware.base import BaseHTTPMiddleware
 
 from app.core.config import settings
 from app.core.database import init_db
+from app.core.async_database import AsyncDatabaseOperations, close_async_db
+from app.core.ai_clients import close_ai_clients
+from app.core.unit_of_work import UnitOfWork, UnitOfWorkError, activate
 from app.core.security import rate_limit
 from app.core.events import unified_system, SystemEvent
 from app.router import router
@@ -44,6 +48,35 @@ class SecurityMiddleware(BaseHTTPMiddleware):
         return response
 
 
+class UnitOfWorkMiddleware(BaseHTTPMiddleware):
+    """
+    سياق عمل لكل طلب: قراءة كل كيان مرة واحدة وكتابة التحديثات في النهاية
+
+    التحديثات المؤجلة تُكتب قبل إرسال الاستجابة؛ فشلها يحول الاستجابة إلى
+    500، وتُلغى إن فشل الطلب نفسه.
+    """
+
+    async def dispatch(self, request: Request, call_next):
+        unit = UnitOfWork()
+        try:
+            with activate(unit):
+                response = await call_next(request)
+        except BaseException:
+            unit.rollback()
+            raise
+
+        if response.status_code >= 500:
+            unit.rollback()
+            return response
+
+        try:
+            await AsyncDatabaseOperations.flush_unit(unit)
+        except UnitOfWorkError as e:
+            print(f"Error saving request changes: {e}")
+            return JSONResponse({"error": "تعذر حفظ التغييرات"}, status_code=500)
+        return response
+
+
 # ==================== إنشاء التطبيق ====================
 
 app = FastAPI(
@@ -57,6 +90,7 @@ app = FastAPI(
 
 # ==================== إضافة Middleware ====================
 
+app.add_middleware(UnitOfWorkMiddleware)
 app.add_middleware(SecurityMiddleware)
 app.add_middleware(
     CORSMiddleware,
@@ -149,6 +183,15 @@ async def root():
     """)
 
 
+@app.on_event("shutdown")
+async def shutdown():
+    """إغلاق الاتصالات وحفظ بيانات النظام المعلقة عند إيقاف التطبيق"""
+    await close_async_db()
+    await close_ai_clients()
+    await asyncio.to_thread(unified_system.drain, settings.EVENT_LISTENER_TIMEOUT)
+    unified_system.flush()
+
+
 # تهيئة النظام عند الاستيراد (لـ Vercel)
 try:
     print("Initializing Brilliox Pro CRM v7.0...")
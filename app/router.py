@@ -2,6 +2,8 @@
 API Routes - All Endpoints
 Brilliox Pro CRM v7.0
 """
+import asyncio
+
 from fastapi import APIRouter, HTTPException, Depends, Query
 from fastapi.responses import HTMLResponse, JSONResponse
 from typing import Optional, List
@@ -9,6 +11,10 @@ from pydantic import BaseModel, field_validator
 
 from app.core.config import settings
 from app.core.security import sanitize_input
+from app.core.database import LEAD_FIELDS, parse_cursor, make_cursor, supabase_breaker
+from app.core.cache import entity_cache
+from app.core.projections import rebuild_lead_projections
+from app.core.events import unified_system
 from app.core.i18n import t
 from app.services.user_service import UserService
 from app.services.lead_service import LeadService, LeadScorer
@@ -86,12 +92,16 @@ async def index():
 @router.get("/health")
 async def health_check():
     """فحص صحة النظام"""
+    breaker = supabase_breaker.stats()
     return {
-        "status": "healthy",
+        # عند فتح الدائرة يعمل النظام على التخزين المحلي
+        "status": "healthy" if breaker["state"] == "closed" else "degraded",
         "version": "7.0.0",
         "app": "Brilliox Pro CRM",
         "database": "local",
-        "environment": "test"
+        "environment": "test",
+        "cache": entity_cache.stats(),
+        "circuit_breaker": breaker
     }
 
 
@@ -112,11 +122,11 @@ async def get_translations(lang: str = "ar"):
 async def login(data: UserCreate):
     """تسجيل الدخول / التسجيل"""
     if data.password:
-        user = UserService.login_with_password(data.username, data.password)
+        user = await UserService.login_with_password_async(data.username, data.password)
         if not user:
             raise HTTPException(status_code=401, detail="اسم المستخدم أو كلمة المرور غير صحيحة")
     else:
-        user = UserService.get_or_create(data.username)
+        user = await UserService.get_or_create_async(data.username)
 
     has_password = bool(user.get("password", ""))
 
@@ -132,7 +142,7 @@ async def login(data: UserCreate):
 @router.post("/api/user/{user_id}/change-password")
 async def change_password(user_id: str, data: ChangePasswordRequest):
     """تغيير كلمة المرور"""
-    success, message = UserService.change_password(user_id, data.old_password, data.new_password)
+    success, message = await UserService.change_password_async(user_id, data.old_password, data.new_password)
 
     if success:
         return {"success": True, "message": message}
@@ -142,7 +152,7 @@ async def change_password(user_id: str, data: ChangePasswordRequest):
 @router.get("/api/wallet/{user_id}")
 async def get_wallet(user_id: str):
     """الحصول على المحفظة"""
-    user = UserService.get_or_create(user_id)
+    user = await UserService.get_or_create_async(user_id)
     return {
         "user_id": user_id,
         "wallet_balance": user.get("wallet_balance", 0),
@@ -162,15 +172,16 @@ async def chat(user_id: str, data: ChatRequest):
         result = await AIService.generate_response(
             prompt=message,
             use_cache=True,
-            cost=settings.CHAT_COST
+            cost=settings.CHAT_COST,
+            user_id=user_id
         )
 
         if result.get("success"):
             # خصم الرصيد
             if result.get("tokens_used", 0) > 0:
-                UserService.deduct_balance(user_id, result["tokens_used"])
+                await UserService.deduct_balance_async(user_id, result["tokens_used"])
 
-            user = UserService.get_or_create(user_id)
+            user = await UserService.get_or_create_async(user_id)
             result["remaining_balance"] = user.get("wallet_balance", 0)
 
         return result
@@ -186,20 +197,39 @@ async def chat(user_id: str, data: ChatRequest):
 # ==================== إدارة العملاء ====================
 
 @router.get("/api/leads/{user_id}")
-async def get_leads(user_id: str, status: Optional[str] = None):
-    """الحصول على عملاء المستخدم"""
-    leads = LeadService.get_user_leads(user_id)
+async def get_leads(
+    user_id: str,
+    status: Optional[str] = None,
+    source: Optional[str] = None,
+    after: Optional[str] = None,
+    limit: int = Query(settings.LEADS_PAGE_SIZE, ge=1, le=settings.LEADS_MAX_PAGE_SIZE),
+    fields: Optional[str] = None
+):
+    """الحصول على عملاء المستخدم (صفحة واحدة مرتبة حسب created_at ثم id)"""
+    try:
+        cursor = parse_cursor(after)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="مؤشر الصفحة غير صالح")
+
+    field_list = None
+    if fields:
+        field_list = [f.strip() for f in fields.split(",") if f.strip()]
+        unknown = [f for f in field_list if f not in LEAD_FIELDS]
+        if unknown:
+            raise HTTPException(status_code=400, detail=f"حقول غير معروفة: {', '.join(unknown)}")
 
-    if status:
-        leads = [l for l in leads if l.get("status") == status]
+    leads = await LeadService.get_user_leads_async(
+        user_id, status=status, source=source, after=cursor, limit=limit, fields=field_list
+    )
+    next_cursor = make_cursor(leads[-1]) if len(leads) == limit else None
 
-    return {"leads": leads, "count": len(leads)}
+    return {"leads": leads, "count": len(leads), "next_cursor": next_cursor}
 
 
 @router.get("/api/leads/{user_id}/scored")
 async def get_scored_leads(user_id: str):
     """الحصول على عملاء مع التقييم"""
-    leads = LeadService.get_user_leads(user_id)
+    leads = await LeadService.get_user_leads_async(user_id)
     scored_leads = LeadScorer.score_leads_batch(leads)
     return {"leads": scored_leads, "count": len(scored_leads)}
 
@@ -207,7 +237,7 @@ async def get_scored_leads(user_id: str):
 @router.get("/api/leads/{user_id}/insights")
 async def get_lead_insights(user_id: str):
     """الحصول على رؤى العملاء"""
-    leads = LeadService.get_user_leads(user_id)
+    leads = await LeadService.get_user_leads_async(user_id)
     return LeadScorer.get_insights(leads)
 
 
@@ -223,7 +253,7 @@ async def add_lead(user_id: str, data: AddLeadRequest):
         "source": "manual"
     }
 
-    lead_id = LeadService.add_lead(user_id, lead_data)
+    lead_id = await LeadService.add_lead_async(user_id, lead_data)
 
     return {"success": True, "lead_id": lead_id, "message": "تم إضافة العميل بنجاح"}
 
@@ -231,7 +261,7 @@ async def add_lead(user_id: str, data: AddLeadRequest):
 @router.post("/api/leads/{user_id}/import")
 async def import_leads(user_id: str, data: ImportLeadsRequest):
     """استيراد عملاء"""
-    result = LeadService.import_leads(user_id, data.leads)
+    result = await LeadService.import_leads_async(user_id, data.leads)
 
     return {
         "success": True,
@@ -255,7 +285,7 @@ async def update_lead(lead_id: str, data: UpdateLeadRequest):
     if data.notes:
         updates['notes'] = sanitize_input(data.notes)
 
-    success = LeadService.update_lead(lead_id, updates)
+    success = await LeadService.update_lead_async(lead_id, updates)
 
     if success:
         return {"success": True, "message": "تم التحديث بنجاح"}
@@ -265,7 +295,7 @@ async def update_lead(lead_id: str, data: UpdateLeadRequest):
 @router.delete("/api/leads/{lead_id}")
 async def delete_lead(lead_id: str):
     """حذف عميل"""
-    if LeadService.delete_lead(lead_id):
+    if await LeadService.delete_lead_async(lead_id):
         return {"success": True, "message": "تم الحذف بنجاح"}
     raise HTTPException(status_code=404, detail="العميل غير موجود")
 
@@ -275,8 +305,8 @@ async def delete_lead(lead_id: str):
 @router.get("/api/stats/{user_id}")
 async def get_stats(user_id: str):
     """الحصول على الإحصائيات"""
-    user = UserService.get_or_create(user_id)
-    lead_stats = LeadService.get_lead_stats(user_id)
+    user = await UserService.get_or_create_async(user_id)
+    lead_stats = await LeadService.get_lead_stats_async(user_id)
 
     return {
         "user_id": user_id,
@@ -285,6 +315,25 @@ async def get_stats(user_id: str):
     }
 
 
+@router.post("/api/admin/{user_id}/projections/rebuild")
+async def rebuild_projections(user_id: str):
+    """إعادة بناء إحصائيات العملاء من قاعدة البيانات (للأدمن)"""
+    if not UserService.is_admin(user_id):
+        raise HTTPException(status_code=403, detail="غير مصرح")
+
+    projections = await asyncio.to_thread(rebuild_lead_projections)
+    return {"success": True, "projections": projections}
+
+
+@router.get("/api/admin/{user_id}/events/metrics")
+async def event_metrics(user_id: str, top: Optional[int] = Query(None, ge=1)):
+    """قياسات نظام الأحداث: عدد الأحداث ومدد المستمعين والقواعد والحفظ (للأدمن)"""
+    if not UserService.is_admin(user_id):
+        raise HTTPException(status_code=403, detail="غير مصرح")
+
+    return unified_system.get_metrics(top)
+
+
 # ==================== Webhooks ====================
 
 @router.post("/webhook/lead")
@@ -310,7 +359,7 @@ async def webhook_lead(request_data: dict):
             "notes": f"Campaign: {campaign}" if campaign else None
         }
 
-        lead_id = LeadService.add_lead("admin", lead_data)
+        lead_id = await LeadService.add_lead_async("admin", lead_data)
 
         return {"success": True, "lead_id": lead_id, "message": "Lead received"}
 
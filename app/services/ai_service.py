@@ -2,13 +2,17 @@
 AI Service - Hybrid AI Engine with Multiple Provider Fallback
 Brilliox Pro CRM v7.0
 """
+import asyncio
+import math
 import time
 import hashlib
+from collections import deque
 from datetime import datetime
-from typing import Optional, Dict, Any, List
+from typing import Optional, Dict, Any, List, Tuple, Callable, Awaitable
 import json
 
 from app.core.config import settings
+from app.core.ai_clients import ai_clients
 from app.core.events import unified_system, SystemEvent
 
 
@@ -37,6 +41,53 @@ def cache_response(key: str, response: str):
     AI_CACHE[key] = {"response": response, "timestamp": time.time()}
 
 
+# أزمنة آخر الاستجابات الناجحة لكل مزود (نافذة منزلقة بالثواني)
+PROVIDER_LATENCY: Dict[str, deque] = {}
+
+Provider = Tuple[str, Callable[..., Awaitable[Optional[str]]]]
+
+
+def with_learned_context(prompt: str, user_id: str) -> str:
+    """
+    الرسالة مع إجابات سابقة لنفس المستخدم على أسئلة مشابهة
+
+    الأسئلة المشابهة تُختار من الأنماط المتعلمة بالكلمات المفتاحية. تُضاف
+    للرسالة لا لتعليمات النظام، فتبقى التعليمات ثابتة بين المستخدمين.
+    """
+    matches = unified_system.match_patterns(
+        prompt, settings.AI_PATTERN_CONTEXT, where={"type": "chat", "user_id": user_id}
+    )
+    if not matches:
+        return prompt
+    examples = "\n".join(
+        f"- سؤال: {pattern.get('trigger', '')}\n  إجابة: {pattern.get('response', '')}"
+        for pattern in matches
+    )
+    return f"## أسئلة سابقة مشابهة من نفس المستخدم وإجاباتها:\n{examples}\n\n## السؤال الحالي:\n{prompt}"
+
+
+def record_provider_latency(provider: str, seconds: float):
+    """تسجيل زمن استجابة ناجحة لمزود"""
+    samples = PROVIDER_LATENCY.get(provider)
+    if samples is None:
+        samples = PROVIDER_LATENCY[provider] = deque(maxlen=settings.AI_LATENCY_WINDOW)
+    samples.append(seconds)
+
+
+def hedge_delay(provider: str) -> float:
+    """
+    مهلة انتظار المزود قبل تشغيل التالي بالتوازي
+
+    p95 لآخر AI_LATENCY_WINDOW استجابة بعد AI_HEDGE_MIN_SAMPLES استجابة،
+    وقبلها AI_HEDGE_DELAY.
+    """
+    samples = PROVIDER_LATENCY.get(provider)
+    if not samples or len(samples) < settings.AI_HEDGE_MIN_SAMPLES:
+        return settings.AI_HEDGE_DELAY
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, math.ceil(0.95 * len(ordered)) - 1)]
+
+
 class AIService:
     """خدمة الذكاء الاصطناعي مع سلسلة احتياطية"""
 
@@ -143,21 +194,19 @@ class AIService:
 3. المعادلة تجد الناس اللي بتدور على الخدمة، مش مقدمين الخدمة"""
 
     @staticmethod
-    def call_openai(prompt: str, system_prompt: Optional[str] = None) -> Optional[str]:
+    async def call_openai(prompt: str, system_prompt: Optional[str] = None) -> Optional[str]:
         """استدعاء OpenAI API"""
-        if not settings.OPENAI_API_KEY:
+        client = ai_clients.get("openai")
+        if client is None:
             return None
 
         try:
-            from openai import OpenAI
-            client = OpenAI(api_key=settings.OPENAI_API_KEY, base_url=settings.OPENAI_BASE_URL)
-
             messages = [
                 {"role": "system", "content": system_prompt or AIService.SYSTEM_PROMPT},
                 {"role": "user", "content": prompt}
             ]
 
-            response = client.chat.completions.create(
+            response = await client.chat.completions.create(
                 model=settings.OPENAI_MODEL,
                 messages=messages,
                 temperature=0.7,
@@ -171,21 +220,17 @@ class AIService:
             return None
 
     @staticmethod
-    def call_gemini(prompt: str, system_prompt: Optional[str] = None) -> Optional[str]:
+    async def call_gemini(prompt: str, system_prompt: Optional[str] = None) -> Optional[str]:
         """استدعاء Google Gemini API"""
         if not settings.GOOGLE_API_KEY:
             return None
 
         try:
-            import google.generativeai as genai
-            genai.configure(api_key=settings.GOOGLE_API_KEY)
-
-            model = genai.GenerativeModel(
-                model_name=settings.GOOGLE_MODEL,
-                system_instruction=system_prompt or AIService.SYSTEM_PROMPT
-            )
+            model = ai_clients.gemini_model(system_prompt or AIService.SYSTEM_PROMPT)
+            if model is None:
+                return None
 
-            response = model.generate_content(prompt)
+            response = await model.generate_content_async(prompt)
             return response.text
 
         except Exception as e:
@@ -193,16 +238,14 @@ class AIService:
             return None
 
     @staticmethod
-    def call_anthropic(prompt: str, system_prompt: Optional[str] = None) -> Optional[str]:
+    async def call_anthropic(prompt: str, system_prompt: Optional[str] = None) -> Optional[str]:
         """استدعاء Anthropic Claude API"""
-        if not settings.ANTHROPIC_API_KEY:
+        client = ai_clients.get("anthropic")
+        if client is None:
             return None
 
         try:
-            from anthropic import Anthropic
-            client = Anthropic(api_key=settings.ANTHROPIC_API_KEY)
-
-            response = client.messages.create(
+            response = await client.messages.create(
                 model=settings.ANTHROPIC_MODEL,
                 max_tokens=2000,
                 system=system_prompt or AIService.SYSTEM_PROMPT,
@@ -218,21 +261,19 @@ class AIService:
             return None
 
     @staticmethod
-    def call_groq(prompt: str, system_prompt: Optional[str] = None) -> Optional[str]:
+    async def call_groq(prompt: str, system_prompt: Optional[str] = None) -> Optional[str]:
         """استدعاء Groq API"""
-        if not settings.GROQ_API_KEY:
+        client = ai_clients.get("groq")
+        if client is None:
             return None
 
         try:
-            from groq import Groq
-            client = Groq(api_key=settings.GROQ_API_KEY)
-
             messages = [
                 {"role": "system", "content": system_prompt or AIService.SYSTEM_PROMPT},
                 {"role": "user", "content": prompt}
             ]
 
-            response = client.chat.completions.create(
+            response = await client.chat.completions.create(
                 model=settings.GROQ_MODEL,
                 messages=messages,
                 temperature=0.7,
@@ -250,7 +291,8 @@ class AIService:
         prompt: str,
         system_prompt: Optional[str] = None,
         use_cache: bool = True,
-        cost: int = settings.CHAT_COST
+        cost: int = settings.CHAT_COST,
+        user_id: Optional[str] = None
     ) -> Dict[str, Any]:
         """
         توليد استجابة ذكية
@@ -260,14 +302,20 @@ class AIService:
             system_prompt: نظام التوجيه المخصص
             use_cache: استخدام التخزين المؤقت
             cost: تكلفة الاستجابة
+            user_id: المستخدم (لتعلم أسئلته واستخدام إجاباته السابقة المشابهة)
 
         Returns:
             Dict[str, Any]: النتيجة مع البيانات الوصفية
         """
         start_time = time.time()
 
+        learn = bool(user_id) and settings.AI_PATTERN_CONTEXT > 0
+        message = with_learned_context(prompt, user_id) if learn else prompt
+
         # محاولة الحصول على استجابة مخبأة
-        cache_key = get_cache_key(prompt, system_prompt or "")
+        # الرسالة مع سجل المستخدم تُخبأ له وحده فلا تصل إجاباتها لغيره
+        scope = f"{user_id}:" if message != prompt else ""
+        cache_key = get_cache_key(message, scope + (system_prompt or ""))
         if use_cache:
             cached = get_cached_response(cache_key)
             if cached:
@@ -287,18 +335,14 @@ class AIService:
             ("Anthropic", AIService.call_anthropic),
         ]
 
-        response = None
-        provider_used = None
-
-        for provider_name, provider_func in providers:
-            if provider_name == "Gemini":
-                response = await asyncio_coroutine(provider_func, prompt, system_prompt)
-            else:
-                response = provider_func(prompt, system_prompt)
-
-            if response:
-                provider_used = provider_name
-                break
+        chain = AIService._hedged if settings.AI_HEDGING else AIService._sequential
+        try:
+            provider_used, response = await asyncio.wait_for(
+                chain(providers, message, system_prompt), settings.AI_DEADLINE
+            )
+        except asyncio.TimeoutError:
+            print(f"AI providers exceeded the {settings.AI_DEADLINE}s deadline")
+            provider_used, response = None, None
 
         response_time = time.time() - start_time
 
@@ -315,6 +359,14 @@ class AIService:
                     "provider": provider_used,
                     "response_time": response_time
                 })
+                if learn:
+                    unified_system.learn_pattern({
+                        "type": "chat",
+                        "user_id": user_id,
+                        "trigger": prompt[:300],
+                        "response": response[:500],
+                        "provider": provider_used
+                    })
 
             return {
                 "success": True,
@@ -333,7 +385,70 @@ class AIService:
         }
 
     @staticmethod
-    def generate_hunt_query(user_profession: str, location: str = "", extra: str = "") -> str:
+    async def _call(provider: Provider, prompt: str, system_prompt: Optional[str]) -> Optional[str]:
+        """استدعاء مزود وتسجيل زمنه عند النجاح"""
+        name, func = provider
+        started = time.perf_counter()
+        response = await func(prompt, system_prompt)
+        if response:
+            record_provider_latency(name, time.perf_counter() - started)
+        return response
+
+    @staticmethod
+    async def _sequential(providers: List[Provider], prompt: str,
+                          system_prompt: Optional[str]) -> Tuple[Optional[str], Optional[str]]:
+        """المزودون بالترتيب: التالي يبدأ بعد فشل السابق"""
+        for provider in providers:
+            response = await AIService._call(provider, prompt, system_prompt)
+            if response:
+                return provider[0], response
+        return None, None
+
+    @staticmethod
+    async def _hedged(providers: List[Provider], prompt: str,
+                      system_prompt: Optional[str]) -> Tuple[Optional[str], Optional[str]]:
+        """
+        المزودون بالتحوط: يبدأ الأول، وإن لم يرد خلال hedge_delay (أو فشل)
+        يبدأ التالي بالتوازي. أول استجابة ناجحة تُعتمد وتُلغى البقية.
+        """
+        waiting = list(providers)
+        running: Dict[asyncio.Task, int] = {}
+        order = {name: position for position, (name, _) in enumerate(providers)}
+        last = None
+
+        def launch():
+            nonlocal last
+            provider = waiting.pop(0)
+            task = asyncio.ensure_future(AIService._call(provider, prompt, system_prompt))
+            running[task] = order[provider[0]]
+            last = provider[0]
+
+        try:
+            launch()
+            while running:
+                timeout = hedge_delay(last) if waiting else None
+                done, _ = await asyncio.wait(running, timeout=timeout,
+                                             return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    # المزود الأخير تجاوز مهلته: تشغيل التالي دون إلغائه
+                    launch()
+                    continue
+
+                # عند اكتمال أكثر من مزود معاً يُفضل الأسبق في السلسلة
+                for task in sorted(done, key=running.get):
+                    position = running.pop(task)
+                    response = task.result()
+                    if response:
+                        return providers[position][0], response
+                if waiting:
+                    launch()
+            return None, None
+        finally:
+            for task in running:
+                task.cancel()
+
+    @staticmethod
+    async def generate_hunt_query(user_profession: str, location: str = "", extra: str = "") -> str:
         """توليد معادلة بحث للاصطياد"""
         prompt = f"أحتاج صياغة بحث لإيجاد عملاء محتملين لمهنة: {user_profession}"
 
@@ -342,10 +457,10 @@ class AIService:
         if extra:
             prompt += f"، مع التركيز على: {extra}"
 
-        return AIService.call_openai(prompt, AIService.HUNT_PROMPT) or ""
+        return await AIService.call_openai(prompt, AIService.HUNT_PROMPT) or ""
 
     @staticmethod
-    def generate_ad_copy(
+    async def generate_ad_copy(
         product_name: str,
         product_description: str,
         target_audience: str,
@@ -361,19 +476,9 @@ class AIService:
         اكتب نسخة إعلان كاملة (Hook، Body، CTA)
         """
 
-        response = AIService.call_openai(prompt, AIService.AD_PROMPT)
+        response = await AIService.call_openai(prompt, AIService.AD_PROMPT)
 
         return {
             "ad_copy": response or "لم أتمكن من توليد الإعلان",
             "platform": platform
         }
-
-
-async def asyncio_coroutine(func, *args, **kwargs):
-    """تشغيل دالة متزامنة كروتين غير متزامن"""
-    import asyncio
-    loop = asyncio.new_event_loop()
-    try:
-        return await loop.run_in_executor(None, lambda: func(*args, **kwargs))
-    finally:
-        loop.close()
@@ -2,13 +2,16 @@
 Lead Service - Lead Management and Scoring
 Brilliox Pro CRM v7.0
 """
+import asyncio
 import uuid
 from typing import Optional, Dict, Any, List
 from datetime import datetime
 
 from app.core.config import settings
-from app.core.database import DatabaseOperations
+from app.core.database import DatabaseOperations, supabase_breaker
+from app.core.async_database import AsyncDatabaseOperations
 from app.core.events import unified_system, SystemEvent, LeadStage
+from app.core.projections import lead_projection
 
 
 class LeadService:
@@ -27,7 +30,20 @@ class LeadService:
             str: معرف العميل الجديد
         """
         # تنظيف البيانات
-        clean_data = {
+        clean_data = LeadService._clean_lead_data(user_id, lead_data)
+
+        # إضافة العميل
+        lead_id = DatabaseOperations.add_lead(user_id, clean_data)
+
+        # إرسال حدث
+        LeadService._emit_lead_added(lead_id, user_id, clean_data)
+
+        return lead_id
+
+    @staticmethod
+    def _clean_lead_data(user_id: str, lead_data: Dict[str, Any]) -> Dict[str, Any]:
+        """تنظيف بيانات العميل قبل الحفظ"""
+        return {
             'name': str(lead_data.get('name', '')).strip(),
             'phone': str(lead_data.get('phone', '')).strip(),
             'email': str(lead_data.get('email', '')).strip() if lead_data.get('email') else None,
@@ -39,24 +55,52 @@ class LeadService:
             'user_id': user_id
         }
 
-        # إضافة العميل
-        lead_id = DatabaseOperations.add_lead(user_id, clean_data)
-
-        # إرسال حدث
+    @staticmethod
+    def _emit_lead_added(lead_id: str, user_id: str, clean_data: Dict[str, Any]) -> None:
+        """إرسال حدث إضافة عميل"""
         if unified_system:
             unified_system.emit(SystemEvent.LEAD_ADDED, {
                 'lead_id': lead_id,
                 'user_id': user_id,
+                'status': clean_data['status'],
                 'source': clean_data['source'],
                 'name': clean_data['name']
             })
 
-        return lead_id
+    @staticmethod
+    def _emit_status_changed(lead: Optional[Dict[str, Any]], lead_id: str, new_status: str) -> None:
+        """إرسال حدث تغيير الحالة (lead: العميل قبل التحديث)"""
+        old_status = lead.get('status') if lead else None
+        if unified_system and lead and old_status != new_status:
+            unified_system.emit(SystemEvent.LEAD_STAGE_CHANGED, {
+                'lead_id': lead_id,
+                'user_id': lead.get('user_id'),
+                'source': lead.get('source'),
+                'old_status': old_status,
+                'new_status': new_status
+            })
 
     @staticmethod
-    def get_user_leads(user_id: str) -> List[Dict[str, Any]]:
-        """الحصول على عملاء المستخدم"""
-        return DatabaseOperations.get_leads(user_id)
+    def _emit_lead_deleted(lead: Optional[Dict[str, Any]], lead_id: str) -> None:
+        """إرسال حدث حذف عميل (lead: العميل قبل الحذف)"""
+        if unified_system and lead:
+            unified_system.emit(SystemEvent.LEAD_DELETED, {
+                'lead_id': lead_id,
+                'user_id': lead.get('user_id'),
+                'status': lead.get('status'),
+                'source': lead.get('source')
+            })
+
+    @staticmethod
+    def get_user_leads(user_id: str, **options) -> List[Dict[str, Any]]:
+        """
+        الحصول على عملاء المستخدم
+
+        Args:
+            user_id: معرف المستخدم
+            **options: status, source, after, limit, fields (انظر DatabaseOperations.get_leads)
+        """
+        return DatabaseOperations.get_leads(user_id, **options)
 
     @staticmethod
     def get_all_leads() -> List[Dict[str, Any]]:
@@ -65,59 +109,32 @@ class LeadService:
 
     @staticmethod
     def update_lead(lead_id: str, updates: Dict[str, Any]) -> bool:
-        """تحديث بيانات عميل"""
+        """تحديث بيانات عميل (تغيير الحالة يرسل LEAD_STAGE_CHANGED)"""
         updates['updated_at'] = datetime.now().isoformat()
+        if 'status' not in updates:
+            return DatabaseOperations.update_lead(lead_id, updates)
 
-        client = get_supabase_client()
-        if client:
-            try:
-                result = client.table('leads').update(updates).eq('id', lead_id).execute()
-                return bool(result.data)
-            except Exception as e:
-                print(f"Error updating lead: {e}")
-
-        return False
+        # نسخة قبل التحديث (الكيان في سياق الطلب يُعدّل في مكانه)
+        lead = LeadService.get_lead_by_id(lead_id)
+        lead = dict(lead) if lead else None
+        success = DatabaseOperations.update_lead(lead_id, updates)
+        if success:
+            LeadService._emit_status_changed(lead, lead_id, updates['status'])
+        return success
 
     @staticmethod
     def update_lead_status(lead_id: str, new_status: str) -> bool:
         """تحديث حالة العميل"""
-        old_status = None
-
-        # الحصول على الحالة القديمة
-        client = get_supabase_client()
-        if client:
-            try:
-                result = client.table('leads').select('status').eq('id', lead_id).execute()
-                if result.data:
-                    old_status = result.data[0].get('status')
-            except Exception as e:
-                print(f"Error getting lead status: {e}")
-
-        # التحديث
-        success = LeadService.update_lead(lead_id, {'status': new_status})
-
-        if success and old_status != new_status:
-            if unified_system:
-                unified_system.emit(SystemEvent.LEAD_STAGE_CHANGED, {
-                    'lead_id': lead_id,
-                    'old_status': old_status,
-                    'new_status': new_status
-                })
-
-        return success
+        return LeadService.update_lead(lead_id, {'status': new_status})
 
     @staticmethod
     def delete_lead(lead_id: str) -> bool:
         """حذف عميل"""
-        client = get_supabase_client()
-        if client:
-            try:
-                result = client.table('leads').delete().eq('id', lead_id).execute()
-                return bool(result.data)
-            except Exception as e:
-                print(f"Error deleting lead: {e}")
-
-        return False
+        lead = LeadService.get_lead_by_id(lead_id)
+        success = DatabaseOperations.delete_lead(lead_id)
+        if success:
+            LeadService._emit_lead_deleted(lead, lead_id)
+        return success
 
     @staticmethod
     def share_lead(user_id: str, share_with: str, lead_id: str,
@@ -141,8 +158,9 @@ class LeadService:
         client = get_supabase_client()
         if client:
             try:
-                result = client.table('lead_shares').insert(share_data).execute()
-                return bool(result.data)
+                with supabase_breaker:
+                    result = client.table('lead_shares').insert(share_data).execute()
+                    return bool(result.data)
             except Exception as e:
                 print(f"Error sharing lead: {e}")
 
@@ -151,32 +169,32 @@ class LeadService:
     @staticmethod
     def get_lead_by_id(lead_id: str) -> Optional[Dict[str, Any]]:
         """الحصول على عميل بالمعرف"""
-        client = get_supabase_client()
-        if client:
-            try:
-                result = client.table('leads').select('*').eq('id', lead_id).execute()
-                return result.data[0] if result.data else None
-            except Exception as e:
-                print(f"Error getting lead: {e}")
-
-        return None
+        return DatabaseOperations.get_lead_by_id(lead_id)
 
     @staticmethod
     def get_lead_stats(user_id: str) -> Dict[str, Any]:
-        """الحصول على إحصائيات العملاء"""
-        leads = LeadService.get_user_leads(user_id)
+        """الحصول على إحصائيات العملاء (من الإسقاطات المحدثة بالأحداث)"""
+        return LeadService._summarize(LeadService.get_lead_projection(user_id))
+
+    @staticmethod
+    def get_lead_projection(user_id: Optional[str] = None) -> Dict[str, Any]:
+        """عدادات العملاء المحدثة بالأحداث: total و by_status و by_source (لمستخدم أو للجميع)"""
+        return lead_projection.snapshot(user_id)
 
+    @staticmethod
+    def get_lead_aggregates(user_id: Optional[str] = None) -> Dict[str, Any]:
+        """تجميعات العملاء حسب الحالة والمصدر (لمستخدم أو للجميع)"""
+        return DatabaseOperations.get_lead_stats(user_id)
+
+    @staticmethod
+    def _summarize(aggregates: Dict[str, Any]) -> Dict[str, Any]:
+        """تحويل التجميعات إلى إحصائيات المستخدم"""
         stats = {
-            'total': len(leads),
-            'by_status': {},
+            'total': aggregates['total'],
+            'by_status': dict(aggregates['by_status']),
             'conversion_rate': 0.0
         }
 
-        # حساب الإحصائيات حسب الحالة
-        for lead in leads:
-            status = lead.get('status', 'unknown')
-            stats['by_status'][status] = stats['by_status'].get(status, 0) + 1
-
         # حساب معدل التحويل
         closed = stats['by_status'].get('closed', 0)
         if stats['total'] > 0:
@@ -187,9 +205,33 @@ class LeadService:
     @staticmethod
     def import_leads(user_id: str, leads_data: List[Dict[str, Any]]) -> Dict[str, int]:
         """استيراد مجموعة من العملاء"""
+        clean_leads, errors = LeadService._clean_import(user_id, leads_data)
         imported = 0
-        duplicates = 0
+
+        # إدراج جماعي بدلاً من إضافة كل عميل على حدة
+        if clean_leads:
+            try:
+                lead_ids = DatabaseOperations.add_leads_bulk(user_id, clean_leads)
+            except Exception as e:
+                print(f"Error importing leads: {e}")
+                lead_ids = []
+                errors += len(clean_leads)
+
+            for lead_id, clean_data in zip(lead_ids, clean_leads):
+                LeadService._emit_lead_added(lead_id, user_id, clean_data)
+            imported = len(lead_ids)
+
+        return {
+            'imported': imported,
+            'duplicates': 0,
+            'errors': errors
+        }
+
+    @staticmethod
+    def _clean_import(user_id: str, leads_data: List[Dict[str, Any]]) -> tuple:
+        """تنظيف صفوف الاستيراد وإرجاع (الصفوف الصالحة, عدد الأخطاء)"""
         errors = 0
+        clean_leads = []
 
         for lead in leads_data:
             try:
@@ -197,21 +239,86 @@ class LeadService:
                     errors += 1
                     continue
 
-                LeadService.add_lead(user_id, {
+                clean_leads.append(LeadService._clean_lead_data(user_id, {
                     'name': lead.get('name', ''),
                     'phone': lead.get('phone', ''),
                     'email': lead.get('email', ''),
                     'status': 'new',
                     'source': 'import'
-                })
-                imported += 1
+                }))
 
             except Exception:
                 errors += 1
 
+        return clean_leads, errors
+
+    # ==================== الواجهة غير المتزامنة ====================
+
+    @staticmethod
+    async def add_lead_async(user_id: str, lead_data: Dict[str, Any]) -> str:
+        """إضافة عميل محتمل جديد (غير متزامن)"""
+        clean_data = LeadService._clean_lead_data(user_id, lead_data)
+        lead_id = await AsyncDatabaseOperations.add_lead(user_id, clean_data)
+        LeadService._emit_lead_added(lead_id, user_id, clean_data)
+        return lead_id
+
+    @staticmethod
+    async def get_user_leads_async(user_id: str, **options) -> List[Dict[str, Any]]:
+        """الحصول على عملاء المستخدم (غير متزامن)"""
+        return await AsyncDatabaseOperations.get_leads(user_id, **options)
+
+    @staticmethod
+    async def update_lead_async(lead_id: str, updates: Dict[str, Any]) -> bool:
+        """تحديث بيانات عميل (غير متزامن)"""
+        updates['updated_at'] = datetime.now().isoformat()
+        if 'status' not in updates:
+            return await AsyncDatabaseOperations.update_lead(lead_id, updates)
+
+        lead = await AsyncDatabaseOperations.get_lead_by_id(lead_id)
+        lead = dict(lead) if lead else None
+        success = await AsyncDatabaseOperations.update_lead(lead_id, updates)
+        if success:
+            LeadService._emit_status_changed(lead, lead_id, updates['status'])
+        return success
+
+    @staticmethod
+    async def delete_lead_async(lead_id: str) -> bool:
+        """حذف عميل (غير متزامن)"""
+        lead = await AsyncDatabaseOperations.get_lead_by_id(lead_id)
+        success = await AsyncDatabaseOperations.delete_lead(lead_id)
+        if success:
+            LeadService._emit_lead_deleted(lead, lead_id)
+        return success
+
+    @staticmethod
+    async def get_lead_stats_async(user_id: str) -> Dict[str, Any]:
+        """الحصول على إحصائيات العملاء (غير متزامن)"""
+        if not lead_projection.ready:
+            # البناء الأول يقرأ قاعدة البيانات - خارج حلقة الأحداث
+            await asyncio.to_thread(lead_projection.rebuild)
+        return LeadService._summarize(LeadService.get_lead_projection(user_id))
+
+    @staticmethod
+    async def import_leads_async(user_id: str, leads_data: List[Dict[str, Any]]) -> Dict[str, int]:
+        """استيراد مجموعة من العملاء (غير متزامن)"""
+        clean_leads, errors = LeadService._clean_import(user_id, leads_data)
+        imported = 0
+
+        if clean_leads:
+            try:
+                lead_ids = await AsyncDatabaseOperations.add_leads_bulk(user_id, clean_leads)
+            except Exception as e:
+                print(f"Error importing leads: {e}")
+                lead_ids = []
+                errors += len(clean_leads)
+
+            for lead_id, clean_data in zip(lead_ids, clean_leads):
+                LeadService._emit_lead_added(lead_id, user_id, clean_data)
+            imported = len(lead_ids)
+
         return {
             'imported': imported,
-            'duplicates': duplicates,
+            'duplicates': 0,
             'errors': errors
         }
 
@@ -7,7 +7,8 @@ from datetime import datetime
 
 from app.core.config import settings
 from app.core.security import security_manager
-from app.core.database import DatabaseOperations
+from app.core.database import DatabaseOperations, supabase_breaker
+from app.core.async_database import AsyncDatabaseOperations
 
 
 class UserService:
@@ -90,10 +91,16 @@ class UserService:
         user = UserService.get_or_create(username)
         return user.get('wallet_balance', 0)
 
+    @staticmethod
+    def _current_balance(username: str) -> int:
+        """الرصيد من قاعدة البيانات لا من الذاكرة المؤقتة (قبل تعديله)"""
+        user = DatabaseOperations.get_user_for_update(username) or UserService.get_or_create(username)
+        return user.get('wallet_balance', 0)
+
     @staticmethod
     def update_balance(username: str, amount: int) -> bool:
         """تحديث الرصيد"""
-        current = UserService.get_wallet_balance(username)
+        current = UserService._current_balance(username)
         new_balance = current + amount
 
         if new_balance < 0:
@@ -104,12 +111,72 @@ class UserService:
     @staticmethod
     def deduct_balance(username: str, amount: int) -> tuple:
         """خصم من الرصيد"""
-        current = UserService.get_wallet_balance(username)
+        current = UserService._current_balance(username)
+
+        if current < amount:
+            return False, "رصيد غير كافي"
+
+        return DatabaseOperations.update_user(username, {'wallet_balance': current - amount}), "تم الخصم"
+
+    # ==================== الواجهة غير المتزامنة ====================
+
+    @staticmethod
+    async def get_or_create_async(username: str) -> Dict[str, Any]:
+        """الحصول على مستخدم أو إنشاؤه (غير متزامن)"""
+        user = await AsyncDatabaseOperations.get_user(username)
+
+        if not user:
+            user = await AsyncDatabaseOperations.create_user(username, {
+                'wallet_balance': settings.DEFAULT_BALANCE,
+                'is_admin': False
+            })
+
+        return user
+
+    @staticmethod
+    async def login_with_password_async(username: str, password: str) -> Optional[Dict[str, Any]]:
+        """تسجيل الدخول بكلمة مرور (غير متزامن)"""
+        user = await AsyncDatabaseOperations.get_user(username)
+
+        if user and user.get('password'):
+            if security_manager.verify_password(password, user['password']):
+                return user
+
+        return None
+
+    @staticmethod
+    async def change_password_async(username: str, old_password: str, new_password: str) -> tuple:
+        """تغيير كلمة المرور (غير متزامن)"""
+        user = await AsyncDatabaseOperations.get_user(username)
+
+        if not user:
+            return False, "المستخدم غير موجود"
+
+        if user.get('password'):
+            if not security_manager.verify_password(old_password, user['password']):
+                return False, "كلمة المرور القديمة غير صحيحة"
+
+        valid, msg = security_manager.validate_password(new_password)
+        if not valid:
+            return False, msg
+
+        hashed = security_manager.hash_password(new_password)
+        await AsyncDatabaseOperations.update_user(username, {'password': hashed})
+
+        return True, "تم تغيير كلمة المرور بنجاح"
+
+    @staticmethod
+    async def deduct_balance_async(username: str, amount: int) -> tuple:
+        """خصم من الرصيد (غير متزامن)"""
+        user = (await AsyncDatabaseOperations.get_user_for_update(username)
+                or await UserService.get_or_create_async(username))
+        current = user.get('wallet_balance', 0)
 
         if current < amount:
             return False, "رصيد غير كافي"
 
-        return UserService.update_balance(username, -amount), "تم الخصم"
+        success = await AsyncDatabaseOperations.update_user(username, {'wallet_balance': current - amount})
+        return success, "تم الخصم"
 
     @staticmethod
     def get_all_users() -> list:
@@ -117,8 +184,9 @@ class UserService:
         client = get_supabase_client()
         if client:
             try:
-                result = client.table('users').select('*').execute()
-                return result.data
+                with supabase_breaker:
+                    result = client.table('users').select('*').execute()
+                    return result.data
             except Exception as e:
                 print(f"Error getting users: {e}")
 
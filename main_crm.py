@@ -17,22 +17,15 @@ class CRMStats:
     @staticmethod
     def get_overall_stats() -> Dict[str, Any]:
         """الحصول على الإحصائيات العامة"""
-        all_leads = LeadService.get_all_leads()
+        # العدادات محدثة تدريجياً من أحداث العملاء - لا يُعاد العد
+        projection = LeadService.get_lead_projection()
         all_users = UserService.get_all_users()
 
-        # حساب الإحصائيات
-        status_counts = {}
-        source_counts = {}
-
-        for lead in all_leads:
-            status = lead.get('status', 'unknown')
-            source = lead.get('source', 'unknown')
-
-            status_counts[status] = status_counts.get(status, 0) + 1
-            source_counts[source] = source_counts.get(source, 0) + 1
+        status_counts = projection['by_status']
+        source_counts = projection['by_source']
 
         # حساب معدل التحويل
-        total = len(all_leads)
+        total = projection['total']
         closed = status_counts.get('closed', 0)
         conversion_rate = (closed / total * 100) if total > 0 else 0
 
@@ -48,21 +41,14 @@ class CRMStats:
     @staticmethod
     def get_user_performance(user_id: str) -> Dict[str, Any]:
         """الحصول على أداء مستخدم"""
-        leads = LeadService.get_user_leads(user_id)
+        projection = LeadService.get_lead_projection(user_id)
         user = UserService.get_or_create(user_id)
 
-        status_counts = {}
-        total_value = 0
-
-        for lead in leads:
-            status = lead.get('status', 'unknown')
-            status_counts[status] = status_counts.get(status, 0) + 1
-
         return {
             "user_id": user_id,
             "wallet_balance": user.get("wallet_balance", 0),
-            "total_leads": len(leads),
-            "leads_by_status": status_counts,
+            "total_leads": projection['total'],
+            "leads_by_status": projection['by_status'],
             "is_admin": user.get("is_admin", False)
         }
 
@@ -73,24 +59,11 @@ class CRMAnalytics:
     @staticmethod
     def analyze_lead_sources() -> Dict[str, Any]:
         """تحليل مصادر العملاء"""
-        all_leads = LeadService.get_all_leads()
+        aggregates = LeadService.get_lead_aggregates()
 
-        source_analysis = {}
-        for lead in all_leads:
-            source = lead.get('source', 'unknown')
-            if source not in source_analysis:
-                source_analysis[source] = {
-                    "count": 0,
-                    "converted": 0,
-                    "total_score": 0
-                }
-
-            source_analysis[source]["count"] += 1
-
-            if lead.get('status') == 'closed':
-                source_analysis[source]["converted"] += 1
-
-            source_analysis[source]["total_score"] += lead.get('score', 0)
+        source_analysis = {
+            source: dict(data) for source, data in aggregates['by_source'].items()
+        }
 
         # حساب التحويل لكل مصدر
         for source, data in source_analysis.items():
@@ -114,7 +87,7 @@ class CRMAnalytics:
     @staticmethod
     def get_funnel_analysis() -> Dict[str, Any]:
         """تحليل قمع المبيعات"""
-        all_leads = LeadService.get_all_leads()
+        by_status = LeadService.get_lead_aggregates()['by_status']
 
         funnel = {
             "new": 0,
@@ -127,10 +100,9 @@ class CRMAnalytics:
             "lost": 0
         }
 
-        for lead in all_leads:
-            status = lead.get('status', 'new')
+        for status, count in by_status.items():
             if status in funnel:
-                funnel[status] += 1
+                funnel[status] += count
 
         # حساب النسب المئوية
         total = sum(funnel.values())
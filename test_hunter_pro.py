@@ -53,9 +53,15 @@ def mock_settings():
 @pytest.fixture
 def mock_database():
     """قاعدة بيانات الاختبار"""
+    from app.core.cache import entity_cache
+    from app.core.database import supabase_breaker
+
+    entity_cache.clear()
     with patch('app.core.database.get_supabase_client') as mock:
         mock.return_value = None
         yield mock
+    entity_cache.clear()
+    supabase_breaker.record_success()
 
 
 @pytest.fixture
@@ -202,6 +208,125 @@ class TestLeadService:
 
                 assert lead_id == "lead_123"
 
+    def test_import_leads_uses_bulk_insert(self, mock_settings, mock_database):
+        """اختبار الاستيراد عبر الإدراج الجماعي"""
+        from app.services.lead_service import LeadService
+
+        with patch('app.services.lead_service.DatabaseOperations') as mock_db:
+            mock_db.add_leads_bulk.return_value = ["l1", "l2"]
+
+            result = LeadService.import_leads("user1", [
+                {"name": "عميل 1", "phone": "0123456789"},
+                {"name": "عميل 2"},
+                {"email": "بدون اسم أو هاتف"}
+            ])
+
+            assert mock_db.add_leads_bulk.call_count == 1
+            assert mock_db.add_lead.call_count == 0
+            assert result == {"imported": 2, "duplicates": 0, "errors": 1}
+
+    def test_add_leads_bulk_local(self, mock_settings, mock_database, tmp_path):
+        """اختبار الإدراج الجماعي في التخزين المحلي"""
+        from app.core.database import DatabaseOperations, LocalStorage
+
+        storage = LocalStorage(data_file=str(tmp_path / "storage.json"))
+        with patch('app.core.database.local_storage', storage):
+            lead_ids = DatabaseOperations.add_leads_bulk(
+                "user1", [{"name": f"عميل {i}"} for i in range(5)]
+            )
+
+        assert len(lead_ids) == 5
+        assert len(storage.query("leads", user_id="user1")) == 5
+
+    def test_lead_stats_aggregated_in_storage(self, mock_settings, mock_database, tmp_path):
+        """اختبار تجميع الإحصائيات داخل التخزين (JSON و SQLite)"""
+        from app.core.database import DatabaseOperations, LocalStorage
+        from app.core.sqlite_storage import SQLiteStorage
+
+        leads = {
+            "l1": {"user_id": "u1", "status": "closed", "source": "facebook", "score": 80},
+            "l2": {"user_id": "u1", "status": "new", "source": "facebook", "score": 20},
+            "l3": {"user_id": "u1", "status": "new", "source": "google", "score": 10},
+            "l4": {"user_id": "u2", "status": "closed", "source": "google", "score": 50},
+        }
+        backends = [
+            LocalStorage(data_file=str(tmp_path / "storage.json")),
+            SQLiteStorage(str(tmp_path / "storage.db")),
+        ]
+        for storage in backends:
+            storage.insert_many("leads", {k: dict(v) for k, v in leads.items()})
+            with patch('app.core.database.local_storage', storage):
+                stats = DatabaseOperations.get_lead_stats("u1")
+                overall = DatabaseOperations.get_lead_stats()
+
+            assert stats["total"] == 3
+            assert stats["by_status"] == {"closed": 1, "new": 2}
+            assert stats["by_source"]["facebook"] == {"count": 2, "converted": 1, "total_score": 100}
+            assert overall["total"] == 4
+            assert overall["by_source"]["google"]["converted"] == 1
+            storage.close()
+
+    def test_lead_stats_from_projection(self, mock_settings, mock_database, tmp_path):
+        """اختبار تحديث إحصائيات العملاء تدريجياً من الأحداث وإعادة بنائها"""
+        from app.core.database import DatabaseOperations, LocalStorage
+        from app.core.projections import LeadProjection
+        from app.services.lead_service import LeadService
+
+        storage = LocalStorage(data_file=str(tmp_path / "storage.json"))
+        storage.insert("leads", "old", {"id": "old", "user_id": "u1", "status": "closed", "source": "ads"})
+        projection = LeadProjection(DatabaseOperations.get_lead_counts)
+
+        with patch('app.core.database.local_storage', storage), \
+                patch('app.core.projections.lead_projection', projection), \
+                patch('app.services.lead_service.lead_projection', projection):
+            lead_id = LeadService.add_lead("u1", {"name": "Ali", "phone": "1", "source": "web"})
+            # البناء الأول من قاعدة البيانات يشمل العميل الجديد، والأحداث التالية تُطبق تدريجياً
+            assert LeadService.get_lead_stats("u1")["total"] == 2
+            LeadService.add_lead("u2", {"name": "Sara", "phone": "2"})
+            assert LeadService.update_lead_status(lead_id, "closed")
+
+            with patch.object(DatabaseOperations, 'get_lead_stats', side_effect=AssertionError):
+                stats = LeadService.get_lead_stats("u1")
+                overall = LeadService.get_lead_projection()
+            assert stats == {"total": 2, "by_status": {"closed": 2}, "conversion_rate": 100.0}
+            assert overall["by_source"] == {"ads": 1, "web": 1, "manual": 1}
+
+            assert LeadService.delete_lead(lead_id)
+            assert LeadService.get_lead_stats("u1")["total"] == 1
+            assert projection.rebuild()["total_leads"] == 2
+            assert LeadService.get_lead_projection()["by_status"] == {"closed": 1, "new": 1}
+        storage.close()
+
+    def test_projection_rebuild_keeps_concurrent_events(self):
+        """الأحداث الواصلة أثناء إعادة البناء لا تضيع"""
+        from app.core.projections import LeadProjection
+
+        def loader():
+            # حدث يصل بعد قراءة قاعدة البيانات وقبل استبدال الإسقاطات
+            projection.lead_added("u1", "new", "web")
+            return [{"user_id": "u1", "status": "closed", "source": "ads", "count": 3}]
+
+        projection = LeadProjection(loader)
+        assert projection.rebuild()["total_leads"] == 4
+        assert projection.snapshot("u1")["by_status"] == {"closed": 3, "new": 1}
+
+    def test_projection_counts_leads_without_user_once(self):
+        """العميل بلا مستخدم يُحسب مرة واحدة في الإسقاط العام"""
+        from app.core.projections import LeadProjection
+
+        projection = LeadProjection(lambda: [
+            {"user_id": None, "status": "new", "source": "web", "count": 2},
+            {"user_id": "u1", "status": "new", "source": "web", "count": 1},
+        ])
+        assert projection.rebuild()["total_leads"] == 3
+
+        projection.lead_added(None, "new", "ads")
+        projection.status_changed(None, "new", "closed")
+        overall = projection.snapshot()
+        assert overall["total"] == 4
+        assert overall["by_status"] == {"new": 3, "closed": 1}
+        assert overall["by_source"] == {"web": 3, "ads": 1}
+
     def test_get_leads(self, mock_settings, mock_database):
         """اختبار الحصول على العملاء"""
         from app.services.lead_service import LeadService
@@ -267,6 +392,649 @@ class TestLeadScoring:
         assert "grade" in scored[0]
 
 
+# ==================== Local Storage Tests ====================
+
+class TestLocalStorage:
+    """اختبارات التخزين المحلي"""
+
+    def test_log_replay_on_restart(self, tmp_path):
+        """اختبار إعادة بناء الجداول من السجل"""
+        from app.core.database import LocalStorage
+
+        data_file = str(tmp_path / "storage.json")
+        storage = LocalStorage(data_file=data_file)
+        storage.insert("leads", "l1", {"name": "عميل 1", "status": "new"})
+        storage.insert("leads", "l2", {"name": "عميل 2", "status": "new"})
+        storage.update("leads", "l1", {"status": "hot"})
+        storage.delete("leads", "l2")
+        storage.flush()
+
+        reopened = LocalStorage(data_file=data_file)
+
+        assert reopened.get("leads", "l1")["status"] == "hot"
+        assert reopened.get("leads", "l2") is None
+
+    def test_compaction_folds_log_into_snapshot(self, tmp_path):
+        """اختبار دمج السجل في اللقطة"""
+        import json
+        from app.core.database import LocalStorage
+
+        data_file = tmp_path / "storage.json"
+        storage = LocalStorage(data_file=str(data_file), compact_every=3)
+        for i in range(3):
+            storage.insert("leads", f"l{i}", {"name": f"عميل {i}"})
+        storage.flush()
+
+        snapshot = json.loads(data_file.read_text(encoding="utf-8"))
+        assert len(snapshot["leads"]) == 3
+        assert (tmp_path / "storage.log").read_text(encoding="utf-8") == ""
+
+    def test_compaction_keeps_other_process_writes(self, tmp_path):
+        """الدمج لا يمحو تعديلات عملية أخرى على نفس الملف"""
+        from app.core.database import LocalStorage
+
+        data_file = str(tmp_path / "storage.json")
+        first = LocalStorage(data_file=data_file, compact_every=1, flush_ms=60000)
+        second = LocalStorage(data_file=data_file)
+
+        first.insert("leads", "a1", {"name": "أ"})
+        second.insert("leads", "b1", {"name": "ب"}, durable=True)
+        first.flush()
+        first.close()
+        second.close()
+
+        reopened = LocalStorage(data_file=data_file)
+        assert sorted(l["id"] for l in reopened.get_all("leads")) == ["a1", "b1"]
+
+    def test_resident_cache_picks_up_external_writes(self, tmp_path):
+        """اختبار إبطال الذاكرة عند تغير الملفات من الخارج فقط"""
+        from app.core.database import LocalStorage
+
+        data_file = str(tmp_path / "storage.json")
+        reader = LocalStorage(data_file=data_file)
+        reader.insert("users", "u1", {"username": "u1"})
+
+        generation = reader.generation
+        reader.get("users", "u1")
+        reader.get_all("users")
+        assert reader.generation == generation
+
+        writer = LocalStorage(data_file=data_file)
+        writer.insert("users", "u2", {"username": "u2"}, durable=True)
+
+        assert reader.get("users", "u2")["username"] == "u2"
+        assert reader.generation > generation
+
+    def test_group_commit_concurrent_writers(self, tmp_path):
+        """اختبار عدم فقد التعديلات مع الكتابة المتزامنة"""
+        import threading
+        from app.core.database import LocalStorage
+
+        data_file = str(tmp_path / "storage.json")
+        storage = LocalStorage(data_file=data_file, flush_ms=5, batch_size=16)
+
+        def worker(n):
+            for i in range(50):
+                storage.insert("leads", f"w{n}-{i}", {"user_id": f"u{n}"})
+
+        threads = [threading.Thread(target=worker, args=(n,)) for n in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        storage.durability_future().result(timeout=5)
+        storage.close()
+
+        reopened = LocalStorage(data_file=data_file)
+        assert len(reopened.get_all("leads")) == 200
+
+    def test_indexed_query(self, tmp_path):
+        """اختبار الاستعلام عبر الفهارس الثانوية"""
+        from app.core.database import LocalStorage
+
+        storage = LocalStorage(data_file=str(tmp_path / "storage.json"))
+        storage.insert("leads", "l1", {"user_id": "u1", "status": "new", "source": "manual"})
+        storage.insert("leads", "l2", {"user_id": "u1", "status": "hot", "source": "import"})
+        storage.insert("leads", "l3", {"user_id": "u2", "status": "new", "source": "manual"})
+
+        assert [l["id"] for l in storage.query("leads", user_id="u1")] == ["l1", "l2"]
+        assert [l["id"] for l in storage.query("leads", user_id="u1", status="new")] == ["l1"]
+
+        storage.update("leads", "l1", {"status": "closed"})
+        storage.delete("leads", "l3")
+
+        assert storage.query("leads", status="new") == []
+        assert [l["id"] for l in storage.query("leads", status="closed", source="manual")] == ["l1"]
+        assert storage.query("leads", user_id="u2") == []
+
+        # قيمة قديمة غير قابلة للتجزئة لا تمنع فهرسة القيمة الجديدة
+        storage.insert("leads", "l4", {"user_id": "u3", "campaign": ["spring", "summer"]})
+        storage.update("leads", "l4", {"campaign": "spring"})
+        assert [l["id"] for l in storage.query("leads", campaign="spring")] == ["l4"]
+
+
+class TestSQLiteStorage:
+    """اختبارات تخزين SQLite"""
+
+    def test_crud_and_query(self, tmp_path):
+        """اختبار العمليات الأساسية والاستعلام"""
+        from app.core.sqlite_storage import SQLiteStorage
+
+        storage = SQLiteStorage(str(tmp_path / "test.db"))
+        storage.insert("users", "u1", {"username": "u1", "wallet_balance": 100})
+        storage.insert("leads", "l1", {"user_id": "u1", "status": "new", "name": "عميل 1"})
+        storage.insert("leads", "l2", {"user_id": "u1", "status": "hot", "name": "عميل 2"})
+
+        assert storage.update("users", "u1", {"wallet_balance": 90}) is True
+        assert storage.get("users", "u1")["wallet_balance"] == 90
+        assert [l["id"] for l in storage.query("leads", user_id="u1", status="hot")] == ["l2"]
+        assert [l["id"] for l in storage.query("leads", name="عميل 1")] == ["l1"]
+        assert storage.delete("leads", "l1") is True
+        assert storage.update("leads", "l1", {"status": "x"}) is False
+        assert len(storage.get_all("leads")) == 1
+
+    def test_migrate_from_json(self, tmp_path):
+        """اختبار الترحيل من التخزين المحلي"""
+        from app.core.database import LocalStorage
+        from app.core.sqlite_storage import SQLiteStorage, migrate_from_json
+
+        json_path = str(tmp_path / "storage.json")
+        db_path = str(tmp_path / "test.db")
+        source = LocalStorage(data_file=json_path)
+        source.insert("leads", "l1", {"user_id": "u1", "status": "new"})
+        source.insert("users", "u1", {"username": "u1"})
+        source.flush()
+
+        counts = migrate_from_json(json_path, db_path)
+
+        assert counts == {"leads": 1, "users": 1}
+        migrated = SQLiteStorage(db_path).get("leads", "l1")
+        assert migrated["created_at"] == source.get("leads", "l1")["created_at"]
+
+
+class TestPostgresStorage:
+    """اختبارات تخزين PostgreSQL المباشر"""
+
+    def test_statements_prepared_once_per_connection(self):
+        """اختبار تحضير الجملة مرة واحدة ثم إعادة تنفيذها"""
+        from app.core.postgres_storage import PostgresStorage
+
+        executed = []
+        cursor = MagicMock()
+        cursor.execute.side_effect = lambda sql, params=None: executed.append(sql)
+        cursor.fetchone.return_value = None
+        conn = MagicMock(closed=0)
+        conn.cursor.return_value.__enter__.return_value = cursor
+        cursor.connection = conn
+        pool = MagicMock()
+        pool.getconn.return_value = conn
+
+        with patch('app.core.postgres_storage.pg_pool.ThreadedConnectionPool', return_value=pool):
+            storage = PostgresStorage("postgresql://test")
+            storage.get("users", "u1")
+            storage.get("users", "u2")
+
+        prepares = [sql for sql in executed if sql.startswith("PREPARE")]
+        executes = [sql for sql in executed if sql.startswith("EXECUTE")]
+        assert len(prepares) == 1
+        assert "SELECT data FROM users WHERE key = $1" in prepares[0]
+        assert len(executes) == 2
+        assert any(sql.startswith("CREATE TABLE IF NOT EXISTS leads") for sql in executed)
+        assert pool.putconn.call_count == pool.getconn.call_count
+
+    @pytest.mark.skipif(not os.getenv("TEST_DATABASE_URL"), reason="TEST_DATABASE_URL not set")
+    def test_crud_query_and_pagination(self):
+        """اختبار العمليات على قاعدة PostgreSQL حقيقية"""
+        import uuid
+        from app.core.postgres_storage import PostgresStorage
+
+        storage = PostgresStorage(os.getenv("TEST_DATABASE_URL"))
+        user_id = f"pg-{uuid.uuid4().hex[:8]}"
+        try:
+            storage.insert_many("leads", {
+                f"{user_id}-{i}": {"user_id": user_id, "status": "new", "score": i}
+                for i in range(5)
+            })
+            assert storage.update("leads", f"{user_id}-0", {"status": "closed"}) is True
+            assert len(storage.query("leads", user_id=user_id, status="new")) == 4
+            assert len(storage.query("leads", user_id=user_id, score=3)) == 1
+
+            first = storage.query_page("leads", {"user_id": user_id}, limit=3)
+            last = first[-1]
+            rest = storage.query_page("leads", {"user_id": user_id},
+                                      after=(last["created_at"], last["id"]), limit=3)
+            assert len(first) + len(rest) == 5
+
+            groups = storage.group_count("leads", ("status",), {"user_id": user_id}, sum_field="score")
+            assert {g["status"]: g["count"] for g in groups} == {"new": 4, "closed": 1}
+        finally:
+            for i in range(5):
+                storage.delete("leads", f"{user_id}-{i}")
+            storage.close()
+
+
+# ==================== Entity Cache Tests ====================
+
+class TestEntityCache:
+    """اختبارات الذاكرة المؤقتة للكيانات"""
+
+    def test_lru_ttl_and_tags(self):
+        """اختبار الإخلاء حسب الحجم والمدة والوسوم"""
+        from app.core.cache import EntityCache, MISSING
+
+        cache = EntityCache(max_size=2, ttl=60)
+        cache.set("a", {"v": 1}, tags=("t",))
+        cache.set("b", {"v": 2})
+        cache.get("a")
+        cache.set("c", {"v": 3})
+        assert cache.get("b") is MISSING
+        assert cache.get("a") == {"v": 1}
+
+        cache.invalidate("t")
+        assert cache.get("a") is MISSING
+
+        version = cache.version()
+        cache.evict("c")
+        cache.set("c", {"v": 4}, version=version)
+        assert cache.get("c") is MISSING
+
+        expired = EntityCache(max_size=2, ttl=60)
+        expired.set("a", 1)
+        with patch('app.core.cache.time.monotonic', return_value=float('inf')):
+            assert expired.get("a") is MISSING
+        assert cache.stats()["hits"] == 2
+
+    def test_repeat_user_lookups_hit_cache(self, mock_settings, mock_database):
+        """اختبار أن تكرار قراءة المستخدم لا يصل إلى التخزين"""
+        from app.core.database import DatabaseOperations
+
+        storage = MagicMock()
+        storage.get.return_value = {"username": "u1", "wallet_balance": 100}
+        storage.update.return_value = True
+        with patch('app.core.database.local_storage', storage):
+            for _ in range(3):
+                assert DatabaseOperations.get_user("u1")["wallet_balance"] == 100
+            DatabaseOperations.update_user("u1", {"wallet_balance": 98})
+            assert DatabaseOperations.get_user("u1")["wallet_balance"] == 98
+
+        assert storage.get.call_count == 1
+
+    def test_lead_writes_invalidate_lists(self, mock_settings, mock_database, tmp_path):
+        """اختبار إخلاء قوائم العملاء عند الكتابة"""
+        from app.core.database import DatabaseOperations, LocalStorage
+
+        storage = LocalStorage(data_file=str(tmp_path / "storage.json"))
+        with patch('app.core.database.local_storage', storage):
+            lead_id = DatabaseOperations.add_lead("u1", {"name": "عميل", "status": "new"})
+            assert len(DatabaseOperations.get_leads("u1", status="new")) == 1
+            assert DatabaseOperations.get_lead_by_id(lead_id)["status"] == "new"
+
+            DatabaseOperations.update_lead(lead_id, {"status": "hot"})
+            assert DatabaseOperations.get_leads("u1", status="new") == []
+            assert DatabaseOperations.get_lead_by_id(lead_id)["status"] == "hot"
+
+            DatabaseOperations.delete_lead(lead_id)
+            assert DatabaseOperations.get_leads("u1") == []
+            assert DatabaseOperations.get_lead_by_id(lead_id) is None
+
+
+class TestUnitOfWork:
+    """اختبارات سياق العمل لكل طلب"""
+
+    def test_loads_once_and_flushes_once(self, mock_settings, mock_database):
+        """اختبار قراءة المستخدم مرة واحدة وكتابة التحديثات في النهاية"""
+        from app.core.database import DatabaseOperations
+        from app.core.unit_of_work import UnitOfWork, activate
+        from app.services.user_service import UserService
+
+        storage = MagicMock()
+        storage.get.return_value = {"username": "u1", "wallet_balance": 100}
+        storage.update.return_value = True
+        unit = UnitOfWork()
+
+        with patch('app.core.database.local_storage', storage):
+            with activate(unit):
+                DatabaseOperations.get_user("u1")
+                DatabaseOperations.update_user("u1", {"language": "en"})
+                DatabaseOperations.update_user("u1", {"theme": "dark"})
+                assert UserService.get_or_create("u1")["theme"] == "dark"
+                assert storage.update.call_count == 0
+
+            DatabaseOperations.flush_unit(unit)
+
+        assert storage.get.call_count == 1
+        storage.update.assert_called_once_with("users", "u1", {"language": "en", "theme": "dark"})
+
+    def test_balance_written_through(self, mock_settings, mock_database):
+        """الرصيد يُكتب فوراً مع التحديثات المؤجلة السابقة"""
+        from app.core.database import DatabaseOperations
+        from app.core.unit_of_work import UnitOfWork, activate
+        from app.services.user_service import UserService
+
+        row = {"username": "u1", "wallet_balance": 100}
+        storage = MagicMock()
+        storage.get.side_effect = lambda table, key: dict(row)
+        storage.update.side_effect = lambda table, key, data: row.update(data) or True
+        unit = UnitOfWork()
+
+        with patch('app.core.database.local_storage', storage):
+            with activate(unit):
+                DatabaseOperations.get_user("u1")
+                DatabaseOperations.update_user("u1", {"language": "en"})
+                assert UserService.deduct_balance("u1", 5)[0] is True
+                storage.update.assert_called_once_with(
+                    "users", "u1", {"language": "en", "wallet_balance": 95}
+                )
+                assert UserService.deduct_balance("u1", 5)[0] is True
+                assert UserService.get_or_create("u1")["wallet_balance"] == 90
+
+            DatabaseOperations.flush_unit(unit)
+
+        # قراءة أولى ثم قراءة مباشرة قبل كل خصم
+        assert storage.get.call_count == 3
+        assert storage.update.call_count == 2
+
+    def test_balance_read_bypasses_cache(self, mock_settings, mock_database):
+        """الخصم يقرأ الرصيد من قاعدة البيانات لا من ذاكرة العملية المؤقتة"""
+        import asyncio
+        from app.core.database import DatabaseOperations
+        from app.core.unit_of_work import UnitOfWork, activate
+        from app.services.user_service import UserService
+
+        row = {"username": "u1", "wallet_balance": 100}
+        storage = MagicMock()
+        storage.get.side_effect = lambda table, key: dict(row)
+        storage.update.side_effect = lambda table, key, data: row.update(data) or True
+
+        with patch('app.core.database.local_storage', storage):
+            assert DatabaseOperations.get_user("u1")["wallet_balance"] == 100
+            # عامل آخر خصم من الرصيد؛ النسخة المخزنة هنا قديمة
+            row["wallet_balance"] = 50
+            assert UserService.deduct_balance("u1", 5)[0] is True
+            assert row["wallet_balance"] == 45
+
+            row["wallet_balance"] = 20
+            with activate(UnitOfWork()):
+                user = DatabaseOperations.get_user("u1")
+                assert asyncio.run(UserService.deduct_balance_async("u1", 5))[0] is True
+                assert user["wallet_balance"] == 15
+            assert row["wallet_balance"] == 15
+
+    def test_failed_flush_raises(self, mock_settings, mock_database):
+        """فشل الكتابة المؤجلة يُبلغ ولا يُبتلع"""
+        import pytest
+        from app.core.database import DatabaseOperations
+        from app.core.unit_of_work import UnitOfWork, UnitOfWorkError, activate
+
+        storage = MagicMock()
+        storage.get.return_value = {"username": "u1"}
+        storage.update.return_value = False
+        unit = UnitOfWork()
+
+        with patch('app.core.database.local_storage', storage):
+            with activate(unit):
+                DatabaseOperations.get_user("u1")
+                assert DatabaseOperations.update_user("u1", {"language": "en"}) is True
+            with pytest.raises(UnitOfWorkError):
+                DatabaseOperations.flush_unit(unit)
+
+    def test_failed_flush_returns_500(self, client):
+        """فشل الكتابة المؤجلة يحول الاستجابة إلى خطأ خادم"""
+        from app.core.unit_of_work import UnitOfWorkError
+
+        with patch('app.core.async_database.AsyncDatabaseOperations.flush_unit',
+                   side_effect=UnitOfWorkError("user:u1")):
+            response = client.get("/health")
+        assert response.status_code == 500
+
+
+# ==================== Async Database Tests ====================
+
+class TestAsyncDatabase:
+    """اختبارات طبقة قاعدة البيانات غير المتزامنة"""
+
+    def test_lead_routes_use_async_layer(self, client, tmp_path):
+        """اختبار إضافة وعرض العملاء عبر الطبقة غير المتزامنة"""
+        from app.core.database import LocalStorage
+
+        storage = LocalStorage(data_file=str(tmp_path / "storage.json"))
+        with patch('app.core.database.local_storage', storage):
+            response = client.post("/api/leads/async_user/add", json={
+                "name": "عميل", "phone": "0123456789", "status": "new"
+            })
+            assert response.status_code == 200
+
+            data = client.get("/api/leads/async_user").json()
+
+        assert data["count"] == 1
+        assert data["leads"][0]["id"] == response.json()["lead_id"]
+
+    def test_lead_listing_pagination(self, client, tmp_path):
+        """اختبار الترقيم بالمؤشر والتصفية والإسقاط"""
+        from app.core.database import LocalStorage
+
+        storage = LocalStorage(data_file=str(tmp_path / "storage.json"))
+        for i in range(5):
+            storage.insert("leads", f"l{i}", {
+                "user_id": "pager", "name": f"عميل {i}",
+                "status": "hot" if i % 2 else "new", "source": "manual"
+            })
+
+        with patch('app.core.database.local_storage', storage):
+            first = client.get("/api/leads/pager?limit=2&fields=name").json()
+            second = client.get(f"/api/leads/pager?limit=2&after={first['next_cursor']}").json()
+            hot = client.get("/api/leads/pager?status=hot").json()
+            bad = client.get("/api/leads/pager?fields=password")
+            injected = client.get("/api/leads/pager", params={"after": '2024-01-01",id.gt.",x'})
+            bad_id = client.get("/api/leads/pager", params={"after": "2024-01-01T00:00:00,l1)"})
+
+        assert [l["id"] for l in first["leads"]] == ["l0", "l1"]
+        assert set(first["leads"][0]) == {"name", "id", "created_at"}
+        assert [l["id"] for l in second["leads"]] == ["l2", "l3"]
+        assert [l["id"] for l in hot["leads"]] == ["l1", "l3"]
+        assert hot["next_cursor"] is None
+        assert bad.status_code == 400
+        assert injected.status_code == 400 and bad_id.status_code == 400
+
+    def test_supabase_client_filters(self, mock_settings):
+        """اختبار صياغة طلبات PostgREST"""
+        import asyncio
+        import httpx
+        from app.core.async_database import AsyncSupabaseClient
+
+        requests_seen = []
+
+        def handler(request):
+            requests_seen.append(request)
+            return httpx.Response(200, json=[{"username": "u1"}])
+
+        supabase = AsyncSupabaseClient("https://example.supabase.co", "key")
+        supabase._client = httpx.AsyncClient(
+            base_url="https://example.supabase.co/rest/v1",
+            transport=httpx.MockTransport(handler)
+        )
+
+        rows = asyncio.run(supabase.select("users", {"username": "u1"}))
+
+        assert rows == [{"username": "u1"}]
+        assert requests_seen[0].url.path == "/rest/v1/users"
+        assert requests_seen[0].url.params["username"] == "eq.u1"
+
+        asyncio.run(supabase.select("leads", {"campaign": None, "is_admin": False, "score": 5}))
+        params = requests_seen[1].url.params
+        assert (params["campaign"], params["is_admin"], params["score"]) == ("is.null", "eq.false", "eq.5")
+
+    def test_circuit_breaker_short_circuits_to_local(self, mock_settings, mock_database, tmp_path):
+        """اختبار قطع الدائرة بعد تعطل Supabase والرجوع للتخزين المحلي فوراً"""
+        import asyncio
+        import httpx
+        from app.core.async_database import AsyncSupabaseClient, AsyncDatabaseOperations
+        from app.core.circuit_breaker import CircuitBreaker
+        from app.core.database import LocalStorage, _is_outage
+
+        calls = []
+
+        def handler(request):
+            calls.append(request)
+            raise httpx.ConnectError("connection refused", request=request)
+
+        supabase = AsyncSupabaseClient("https://example.supabase.co", "key")
+        supabase._client = httpx.AsyncClient(
+            base_url="https://example.supabase.co/rest/v1",
+            transport=httpx.MockTransport(handler)
+        )
+        breaker = CircuitBreaker("test", failure_threshold=2, recovery_timeout=60, is_failure=_is_outage)
+        storage = LocalStorage(data_file=str(tmp_path / "storage.json"))
+        storage.insert("leads", "l1", {"user_id": "u1"})
+
+        with patch('app.core.async_database._async_client', supabase), \
+                patch('app.core.async_database.supabase_breaker', breaker), \
+                patch('app.core.database.local_storage', storage):
+            for _ in range(3):
+                leads = asyncio.run(AsyncDatabaseOperations.get_all_leads())
+                assert [lead["id"] for lead in leads] == ["l1"]
+
+        assert len(calls) == 2
+        assert breaker.state == "open"
+        assert breaker.stats()["rejected"] == 1
+
+    def test_circuit_breaker_half_open_probe(self):
+        """اختبار الطلب التجريبي بعد انتهاء مهلة الاسترداد"""
+        from app.core.circuit_breaker import CircuitBreaker
+
+        breaker = CircuitBreaker("test", failure_threshold=1, recovery_timeout=30)
+        breaker.record_failure()
+        assert breaker.allow() is False
+
+        with patch('app.core.circuit_breaker.time.monotonic', return_value=10 ** 9):
+            assert breaker.state == "half_open"
+            assert breaker.allow() is True
+            assert breaker.allow() is False
+            breaker.record_success()
+
+        assert breaker.state == "closed"
+
+    def test_lead_stats_fallback_respects_breaker(self, mock_settings, tmp_path):
+        """فشل دالة الإحصاء بتعطل يفتح الدائرة فلا يُرسل استعلام ثانٍ"""
+        import asyncio
+        import httpx
+        from app.core import async_database, database
+        from app.core.circuit_breaker import CircuitBreaker
+
+        calls = []
+
+        def outage(*args, **kwargs):
+            calls.append(args[0])
+            raise httpx.ConnectError("connection refused")
+
+        class AsyncClient:
+            # مثل AsyncSupabaseClient._request: كل طلب يُسجل في قاطع الدائرة
+            async def rpc(self, *args, **kwargs):
+                with async_database.supabase_breaker:
+                    outage(*args)
+
+            async def select(self, *args, **kwargs):
+                with async_database.supabase_breaker:
+                    outage(*args)
+
+        client = MagicMock()
+        client.rpc.side_effect = outage
+        client.table.side_effect = outage
+        storage = database.LocalStorage(data_file=str(tmp_path / "storage.json"))
+        storage.insert("leads", "l1", {"user_id": "u1", "status": "new", "source": "web"})
+
+        for operation in (database.DatabaseOperations.get_lead_stats,
+                          database.DatabaseOperations.get_lead_counts,
+                          lambda: asyncio.run(async_database.AsyncDatabaseOperations.get_lead_stats())):
+            breaker = CircuitBreaker("test", failure_threshold=1, recovery_timeout=60,
+                                     is_failure=database._is_outage)
+            calls.clear()
+            with patch.object(database, 'get_supabase_client', return_value=client), \
+                    patch.object(async_database, 'get_async_supabase_client', return_value=AsyncClient()), \
+                    patch.object(database, 'supabase_breaker', breaker), \
+                    patch.object(async_database, 'supabase_breaker', breaker), \
+                    patch.object(database, 'local_storage', storage):
+                result = operation()
+            assert calls in (["lead_stats"], ["lead_counts"])
+            assert breaker.state == "open"
+            total = result["total"] if isinstance(result, dict) else sum(r["count"] for r in result)
+            assert total == 1
+        storage.close()
+
+    def test_get_db_keeps_half_open_probe(self, mock_settings):
+        """get_db و init_db لا يستهلكان الطلب التجريبي دون تسجيل نتيجته"""
+        from app.core import database
+        from app.core.circuit_breaker import CircuitBreaker
+
+        client = object()
+        breaker = CircuitBreaker("test", failure_threshold=1, recovery_timeout=30)
+        breaker.record_failure()
+
+        with patch.object(database, '_supabase_client', client), \
+                patch.object(database, 'supabase_breaker', breaker), \
+                patch.object(database.settings, 'STORAGE_BACKEND', 'json'), \
+                patch.object(database.settings, 'DATABASE_URL', 'https://example.supabase.co'), \
+                patch('app.core.circuit_breaker.time.monotonic', return_value=10 ** 9):
+            assert database.get_db() is client
+            database.init_db()
+            assert database.get_supabase_client() is client
+            assert database.get_supabase_client() is None
+
+
+class TestFakeSupabase:
+    """اختبارات بديل Supabase المحلي"""
+
+    def test_database_operations_against_fake(self, mock_settings, mock_database, tmp_path):
+        """اختبار مسار Supabase الكامل على المحرك المحلي"""
+        import asyncio
+        from app.core.async_database import AsyncDatabaseOperations
+        from app.core.database import DatabaseOperations, LocalStorage, make_cursor, parse_cursor
+        from app.core.fake_supabase import FakePostgREST, FakeSupabaseClient, FakeAsyncSupabaseClient
+
+        backend = FakePostgREST(seed=1)
+        mock_database.return_value = FakeSupabaseClient(backend)
+        storage = LocalStorage(data_file=str(tmp_path / "storage.json"))
+
+        with patch('app.core.database.local_storage', storage), \
+                patch('app.core.async_database._async_client', FakeAsyncSupabaseClient(backend)):
+            DatabaseOperations.create_user("u1", {})
+            lead_ids = DatabaseOperations.add_leads_bulk(
+                "u1", [{"name": f"عميل {i}", "status": "new", "score": i} for i in range(5)]
+            )
+            DatabaseOperations.update_lead(lead_ids[0], {"status": "closed"})
+
+            first = DatabaseOperations.get_leads("u1", limit=3)
+            rest = asyncio.run(AsyncDatabaseOperations.get_leads(
+                "u1", after=parse_cursor(make_cursor(first[-1])), limit=3
+            ))
+            stats = DatabaseOperations.get_lead_stats("u1")
+            counts = DatabaseOperations.get_lead_counts()
+
+        assert DatabaseOperations.get_user("u1")["wallet_balance"] == 100
+        assert len(first) == 3 and len(rest) == 2
+        assert {l["id"] for l in first + rest} == set(lead_ids)
+        assert stats["by_status"] == {"closed": 1, "new": 4}
+        assert sorted((c["status"], c["count"]) for c in counts) == [("closed", 1), ("new", 4)]
+        assert storage.get_all("leads") == []
+        assert backend.stats()["rows"] == {"users": 1, "leads": 5}
+
+    def test_injected_errors_fall_back_to_local(self, mock_settings, mock_database, tmp_path):
+        """اختبار حقن الأخطاء والرجوع للتخزين المحلي"""
+        from app.core.database import DatabaseOperations, LocalStorage
+        from app.core.fake_supabase import FakePostgREST, FakeSupabaseClient
+
+        backend = FakePostgREST(error_rate=1.0, seed=1)
+        mock_database.return_value = FakeSupabaseClient(backend)
+        storage = LocalStorage(data_file=str(tmp_path / "storage.json"))
+
+        with patch('app.core.database.local_storage', storage):
+            lead_id = DatabaseOperations.add_lead("u1", {"name": "عميل"})
+
+        assert storage.get("leads", lead_id)["user_id"] == "u1"
+        assert backend.stats() == {"requests": 1, "failures": 1, "rows": {}}
+
+
 # ==================== AI Service Tests ====================
 
 class TestAIService:
@@ -299,6 +1067,152 @@ class TestAIService:
                         assert result["success"] is False
                         assert "error" in result
 
+    def test_generate_response_concurrent(self, mock_settings):
+        """المحادثات المتزامنة لا تنتظر بعضها"""
+        import asyncio
+        import time
+        from app.services.ai_service import AIService
+
+        async def slow_openai(prompt, system_prompt=None):
+            await asyncio.sleep(0.1)
+            return f"رد: {prompt}"
+
+        async def run():
+            return await asyncio.gather(*(
+                AIService.generate_response(f"سؤال {i}", use_cache=False) for i in range(10)
+            ))
+
+        with patch('app.services.ai_service.AIService.call_openai', side_effect=slow_openai):
+            started = time.perf_counter()
+            results = asyncio.run(run())
+            elapsed = time.perf_counter() - started
+
+        assert all(r["provider"] == "OpenAI" for r in results)
+        assert elapsed < 0.5
+
+    def test_hedged_providers(self, mock_settings, monkeypatch):
+        """المزود البطيء لا يؤخر الاحتياطي، والمهلة الكلية تنهي الطلب"""
+        import asyncio
+        import time
+        from app.core.config import settings
+        from app.services import ai_service
+        from app.services.ai_service import AIService
+
+        monkeypatch.setattr(ai_service, "PROVIDER_LATENCY", {})
+        monkeypatch.setattr(settings, "AI_HEDGING", True)
+        monkeypatch.setattr(settings, "AI_HEDGE_DELAY", 0.05)
+        cancelled = []
+
+        async def hanging(prompt, system_prompt=None):
+            try:
+                await asyncio.sleep(5)
+            except asyncio.CancelledError:
+                cancelled.append(True)
+                raise
+
+        async def fast(prompt, system_prompt=None):
+            await asyncio.sleep(0.01)
+            return "رد سريع"
+
+        async def missing(prompt, system_prompt=None):
+            return None
+
+        with patch.object(AIService, 'call_openai', side_effect=hanging), \
+                patch.object(AIService, 'call_groq', side_effect=missing), \
+                patch.object(AIService, 'call_gemini', side_effect=fast), \
+                patch.object(AIService, 'call_anthropic', side_effect=hanging):
+            started = time.perf_counter()
+            result = asyncio.run(AIService.generate_response("سؤال", use_cache=False))
+            assert time.perf_counter() - started < 1
+            assert result["provider"] == "Gemini"
+            assert cancelled == [True]
+            assert len(ai_service.PROVIDER_LATENCY["Gemini"]) == 1
+
+            monkeypatch.setattr(settings, "AI_DEADLINE", 0.2)
+            with patch.object(AIService, 'call_gemini', side_effect=hanging):
+                result = asyncio.run(AIService.generate_response("سؤال", use_cache=False))
+            assert result["success"] is False
+
+    def test_hedge_delay_from_recent_latency(self, monkeypatch):
+        """مهلة التحوط = p95 لآخر الاستجابات حتى للأزمنة الطويلة"""
+        from app.core.config import settings
+        from app.services import ai_service
+
+        monkeypatch.setattr(ai_service, "PROVIDER_LATENCY", {})
+        monkeypatch.setattr(settings, "AI_HEDGE_MIN_SAMPLES", 20)
+        monkeypatch.setattr(settings, "AI_LATENCY_WINDOW", 100)
+        assert ai_service.hedge_delay("OpenAI") == settings.AI_HEDGE_DELAY
+
+        # استجابة شاذة قديمة تخرج من النافذة ولا تحدد المهلة
+        ai_service.record_provider_latency("OpenAI", 300.0)
+        for i in range(100):
+            ai_service.record_provider_latency("OpenAI", 10.0 + i * 0.1)
+        assert ai_service.hedge_delay("OpenAI") == 19.4
+
+    def test_learned_context_per_user(self, mock_settings, monkeypatch, tmp_path):
+        """إجابات المستخدم السابقة على أسئلة مشابهة تُضاف إلى رسائله فقط"""
+        import asyncio
+        from app.core.config import settings
+        from app.core.pattern_store import PatternStore
+        from app.services import ai_service
+        from app.services.ai_service import AIService, unified_system
+
+        monkeypatch.setattr(unified_system, "_patterns", PatternStore(str(tmp_path / "patterns.json")))
+        monkeypatch.setattr(settings, "AI_PATTERN_CONTEXT", 2)
+        monkeypatch.setattr(ai_service, "AI_CACHE", {})
+        prompts = []
+
+        async def openai(prompt, system_prompt=None):
+            assert system_prompt is None
+            prompts.append(prompt)
+            return f"جواب {len(prompts)}"
+
+        with patch.object(AIService, 'call_openai', side_effect=openai):
+            results = [
+                asyncio.run(AIService.generate_response(message, user_id=user_id))
+                for message, user_id in (("اسعار باقة التسويق", "u1"),
+                                         ("ما هي أسعار الباقات؟", "u1"),
+                                         ("ما هي أسعار الباقات؟", "u2"))
+            ]
+
+        assert "جواب" not in prompts[0]
+        assert "جواب 1" in prompts[1]
+        # الإجابة المبنية على سجل u1 لا تُعاد من الذاكرة المؤقتة لـ u2
+        assert not results[2].get("cached")
+        assert "جواب" not in prompts[2]
+        assert unified_system.get_patterns()[-1]["user_id"] == "u2"
+
+    def test_provider_clients_reused(self, monkeypatch):
+        """عميل المزود يُنشأ مرة واحدة ويُغلق عند الإيقاف"""
+        import asyncio
+        from app.core import ai_clients as module
+        from app.core.config import settings
+
+        created = []
+
+        class FakeClient:
+            closed = False
+
+            async def close(self):
+                self.closed = True
+
+        def factory():
+            created.append(FakeClient())
+            return created[-1]
+
+        monkeypatch.setitem(module._FACTORIES, "openai", factory)
+        monkeypatch.setattr(settings, "OPENAI_API_KEY", "test-key")
+        monkeypatch.setattr(settings, "GROQ_API_KEY", None)
+        clients = module.AIClients()
+
+        assert clients.get("openai") is clients.get("openai")
+        assert len(created) == 1
+        assert clients.get("groq") is None
+
+        asyncio.run(clients.aclose())
+        assert created[0].closed is True
+        assert clients.stats()["clients"] == []
+
 
 # ==================== i18n Tests ====================
 
@@ -358,13 +1272,429 @@ class TestEventSystem:
         def handler(event, data):
             received.append(data)
 
-        # إرسال حدث
+        # إرسال حدث (المستمعون يُنفذون في عمال ناقل الأحداث)
         system.emit(SystemEvent.LEAD_ADDED, {"lead_id": "123"})
+        assert system.drain(timeout=5)
 
         # التحقق من الاستلام
         assert len(received) == 1
         assert received[0]["lead_id"] == "123"
 
+    def test_event_history_range(self, mock_settings):
+        """الاستعلام عن الأحداث الأخيرة حسب الوقت والنوع"""
+        import time
+        from app.core.events import UnifiedSystem, SystemEvent
+
+        system = UnifiedSystem()
+        system.initialize()
+        since = time.time()
+        system.emit(SystemEvent.LEAD_ADDED, {"lead_id": "h1"})
+        system.emit(SystemEvent.CHAT_MESSAGE, {"message": "hi"})
+        system.emit(SystemEvent.LEAD_ADDED, {"lead_id": "h2"})
+
+        records = system.history(since=since, event_type=SystemEvent.LEAD_ADDED)
+        assert [r["data"]["lead_id"] for r in records] == ["h1", "h2"]
+        assert len(system.history(since=since, limit=2)) == 2
+
+    def test_debounced_persistence(self, mock_settings, tmp_path, monkeypatch):
+        """اختبار تأجيل حفظ بيانات النظام والكتابة الذرية"""
+        import json
+        import time
+        from app.core.events import UnifiedSystem
+
+        system = UnifiedSystem()
+        data_file = tmp_path / "system_data.json"
+        patterns_file = tmp_path / "patterns.json"
+        monkeypatch.setattr(system, "_data_file", data_file)
+        monkeypatch.setattr(system._patterns, "path", patterns_file)
+        monkeypatch.setattr(system, "_flush_interval", 3600)
+        monkeypatch.setattr(system, "_last_save", time.monotonic())
+
+        # التعديلات تُعلّم فقط دون الكتابة إلى القرص
+        system.update_state("debounce", 1)
+        system.learn_pattern({"type": "test", "value": 1})
+        system.learn_pattern({"type": "test", "value": 2})
+        assert system._dirty is True
+        assert not data_file.exists()
+
+        system.flush()
+        assert system._dirty is False
+        assert not (tmp_path / "system_data.json.tmp").exists()
+        saved = json.loads(data_file.read_text(encoding='utf-8'))
+        assert saved["state"]["debounce"] == 1
+        # الأنماط في ملفها المستقل فقط
+        assert "patterns" not in saved
+        patterns = json.loads(patterns_file.read_text(encoding='utf-8'))
+        assert [p["value"] for p in patterns[-2:]] == [1, 2]
+
+
+class TestPatternStore:
+    """اختبارات مخزن الأنماط"""
+
+    def test_match_by_normalized_keywords(self, tmp_path):
+        """المطابقة بالكلمات بعد توحيد الحروف وحذف التشكيل"""
+        from app.core.pattern_store import PatternStore
+
+        store = PatternStore(str(tmp_path / "patterns.json"), max_size=10)
+        store.add({"trigger": "أسعار الباقات", "response": "pricing"})
+        store.add({"keywords": ["Refund"], "response": "refund"})
+
+        assert [p["response"] for p in store.match("ما هي اسعار الباقات؟")] == ["pricing"]
+        assert store.match("REFUND please")[0]["hits"] == 1
+        assert store.match("مرحبا") == []
+
+    def test_stores_copies(self, tmp_path):
+        """المخزن لا يحتفظ بقاموس المستدعي نفسه"""
+        from app.core.pattern_store import PatternStore
+
+        store = PatternStore(str(tmp_path / "patterns.json"))
+        pattern = {"trigger": "follow up"}
+        pattern_id = store.add(pattern)
+        pattern["trigger"] = "changed"
+
+        assert "id" not in pattern
+        store.all()[0]["trigger"] = "changed"
+        assert store.match("follow")[0]["id"] == pattern_id
+        assert store.match("changed") == []
+
+    def test_evicts_least_recently_matched(self, tmp_path):
+        """الإخلاء حسب آخر مطابقة لا حسب ترتيب الإضافة"""
+        from app.core.pattern_store import PatternStore
+
+        store = PatternStore(str(tmp_path / "patterns.json"), max_size=2)
+        store.add({"id": "old", "trigger": "alpha"})
+        store.add({"id": "new", "trigger": "beta"})
+        store.match("alpha")
+        store.add({"id": "third", "trigger": "gamma"})
+
+        assert {p["id"] for p in store.all()} == {"old", "third"}
+        assert store.match("beta") == []
+        assert store.evictions == 1
+
+    def test_persists_separately(self, tmp_path):
+        """الحفظ فقط عند التغيير واستعادة الفهرس عند التحميل"""
+        from app.core.pattern_store import PatternStore
+
+        path = tmp_path / "patterns.json"
+        store = PatternStore(str(path))
+        store.flush()
+        assert not path.exists()
+
+        store.add({"id": "p1", "trigger": "follow up"})
+        store.flush()
+        restored = PatternStore(str(path))
+        assert restored.load() is True
+        assert restored.match("follow")[0]["id"] == "p1"
+
+
+class TestRuleEngine:
+    """اختبارات محرك القواعد"""
+
+    def test_compile_conditions(self):
+        """ترجمة الشروط التصريحية"""
+        from app.core.rules import compile_rule
+
+        rule = compile_rule({"conditions": {
+            "stage": "hot", "score": {"gte": 80, "lt": 100}, "lead.source": {"in": ["ads", "web"]}
+        }})
+        assert rule({"stage": "hot", "score": 85, "lead": {"source": "ads"}})
+        assert not rule({"stage": "hot", "score": 70, "lead": {"source": "ads"}})
+        assert not rule({"stage": "hot", "score": None, "lead": {"source": "ads"}})
+        assert not rule({"stage": "hot", "score": 85})
+
+        with pytest.raises(ValueError):
+            compile_rule({"conditions": {"score": {"between": [1, 2]}}})
+
+    def test_rules_indexed_and_persisted(self, tmp_path, monkeypatch):
+        """القواعد تُطبق على حدثها فقط وتُستعاد بعد إعادة التحميل"""
+        import time
+        from app.core.events import UnifiedSystem, SystemEvent
+
+        system = UnifiedSystem()
+        monkeypatch.setattr(system, "_data_file", tmp_path / "system_data.json")
+        monkeypatch.setattr(system, "_flush_interval", 3600)
+        monkeypatch.setattr(system, "_last_save", time.monotonic())
+        system.initialize()
+
+        notified = []
+        monkeypatch.setattr(system, "_notify_admin", lambda data: notified.append(data["lead_id"]))
+        system.add_rule({
+            "id": "big_deal", "name": "صفقة كبيرة",
+            "event": "lead_updated", "conditions": {"value": {"gt": 1000}},
+            "action": "notify_admin"
+        })
+        # الحدث كتعداد يُحفظ باسمه ويُستعاد
+        system.add_rule({
+            "id": "vip_lead", "event": SystemEvent.LEAD_ADDED,
+            "conditions": {"value": {"gt": 10000}}, "action": "notify_admin"
+        })
+        try:
+            system.emit(SystemEvent.LEAD_UPDATED, {"lead_id": "a", "value": 5000})
+            system.emit(SystemEvent.LEAD_ADDED, {"lead_id": "b", "value": 5000})
+            assert notified == ["a"]
+
+            # إعادة التحميل من الملف كما بعد إعادة التشغيل
+            system.flush()
+            system._rules = []
+            system._load_data()
+            system.initialize()
+            assert any(rule["id"] == "big_deal" for rule in system._rules)
+            assert any(rule["id"] == "vip_lead" for rule in system._rules)
+            system.emit(SystemEvent.LEAD_UPDATED, {"lead_id": "c", "value": 2000})
+            system.emit(SystemEvent.LEAD_ADDED, {"lead_id": "d", "value": 20000})
+            assert notified == ["a", "c", "d"]
+
+            with pytest.raises(ValueError):
+                system.add_rule({"id": "bad", "event": "no_such_event", "action": "notify_admin"})
+        finally:
+            system.remove_rule("big_deal")
+            system.remove_rule("vip_lead")
+
+
+class TestEventLog:
+    """اختبارات سجل الأحداث المقسم"""
+
+    def test_segments_and_time_range(self, tmp_path):
+        """تقسيم السجل إلى مقاطع والاستعلام الزمني بعد إعادة الفتح"""
+        from app.core.event_log import EventLog
+
+        log = EventLog(str(tmp_path), segment_bytes=2000, segment_seconds=3600,
+                       index_every=8, retention_days=0)
+        base = 1_700_000_000.0
+        for i in range(100):
+            log.append({"event": "lead_added" if i % 2 else "chat_message",
+                        "data": {"n": i}, "ts": base + i})
+        assert log.stats()["segments"] > 3
+        log.close()
+
+        # سطر ناقص في نهاية المقطع الأخير (توقف مفاجئ أثناء الكتابة)
+        last = sorted((tmp_path / "worker-0").glob("events-*.jsonl"))[-1]
+        with open(last, "ab") as f:
+            f.write(b'{"event": "lead_ad')
+
+        reopened = EventLog(str(tmp_path), segment_bytes=2000, segment_seconds=3600,
+                            index_every=8, retention_days=0)
+        records = reopened.history(since=base + 40, until=base + 59, event_type="lead_added")
+        assert [r["data"]["n"] for r in records] == list(range(41, 60, 2))
+        assert len(reopened.history(limit=5)) == 5
+
+        reopened.append({"event": "lead_added", "data": {"n": 100}, "ts": base + 100})
+        assert [r["data"]["n"] for r in reopened.history(since=base + 99)] == [99, 100]
+        reopened.close()
+
+    def test_retention_evicts_old_segments(self, tmp_path):
+        """حذف المقاطع الأقدم من مدة الاحتفاظ"""
+        import time
+        from app.core.event_log import EventLog
+
+        log = EventLog(str(tmp_path), segment_bytes=10**6, segment_seconds=60,
+                       index_every=8, retention_days=1)
+        now = time.time()
+        log.append({"event": "old", "ts": now - 3 * 86400})
+        log.append({"event": "old", "ts": now - 2 * 86400})
+        log.append({"event": "new"})
+        log.close()
+
+        assert [r["event"] for r in log.history()] == ["new"]
+        assert len(list((tmp_path / "worker-0").glob("events-*.jsonl"))) == 1
+        log.close()
+
+    def test_processes_keep_separate_segments(self, tmp_path):
+        """كل عملية تكتب في مجلدها ولا تحذف مقاطع غيرها"""
+        import time
+        from app.core.event_log import EventLog
+
+        first = EventLog(str(tmp_path), segment_bytes=10**6, segment_seconds=60,
+                         index_every=8, retention_days=1)
+        second = EventLog(str(tmp_path), segment_bytes=10**6, segment_seconds=60,
+                          index_every=8, retention_days=1)
+        now = time.time()
+        first.append({"event": "a", "ts": now - 3 * 86400})
+        second.append({"event": "b"})
+        second.append({"event": "c", "ts": now + 120})
+        first.flush()
+
+        assert (first.slot, second.slot) == (0, 1)
+        assert [r["event"] for r in first.history()] == ["a"]
+        assert [r["event"] for r in second.history()] == ["b", "c"]
+        first.close()
+        second.close()
+
+
+class TestEventMetrics:
+    """اختبارات قياسات نظام الأحداث"""
+
+    def test_listener_and_rule_metrics(self, mock_settings):
+        """تسجيل عدد الأحداث ومدد المستمعين وأخطائهم ومدة القواعد والحفظ"""
+        import time
+        from app.core.events import UnifiedSystem, SystemEvent
+
+        system = UnifiedSystem()
+        system.initialize()
+        system.reset_metrics()
+
+        def slow_listener(event, data):
+            time.sleep(0.02)
+
+        def failing_listener(event, data):
+            raise RuntimeError("boom")
+
+        system.on(SystemEvent.CAMPAIGN_COMPLETED)(slow_listener)
+        system.on(SystemEvent.CAMPAIGN_COMPLETED, inline=True)(failing_listener)
+        system.emit(SystemEvent.CAMPAIGN_COMPLETED, {"stage": "hot"})
+        system.emit(SystemEvent.CAMPAIGN_COMPLETED, {})
+        assert system.drain(timeout=5)
+        system.flush()
+
+        metrics = system.get_metrics(top=5)
+        assert metrics["emits"]["campaign_completed"] == 2
+
+        slow = next(v for k, v in metrics["listeners"].items() if k.endswith("slow_listener"))
+        failing = next(v for k, v in metrics["listeners"].items() if k.endswith("failing_listener"))
+        assert slow["count"] == 2 and slow["max_ms"] >= 20
+        assert failing["errors"] == 2
+        # الأبطأ أولاً
+        assert next(iter(metrics["listeners"])).endswith("slow_listener")
+
+        assert metrics["rules"]["notify_admin_on_hot_lead"]["count"] == 2
+        assert metrics["check_rules"]["count"] == 2
+        assert metrics["save"]["count"] >= 1
+        assert "metrics" in system.get_stats()
+
+
+class TestEventTransport:
+    """اختبارات توزيع الأحداث بين العمليات"""
+
+    def test_fan_out_and_dedup(self, mock_settings, tmp_path, monkeypatch):
+        """الأحداث تُنشر للعمليات الأخرى، والرسائل الواردة تُطبق مرة واحدة"""
+        from app.core.events import UnifiedSystem, SystemEvent
+        from app.core.event_log import EventLog
+        from app.core.event_transport import MemoryHub, MemoryTransport
+
+        system = UnifiedSystem()
+        system.initialize()
+        monkeypatch.setattr(system, "_event_log", EventLog(str(tmp_path)))
+        hub = MemoryHub()
+        peer = MemoryTransport(hub)
+        outgoing = []
+        peer.start(outgoing.append)
+        system.set_transport(MemoryTransport(hub))
+
+        local_only, replicated = [], []
+        system.on(SystemEvent.CAMPAIGN_STARTED)(lambda event, data: local_only.append(data["n"]))
+        system.on(SystemEvent.CAMPAIGN_STARTED, replicate=True)(
+            lambda event, data: replicated.append(data["n"]))
+
+        try:
+            system.emit(SystemEvent.CAMPAIGN_STARTED, {"n": 1})
+            assert system.drain(timeout=5)
+            assert [m["kind"] for m in outgoing] == ["event"]
+            assert outgoing[0]["data"] == {"n": 1} and outgoing[0]["id"]
+
+            # حدث من عملية أخرى يصل مرتين (إعادة تسليم)
+            remote = {"kind": "event", "id": "evt-remote-1", "origin": "worker-2",
+                      "event": "campaign_started", "data": {"n": 2}, "ts": 1_700_000_000.0}
+            peer.publish(remote)
+            peer.publish(remote)
+            peer.publish({"kind": "pattern", "id": "pat-1", "origin": "worker-2",
+                          "pattern": {"type": "remote"}})
+            assert system.drain(timeout=5)
+
+            assert local_only == [1]
+            assert replicated == [1, 2]
+            assert system.get_patterns()[-1]["type"] == "remote"
+            assert sum(1 for r in system._event_history if r["id"] == "evt-remote-1") == 1
+            # الحدث البعيد في سجل هذه العملية على القرص كما في الذاكرة
+            logged = system._event_log.history(event_type="campaign_started")
+            assert sum(1 for r in logged if r["id"] == "evt-remote-1") == 1
+        finally:
+            system.set_transport(None)
+            peer.close()
+            system._event_log.close()
+
+
+class TestEventBus:
+    """اختبارات ناقل الأحداث"""
+
+    def test_listeners_run_off_request_path(self):
+        """المستمع البطيء لا يؤخر الإرسال، والمهلة تُطبق لكل مستمع"""
+        import asyncio
+        import threading
+        import time
+        from app.core.event_bus import EventBus, Subscription
+
+        bus = EventBus(max_size=10, workers=2, policy="reject", listener_timeout=0)
+        release = threading.Event()
+        received = []
+
+        def slow(event, data):
+            release.wait(5)
+            received.append(data["n"])
+
+        async def stuck(event, data):
+            await asyncio.sleep(10)
+
+        try:
+            started = time.monotonic()
+            assert bus.submit(Subscription(slow), "evt", {"n": 1})
+            assert bus.submit(Subscription(stuck, timeout=0.05), "evt", {})
+            assert time.monotonic() - started < 0.5
+
+            release.set()
+            assert bus.drain(timeout=5)
+            assert received == [1]
+            assert bus.stats()["timeouts"] == 1
+        finally:
+            bus.close()
+
+    def test_backpressure_policies(self):
+        """سياسات امتلاء الطابور: reject و drop_oldest و block"""
+        import asyncio
+        import threading
+        import time
+        from app.core.event_bus import EventBus, Subscription
+
+        bus = EventBus(max_size=2, workers=1, policy="reject",
+                       listener_timeout=0, block_timeout=0.05)
+        release = threading.Event()
+        received = []
+        gate = Subscription(lambda event, data: release.wait(5))
+        record = Subscription(lambda event, data: received.append(data["n"]))
+        droppable = Subscription(record.callback, policy="drop_oldest")
+        blocking = Subscription(record.callback, policy="block")
+
+        try:
+            # العامل مشغول بالمهمة الأولى، والطابور يتسع لمهمتين
+            assert bus.submit(gate, "evt", {})
+            with bus._cond:
+                bus._cond.wait_for(lambda: not bus._queue, 5)
+            assert bus.submit(droppable, "evt", {"n": 1})
+            assert bus.submit(record, "evt", {"n": 2})
+
+            assert not bus.submit(record, "evt", {"n": 3})
+            assert not bus.submit(blocking, "evt", {"n": 4})
+            # يُسقط أقدم مهمة قابلة للإسقاط فقط، لا مهمة مستمع reject
+            assert bus.submit(droppable, "evt", {"n": 5})
+
+            # block من داخل حلقة asyncio يرفض فوراً بدلاً من إيقاف الحلقة
+            bus.block_timeout = 5
+
+            async def submit_from_loop():
+                return bus.submit(blocking, "evt", {"n": 7})
+
+            started = time.monotonic()
+            assert asyncio.run(submit_from_loop()) is False
+            assert time.monotonic() - started < 1
+
+            release.set()
+            assert bus.drain(timeout=5)
+            assert received == [2, 5]
+            stats = bus.stats()
+            assert stats["rejected"] == 3
+            assert stats["dropped"] == 1
+        finally:
+            bus.close()
+
 
 # ==================== CRM Tests ====================
 
@@ -377,8 +1707,9 @@ class TestCRM:
 
         with patch('main_crm.LeadService') as mock_leads:
             with patch('main_crm.UserService') as mock_users:
-                mock_leads.get_all_leads.return_value = []
-                mock_leads.get_user_leads.return_value = []
+                mock_leads.get_lead_projection.return_value = {
+                    'total': 0, 'by_status': {}, 'by_source': {}
+                }
                 mock_users.get_all_users.return_value = []
                 mock_users.get_or_create.return_value = {"wallet_balance": 100}
 
@@ -392,12 +1723,15 @@ class TestCRM:
         from main_crm import CRMAnalytics
 
         with patch('main_crm.LeadService') as mock_leads:
-            mock_leads.get_all_leads.return_value = []
+            mock_leads.get_lead_aggregates.return_value = {
+                'total': 3, 'by_status': {'new': 2, 'closed': 1}, 'by_source': {}
+            }
 
             result = CRMAnalytics.get_funnel_analysis()
 
             assert "funnel" in result
             assert "total_leads" in result
+            assert result["funnel"]["new"]["count"] == 2
 
 
 # ==================== Run Tests ====================